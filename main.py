@@ -1,34 +1,83 @@
-import subprocess
+import time
+STARTUP_T0 = time.perf_counter()
 import sys
-import urllib.request
-import zipfile
-import io
-import shutil
+import importlib
+BENCHMARK_MODE = "--benchmark" in sys.argv
+STARTUP_TRACE = "--startup-trace" in sys.argv
+
+
+def startup_mark(label):
+    """--startup-trace 일 때 모듈 로드 시작부터 지금까지 걸린 시간을 찍는다."""
+    if STARTUP_TRACE:
+        print(f"[STARTUP] {(time.perf_counter() - STARTUP_T0) * 1000:8.1f}ms  {label}")
+
 
-def install_if_missing(package):
+def import_or_install(module, package=None):
+    """module 을 import 해서 돌려준다. import 가 실패할 때만 pip 로 설치하고 다시 불러온다."""
     try:
-        __import__(package)
+        return importlib.import_module(module)
     except ImportError:
+        import subprocess
+        package = package or module
         print(f"[설치] '{package}' 패키지가 없어 설치합니다...")
         subprocess.check_call([sys.executable, "-m", "pip", "install", package])
         print(f"[설치 완료] {package}")
+        importlib.invalidate_caches()
+        return importlib.import_module(module)
 
-install_if_missing("pygame")
-install_if_missing("numpy")
-install_if_missing("sounddevice")
-install_if_missing("soundfile")
-install_if_missing("pytmx")
 
-import pygame
+pygame = import_or_install("pygame")
+np = import_or_install("numpy")
+pytmx = import_or_install("pytmx")
 import math
 import random
 import os
 import platform
-from pytmx.util_pygame import load_pygame
-import sounddevice as sd
-import soundfile as sf
-import numpy as np
-import time
+from pytmx.util_pygame import load_pygame, handle_transformation
+import json
+import gzip
+import hashlib
+import re
+import threading
+import queue
+import atexit
+import concurrent.futures
+from collections import OrderedDict, deque
+
+# sounddevice(PortAudio)/soundfile 은 녹음 팝업이나 저장된 소리를 처음 쓸 때 불러온다
+sd = None
+sf = None
+_AUDIO_IMPORT_LOCK = threading.Lock()
+
+
+def load_sounddevice():
+    global sd
+    with _AUDIO_IMPORT_LOCK:
+        if sd is None:
+            sd = import_or_install("sounddevice")
+    return sd
+
+
+def load_soundfile():
+    global sf
+    with _AUDIO_IMPORT_LOCK:
+        if sf is None:
+            sf = import_or_install("soundfile")
+    return sf
+
+
+def preload_audio_libs():
+    """녹음 버튼을 누르기 전에 백그라운드에서 미리 불러둔다. 실패하면 녹음 시작할 때 다시 알려준다."""
+    def load():
+        try:
+            load_soundfile()
+            load_sounddevice()
+        except Exception:
+            pass
+    threading.Thread(target=load, name="audio-import", daemon=True).start()
+
+
+startup_mark("import 완료")
 
 
 MAP_SCALE = 2
@@ -36,9 +85,54 @@ PLAYER_SCALE = 2
 BASE_PLAYER_SIZE = 40
 DUMMY_SCALE = 1.2
 PLAYER_SIZE = BASE_PLAYER_SIZE * PLAYER_SCALE
+MAP_CHUNK_TILES = 16
+MAP_CHUNK_CACHE_SIZE = 64
+TILESET_LAZY_LOAD = True
+MAP_CACHE_ENABLED = True
+MAP_CACHE_VERSION = 1
+# "objects": 적마다 update(), "arrays": EnemyArrays 로 한 번에 계산 (--enemy-backend 로 바꿀 수 있다)
+ENEMY_BACKENDS = ("objects", "arrays")
+ENEMY_BACKEND = "objects"
+TEXT_CACHE_BUDGET = 4 * 1024 * 1024
+# 이펙트 모양 변형 수. 메테오/빙산 시트가 변형 하나에 약 27MB 라 기본은 하나만
+EFFECT_VARIANTS = 1
+EFFECT_CACHE_BUDGET = 128 * 1024 * 1024
+# 범위 마법 반지름. Player.cast_spell 과 마법을 배울 때 굽는 이펙트가 같이 쓴다
+SPELL_AREA_RADIUS = {"meteor": 140, "thunder": 200, "iceberg": 130}
+# 게임 로직은 SIM_HZ 고정 스텝으로만 돌고, 화면은 RENDER_FPS 까지 (0 이면 제한 없음)
+SIM_HZ = 60
+RENDER_FPS = 60
+MAX_CATCHUP_STEPS = 5
+MAX_FRAME_MS = 250
+# 녹음 후처리: 무음 자르기 기준(가장 큰 구간 대비 dB), 목표 음량, 피크 상한, 페이드 길이
+RECORD_TRIM_DB = -30.0
+RECORD_TARGET_RMS_DB = -18.0
+RECORD_PEAK_DB = -1.0
+RECORD_MAX_GAIN_DB = 24.0
+RECORD_FADE_MS = 10
+# 그룹별로 예약할 mixer 채널 수, 같은 소리 동시 재생 상한
+SOUND_GROUPS = {"ui": 2, "spell": 8, "world": 6}
+SOUND_VOICE_LIMIT = 3
+SPELL_SOUND_FORMAT = "FLAC"  # "FLAC" 또는 "OGG"
+SPELL_SOUND_LOAD_WORKERS = 4
+# 스플래시 동안 PNG 디코딩/스케일, TMX 파싱을 돌릴 스레드 수
+ASSET_LOAD_WORKERS = 4
+# F3 프로파일러 오버레이: 최근 몇 프레임을 보여줄지, 숫자는 몇 프레임마다 갱신할지, 그래프 꼭대기가 몇 ms 인지
+PROFILER_HISTORY = 240
+PROFILER_TEXT_EVERY = 15
+PROFILER_GRAPH_MS = 33.3
+# 크롬 트레이스(chrome://tracing, Perfetto)로 내보낼 구간을 최근 몇 개까지 들고 있을지
+TRACE_RING_SIZE = 200000
+TRACE_PATH = "frame_trace.json"
+
+if BENCHMARK_MODE:
+    # 창/사운드 장치 없이 돌리는 벤치마크용 SDL 더미 드라이버
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
 
 pygame.init()
 pygame.mixer.init(frequency=44100, channels=2)
+startup_mark("pygame 초기화")
 VOLUME = 0.5
 pygame.mixer.music.set_volume(VOLUME)
 SPELL_SOUND_DIR = "spell_sounds"
@@ -53,6 +147,12 @@ def ensure_repo_assets():
     if all(os.path.exists(p) for p in required_paths):
         return
 
+    # 자산이 없을 때만 필요한 모듈이라 여기서 불러온다
+    import urllib.request
+    import zipfile
+    import io
+    import shutil
+
     zip_url = "https://github.com/B1NYL/python/archive/refs/heads/main.zip"
     try:
         print("[INFO] 게임 자산 다운로드 중... 길면 약 1~2분 소요될 수 있습니다. 파일이 좀 많이 커요ㅠ")
@@ -76,12 +176,12 @@ def ensure_repo_assets():
     except Exception as e:
         print(f"[WARN] 자산 다운로드 실패: {e}")
 
-ensure_repo_assets()
 
 WIDTH, HEIGHT = 1600, 1200
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("Voice RPG")
 clock = pygame.time.Clock()
+startup_mark("창 생성")
 
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
@@ -99,27 +199,103 @@ ORANGE = (255, 165, 0)
 CYAN = (0, 255, 255)
 BROWN = (139, 69, 19)
 
-BOOK_IMAGE = None
-if os.path.exists("img/book.png"):
-    try:
-        img = pygame.image.load("img/book.png").convert_alpha()
-        BOOK_IMAGE = pygame.transform.scale(img, (36, 36))
-    except Exception as e:
-        print(f"book 버그 {e}")
-else:
-    print("그런 파일 업슨")
+def decode_image(path, size=None):
+    """PNG 를 읽어서 size 로 스케일만 한다 (convert 안 함). 워커 스레드에서 불러도 된다."""
+    img = pygame.image.load(path)
+    if size is not None:
+        img = pygame.transform.scale(img, size)
+    return img
+
+
+class AssetManager:
+    """PNG 디코딩/스케일과 TMX 파싱을 스레드 풀에서 미리 해두는 곳.
+    창이 뜨자마자 preload_startup_assets() 로 걸어두고, 쓰는 쪽은 image()/tiled_map() 으로 받는다.
+    받을 때 메인 스레드에서 convert_alpha / 타일셋 변환으로 마무리하고, 미리 안 걸어둔 건 그 자리에서 바로 불러온다.
+    결과는 한 번 받아가면 여기서 놓는다 (캐시는 쓰는 쪽이 들고 있음)."""
+
+    def __init__(self, workers=ASSET_LOAD_WORKERS):
+        self.workers = workers
+        self.executor = None
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.submitted = 0
+
+    def _submit(self, key, fn, *args):
+        with self.lock:
+            if key in self.futures:
+                return
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="asset"
+                )
+            self.futures[key] = self.executor.submit(fn, *args)
+            self.submitted += 1
+
+    def _take(self, key):
+        with self.lock:
+            return self.futures.pop(key, None)
+
+    def prefetch_image(self, path, size=None):
+        if os.path.exists(path):
+            self._submit(("image", path, size), decode_image, path, size)
+
+    def prefetch_sheet(self, path):
+        self._submit(("sheet", os.path.abspath(path)), pygame.image.load, path)
+
+    def prefetch_map(self, tmx_path):
+        # 타일셋 변환(convert)은 메인 스레드에서만 하니까 lazy 로더로 읽는 맵만 미리 파싱할 수 있다
+        if TILESET_LAZY_LOAD and os.path.exists(tmx_path):
+            self._submit(("map", tmx_path), TiledMap, tmx_path, MAP_SCALE, MAP_CHUNK_TILES,
+                         MAP_CHUNK_CACHE_SIZE, True, MAP_CACHE_ENABLED, deferred_tileset_loader)
+
+    def image(self, path, size=None):
+        """path 를 size 로 스케일해서 convert_alpha 한 Surface. 못 읽으면 pygame.image.load 와 같은 예외."""
+        future = self._take(("image", path, size))
+        img = future.result() if future is not None else decode_image(path, size)
+        return img.convert_alpha()
+
+    def sheet(self, path):
+        """타일셋 PNG 를 디코딩만 한 Surface (convert 는 cached_tileset_loader 가)."""
+        future = self._take(("sheet", os.path.abspath(path)))
+        return future.result() if future is not None else pygame.image.load(path)
+
+    def tiled_map(self, tmx_path):
+        future = self._take(("map", tmx_path))
+        tiled = future.result() if future is not None else TiledMap(tmx_path)
+        tiled.resolve_images()
+        return tiled
+
+    def progress(self):
+        """(끝난 작업 수, 건 작업 수). 스플래시 진행 바용."""
+        with self.lock:
+            running = sum(1 for future in self.futures.values() if not future.done())
+            return self.submitted - running, self.submitted
+
 
+ASSETS = AssetManager()
 
+
+BOOK_IMAGE = None
 STAFF_IMAGE = None
-if os.path.exists("img/stick.png"):
-    try:
-        img = pygame.image.load("img/stick.png").convert_alpha()
-        STAFF_IMAGE = pygame.transform.scale(img, (52, 52))
-    except Exception as e:
-         print(f"stick 버그 {e}")
 
-else:
-    print('그런 파일 업슨')
+
+def load_item_images():
+    global BOOK_IMAGE, STAFF_IMAGE
+    if os.path.exists("img/book.png"):
+        try:
+            BOOK_IMAGE = ASSETS.image("img/book.png", (36, 36))
+        except Exception as e:
+            print(f"book 버그 {e}")
+    else:
+        print("그런 파일 업슨")
+
+    if os.path.exists("img/stick.png"):
+        try:
+            STAFF_IMAGE = ASSETS.image("img/stick.png", (52, 52))
+        except Exception as e:
+             print(f"stick 버그 {e}")
+    else:
+        print('그런 파일 업슨')
 
 SLIME_STAND_FRAMES = []
 SLIME_STAND_DELAYS = [200, 300, 250]
@@ -127,31 +303,60 @@ SLIME_DIE_FRAMES = []
 SLIME_DIE_DELAYS = [70] * 13
 
 
+def slime_frame_paths():
+    stand = [f"img/slime_stand_{i}.png" for i in range(1, 4)]
+    die = [f"img/slime_die_{i}.png" for i in range(1, 14)]
+    return stand, die
+
+
+def slime_frame_size():
+    base_size = int(30 * PLAYER_SCALE)
+    return int(base_size * 1.3), base_size
+
+
 def load_slime_frames():
     global SLIME_STAND_FRAMES, SLIME_DIE_FRAMES
-    SLIME_STAND_FRAMES = []
-    SLIME_DIE_FRAMES = []
-    base_size = int(30 * PLAYER_SCALE)
-    for i in range(1, 4):
-        path = f"img/slime_stand_{i}.png"
-        if os.path.exists(path):
-            img = pygame.image.load(path).convert_alpha()
-            width = int(base_size * 1.3)
-            height = base_size
-            img = pygame.transform.scale(img, (width, height))
-            SLIME_STAND_FRAMES.append(img)
-
-    for i in range(1, 14):
-        path = f"img/slime_die_{i}.png"
-        if os.path.exists(path):
-            img = pygame.image.load(path).convert_alpha()
-            width = int(base_size * 1.3)
-            height = base_size
-            img = pygame.transform.scale(img, (width, height))
-            SLIME_DIE_FRAMES.append(img)
+    stand_paths, die_paths = slime_frame_paths()
+    size = slime_frame_size()
+    SLIME_STAND_FRAMES = [ASSETS.image(path, size) for path in stand_paths if os.path.exists(path)]
+    SLIME_DIE_FRAMES = [ASSETS.image(path, size) for path in die_paths if os.path.exists(path)]
+
+
+def startup_asset_tasks():
+    """시작할 때 필요한 이미지들 (예전엔 import 때 불렀다). 스플래시가 한 프레임에 하나씩 처리하고,
+    스플래시를 안 거치는 벤치마크/리플레이는 main() 에서 한 번에 부른다. 이미 불렀으면 빈 목록."""
+    tasks = []
+    if not SLIME_STAND_FRAMES and not SLIME_DIE_FRAMES:
+        tasks.append(load_slime_frames)
+    if BOOK_IMAGE is None and STAFF_IMAGE is None:
+        tasks.append(load_item_images)
+    return tasks
+
+
+def preload_startup_assets(with_menu=True):
+    """창이 뜨자마자 부른다. 스플래시/메뉴/게임 시작에 쓸 PNG 와 TMX 를 전부 스레드 풀에 걸어둔다.
+    크기는 실제로 불러오는 곳과 같아야 미리 해둔 게 쓰인다."""
+    if with_menu:
+        # 스플래시 그림이 제일 먼저 필요하다
+        ASSETS.prefetch_image(os.path.join("img", "start.png"), (WIDTH, HEIGHT))
+    for tmx_path in ("house.tmx", "map.tmx"):
+        ASSETS.prefetch_map(tmx_path)
+    if with_menu:
+        ASSETS.prefetch_image(os.path.join("img", "background.png"), (WIDTH, HEIGHT))
+        ASSETS.prefetch_image("img/woman_down_2.png", (200, 260))
+        ASSETS.prefetch_image("img/man_down_2.png", (200, 260))
+    stand_paths, die_paths = slime_frame_paths()
+    for path in stand_paths + die_paths:
+        ASSETS.prefetch_image(path, slime_frame_size())
+    ASSETS.prefetch_image("img/book.png", (36, 36))
+    ASSETS.prefetch_image("img/stick.png", (52, 52))
+    for gender in ("male", "female"):
+        for path in set(character_image_paths(gender)):
+            ASSETS.prefetch_image(path, (PLAYER_SIZE, PLAYER_SIZE))
+
 
 #GPT
-def get_korean_font(size):
+def _find_korean_font_source():
     system = platform.system()
     local_candidates = [
         "fonts/NotoSansKR-Regular.otf",
@@ -166,7 +371,8 @@ def get_korean_font(size):
     for p in local_candidates:
         if os.path.exists(p):
             try:
-                return pygame.font.Font(p, size)
+                pygame.font.Font(p, 16)
+                return ("file", p)
             except:
                 pass
     font_paths = []
@@ -192,30 +398,106 @@ def get_korean_font(size):
     for font_path in font_paths:
         if os.path.exists(font_path):
             try:
-                return pygame.font.Font(font_path, size)
+                pygame.font.Font(font_path, 16)
+                return ("file", font_path)
             except:
                 pass
     for font_name in font_names:
         try:
-            font = pygame.font.SysFont(font_name, size)
+            font = pygame.font.SysFont(font_name, 16)
             font.render("한글", True, WHITE)
-            return font
+            return ("sysfont", font_name)
         except:
             pass
     print("경고: 한글 폰트를 찾을 수 없습니다. 기본 폰트를 사용합니다.")
-    return pygame.font.Font(None, size)
+    return ("default", None)
+
+
+_KOREAN_FONT_SOURCE = None
+_FONT_REGISTRY = {}
+
+
+def get_korean_font(size):
+    """크기별로 한 번만 만든 폰트를 돌려준다. 한글 폰트 위치도 처음 한 번만 찾는다."""
+    global _KOREAN_FONT_SOURCE
+    font = _FONT_REGISTRY.get(size)
+    if font is not None:
+        return font
+    if _KOREAN_FONT_SOURCE is None:
+        _KOREAN_FONT_SOURCE = _find_korean_font_source()
+    kind, name = _KOREAN_FONT_SOURCE
+    if kind == "file":
+        font = pygame.font.Font(name, size)
+    elif kind == "sysfont":
+        font = pygame.font.SysFont(name, size)
+    else:
+        font = pygame.font.Font(None, size)
+    _FONT_REGISTRY[size] = font
+    return font
+
+
+class TextSurfaceCache:
+    """(text, size, color, antialias) 로 렌더된 글자 Surface 를 재사용하는 LRU.
+    픽셀 바이트 합이 budget_bytes 를 넘으면 오래 안 쓴 것부터 버린다."""
+    def __init__(self, budget_bytes=TEXT_CACHE_BUDGET):
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text, size, color, antialias=True):
+        key = (text, size, tuple(color), antialias)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        PROFILER.count("surfaces")
+        surf = get_korean_font(size).render(text, antialias, color)
+        cost = surf.get_width() * surf.get_height() * surf.get_bytesize()
+        if cost > self.budget_bytes:
+            return surf
+        while self.entries and self.used_bytes + cost > self.budget_bytes:
+            _, (_, old_cost) = self.entries.popitem(last=False)
+            self.used_bytes -= old_cost
+        self.entries[key] = (surf, cost)
+        self.used_bytes += cost
+        return surf
+
+    def clear(self):
+        self.entries.clear()
+        self.used_bytes = 0
+
+
+_TEXT_CACHE = TextSurfaceCache()
+
+
+def render_text(text, size, color, antialias=True):
+    """get_korean_font(size).render(text, antialias, color) 와 같지만 같은 글자는 한 번만 렌더한다.
+    돌려받은 Surface 는 공유되므로 set_alpha 등으로 고치지 말 것."""
+    return _TEXT_CACHE.get(text, size, color, antialias)
+
+
+def character_image_paths(gender):
+    prefix = 'man' if gender == 'male' else 'woman'
+    return [f"img/{prefix}_{direction}_{i}.png" for direction in ['right', 'left', 'up', 'down'] for i in [1, 2, 3, 2]]
 
 
 def load_character_images(gender, size=PLAYER_SIZE):
     images = {'right': [], 'left': [], 'up': [], 'down': []}
     directions = ['right', 'left', 'up', 'down']
     prefix = 'man' if gender == 'male' else 'woman'
+    loaded = {}
     for direction in directions:
         for i in [1, 2, 3, 2]:
             filename = f"img/{prefix}_{direction}_{i}.png"
             if os.path.exists(filename):
-                img = pygame.image.load(filename).convert_alpha()
-                images[direction].append(pygame.transform.scale(img, (size, size)))
+                # 2번 프레임은 두 번 나오니까 한 번만 불러서 같이 쓴다
+                if filename not in loaded:
+                    loaded[filename] = ASSETS.image(filename, (size, size))
+                images[direction].append(loaded[filename])
             else:
                 img = pygame.Surface((size, size), pygame.SRCALPHA)
                 color = BLUE if gender == 'male' else (255, 105, 180)
@@ -243,23 +525,628 @@ class Camera:
         return int(x - self.x + self.offset_x), int(y - self.y + self.offset_y)
 
 
+SIM_TIME_MS = 0.0
+# 녹화/리플레이/벤치마크 중에는 실시간 입력을 기다리는 녹음 팝업을 띄우지 않는다
+SCRIPTED_INPUT = False
+
+
+def sim_ticks():
+    """시뮬레이션 시계(ms). 고정 스텝마다 1000/SIM_HZ 씩만 가서 벽시계와 무관하다 (리플레이해도 같음)."""
+    return int(SIM_TIME_MS)
+
+
+class SimInterpolator:
+    """마지막 두 시뮬레이션 상태 사이를 보간해서 그리기 위한 좌표 스냅샷.
+    capture() 는 스텝 직전에, apply(alpha) 는 그리기 직전에, restore() 는 그린 뒤에 부른다."""
+
+    def __init__(self):
+        self.prev = {}
+        self.saved = {}
+
+    def capture(self, objects):
+        self.prev = {id(obj): (obj, obj.x, obj.y) for obj in objects}
+
+    def reset(self):
+        # 맵 이동/순간이동처럼 이어지지 않는 움직임은 보간하지 않는다
+        self.prev = {}
+
+    def apply(self, alpha, objects):
+        self.saved = {}
+        if alpha >= 1.0:
+            return
+        prev = self.prev
+        for obj in objects:
+            entry = prev.get(id(obj))
+            if entry is None or entry[0] is not obj:
+                continue
+            x, y = obj.x, obj.y
+            px, py = entry[1], entry[2]
+            if px == x and py == y:
+                continue
+            self.saved[id(obj)] = (obj, x, y)
+            # 직전 상태 -> 현재 상태 사이, 남은 누적 시간 비율(alpha)만큼 간 위치
+            obj.x = px + (x - px) * alpha
+            obj.y = py + (y - py) * alpha
+
+    def restore(self):
+        for obj, x, y in self.saved.values():
+            obj.x, obj.y = x, y
+        self.saved = {}
+
+    def sim_pos(self, obj):
+        """apply() 와 restore() 사이에서도 보간 전 시뮬레이션 좌표를 돌려준다."""
+        entry = self.saved.get(id(obj))
+        if entry is not None:
+            return entry[1], entry[2]
+        return obj.x, obj.y
+
+
+# (이름, 오버레이에 쓸 이름, 그래프 색). main() 루프가 이 순서대로 지나간다
+PROFILER_PHASES = (
+    ("events", "입력", (160, 160, 160)),
+    ("player", "플레이어/포탈", (90, 170, 255)),
+    ("enemies", "적 업데이트", (80, 200, 120)),
+    ("collisions", "주문 충돌", (255, 200, 60)),
+    ("effects", "이펙트 업데이트", (255, 130, 60)),
+    ("map", "맵 그리기", (70, 110, 200)),
+    ("area_draw", "AreaEffect 그리기", (230, 80, 80)),
+    ("sprites", "캐릭터/파티클", (180, 120, 255)),
+    ("hud", "HUD", (60, 220, 220)),
+    ("menus", "메뉴", (230, 120, 200)),
+    ("flip", "화면 전송", (120, 120, 120)),
+)
+PROFILER_OTHER_COLOR = (70, 70, 70)
+# 트레이스에만 나오는 트랙: 프레임 전체, 오디오 콜백 스레드의 녹음 처리
+TRACE_EXTRA_TRACKS = (("frame", "프레임"), ("audio", "오디오 캡처"))
+
+
+class _NullSection:
+    """프로파일러가 꺼져 있을 때 section() 이 돌려주는 빈 타이머."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SECTION = _NullSection()
+
+
+class _ProfileSection:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        profiler = self.profiler
+        profiler.current[self.name] += end - self.start
+        if profiler.trace is not None:
+            profiler.trace.append((self.name, self.start, end - self.start))
+        return False
+
+
+class FrameProfiler:
+    """main() 루프 단계별 시간과 카운터(blits, Surface 생성, 개체 수)를 모으는 프로파일러.
+    오버레이(F3)나 트레이스(F4, --trace)가 켜져 있을 때만 잰다. 꺼져 있으면 section() 은
+    빈 타이머를, count() 는 바로 돌아가서 거의 공짜다.
+    한 프레임에 같은 단계를 여러 번 지나가면(시뮬레이션 스텝 여러 번) 시간은 합쳐진다.
+    트레이스가 켜져 있으면 구간 하나하나를 trace 링에도 넣어두고, export_trace() 로 내보낸다."""
+
+    def __init__(self, phases=PROFILER_PHASES, history=PROFILER_HISTORY):
+        self.enabled = False
+        self.overlay = False
+        self.trace = None
+        self.trace_path = TRACE_PATH
+        self.trace_origin = 0.0
+        self.trace_exports = 0
+        self.phases = phases
+        self.names = [name for name, _, _ in phases]
+        self.current = dict.fromkeys(self.names, 0.0)
+        self.sections = {name: _ProfileSection(self, name) for name in self.names}
+        self.counters = {}
+        self.history = deque(maxlen=history)
+        self.frame_start = None
+        self.frames = 0
+        self.graph = None
+        self.panel = None
+
+    def _update_enabled(self):
+        enabled = self.overlay or self.trace is not None
+        if enabled != self.enabled:
+            self.enabled = enabled
+            self.reset()
+
+    def set_overlay(self, overlay):
+        self.overlay = overlay
+        if overlay:
+            # 통계는 켠 시점부터 새로
+            self.reset()
+        self._update_enabled()
+
+    def toggle(self):
+        self.set_overlay(not self.overlay)
+        return self.overlay
+
+    def start_trace(self, path=None):
+        if path:
+            self.trace_path = path
+        if self.trace is None:
+            self.trace = deque(maxlen=TRACE_RING_SIZE)
+            self.trace_origin = time.perf_counter()
+            print(f"[INFO] 프레임 트레이스 기록 시작 (F4: {self.trace_path} 로 저장)")
+        self._update_enabled()
+
+    def span(self, name, start, end):
+        """section() 밖에서 잰 구간(예: 오디오 콜백)을 트레이스에 넣는다. 다른 스레드에서 불러도 된다."""
+        trace = self.trace
+        if trace is not None:
+            trace.append((name, start, end - start))
+
+    def next_trace_path(self):
+        """첫 저장은 trace_path 그대로, 그다음부터는 frame_trace_2.json 처럼 번호를 붙인다.
+        저장할 때마다 링을 비우니까 같은 파일에 덮어쓰면 앞에 저장한 구간이 날아간다."""
+        self.trace_exports += 1
+        if self.trace_exports == 1:
+            return self.trace_path
+        root, ext = os.path.splitext(self.trace_path)
+        return f"{root}_{self.trace_exports}{ext or '.json'}"
+
+    def export_trace(self, path=None):
+        """지난 저장 뒤로 모인 구간을 크롬 트레이스 JSON 으로 저장한다. 링은 새 것으로 바꿔치기만 하고
+        JSON 만들기/쓰기는 TRACE_WRITER 스레드가 하니까 게임 루프는 안 멈춘다.
+        지난 저장 뒤로 모인 게 없으면(종료 때 atexit 로 불린 경우 등) 아무것도 안 쓴다."""
+        if not self.trace:
+            return False
+        path = path or self.next_trace_path()
+        spans, self.trace = self.trace, deque(maxlen=TRACE_RING_SIZE)
+        tracks = [(name, label) for name, label, _ in self.phases] + list(TRACE_EXTRA_TRACKS)
+        origin = self.trace_origin
+        print(f"[INFO] 트레이스 구간 {len(spans)}개 저장 중 -> {path}")
+        TRACE_WRITER.submit_job(
+            path,
+            lambda tmp_path: write_chrome_trace(tmp_path, spans, tracks, origin),
+            on_done=lambda: print(f"[INFO] 트레이스 저장 완료: {path}"),
+        )
+        return True
+
+    def reset(self):
+        for name in self.names:
+            self.current[name] = 0.0
+        self.counters.clear()
+        self.history.clear()
+        self.frame_start = None
+        self.frames = 0
+        self.graph = None
+        self.panel = None
+
+    def section(self, name):
+        if not self.enabled:
+            return _NULL_SECTION
+        return self.sections[name]
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        if self.enabled:
+            self.counters[name] = value
+
+    def begin_frame(self):
+        if self.enabled:
+            self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        if not self.enabled or self.frame_start is None:
+            return
+        end = time.perf_counter()
+        total = (end - self.frame_start) * 1000.0
+        self.span("frame", self.frame_start, end)
+        phase_ms = tuple(self.current[name] * 1000.0 for name in self.names)
+        self.history.append((total, phase_ms, dict(self.counters)))
+        for name in self.names:
+            self.current[name] = 0.0
+        self.counters.clear()
+        self.frames += 1
+        self._push_graph_column(total, phase_ms)
+
+    def stats(self):
+        """단계별 (이름, 평균 ms, p99 ms) 와 프레임 전체 (평균, p99), 카운터별 (평균, 최대)."""
+        n = len(self.history)
+        if n == 0:
+            return [], (0.0, 0.0), {}
+
+        def summarize(values):
+            values = sorted(values)
+            return sum(values) / n, values[min(n - 1, int(n * 0.99))]
+
+        phases = []
+        for i, (name, label, color) in enumerate(self.phases):
+            avg, p99 = summarize(entry[1][i] for entry in self.history)
+            phases.append((label, color, avg, p99))
+        frame = summarize(entry[0] for entry in self.history)
+        counters = {}
+        for _, _, frame_counters in self.history:
+            for key, value in frame_counters.items():
+                total, peak = counters.get(key, (0, 0))
+                counters[key] = (total + value, max(peak, value))
+        counters = {key: (total / n, peak) for key, (total, peak) in counters.items()}
+        return phases, frame, counters
+
+    def _push_graph_column(self, total, phase_ms):
+        # 그래프는 한 칸씩 왼쪽으로 밀고 새 프레임 세로줄만 그린다
+        width, height = self.history.maxlen, 90
+        if self.graph is None:
+            self.graph = pygame.Surface((width, height))
+            self.graph.fill(BLACK)
+        graph = self.graph
+        graph.scroll(-1, 0)
+        x = width - 1
+        graph.fill(BLACK, (x, 0, 1, height))
+        scale = height / PROFILER_GRAPH_MS
+        y = float(height)
+        for (_, _, color), ms in zip(self.phases, phase_ms):
+            top = y - ms * scale
+            if int(top) < int(y):
+                graph.fill(color, (x, max(0, int(top)), 1, int(y) - max(0, int(top))))
+            y = top
+            if y <= 0:
+                break
+        other = total - sum(phase_ms)
+        if y > 0 and other > 0:
+            top = max(0.0, y - other * scale)
+            graph.fill(PROFILER_OTHER_COLOR, (x, int(top), 1, int(y) - int(top)))
+        graph.set_at((x, int(height - 1000.0 / RENDER_FPS * scale)), WHITE)
+
+    def _build_panel(self):
+        phases, (frame_avg, frame_p99), counters = self.stats()
+        font = get_korean_font(14)
+        line_h = 17
+        width = self.history.maxlen + 20
+        lines = 3 + len(phases) + len(counters)
+        panel = pygame.Surface((width, lines * line_h + 110))
+        panel.fill((20, 20, 30))
+        pygame.draw.rect(panel, GRAY, panel.get_rect(), 1)
+        y = 6
+        panel.blit(font.render(f"프로파일러 (F3)  {len(self.history)}프레임", True, WHITE), (10, y))
+        y += line_h
+        panel.blit(font.render(f"프레임 평균 {frame_avg:.2f}ms  p99 {frame_p99:.2f}ms", True, YELLOW), (10, y))
+        y += line_h
+        panel.blit(font.render("단계            평균     p99", True, LIGHT_GRAY), (10, y))
+        y += line_h
+        for label, color, avg, p99 in phases:
+            panel.fill(color, (10, y + 4, 8, 8))
+            panel.blit(font.render(label, True, WHITE), (24, y))
+            panel.blit(font.render(f"{avg:6.2f}  {p99:6.2f}", True, WHITE), (width - 110, y))
+            y += line_h
+        for key in sorted(counters):
+            avg, peak = counters[key]
+            panel.blit(font.render(f"{key}: 평균 {avg:.0f}  최대 {peak}", True, CYAN), (10, y))
+            y += line_h
+        self.graph_pos = (10, y + 8)
+        self.panel = panel
+
+    def draw(self, surface):
+        if not self.overlay or not self.history:
+            return
+        if self.panel is None or self.frames % PROFILER_TEXT_EVERY == 0:
+            self._build_panel()
+        # 오른쪽 위는 퀘스트 창 자리라 오른쪽 아래에 붙인다
+        x = surface.get_width() - self.panel.get_width() - 10
+        y = surface.get_height() - self.panel.get_height() - 10
+        surface.blit(self.panel, (x, y))
+        surface.blit(self.graph, (x + self.graph_pos[0], y + self.graph_pos[1]))
+
+
+def write_chrome_trace(path, spans, tracks, origin):
+    """(트랙 이름, 시작, 길이) 구간들을 chrome://tracing / Perfetto 가 읽는 trace event JSON 으로 쓴다.
+    트랙마다 tid 를 하나씩 줘서 서브시스템별로 줄이 따로 나온다."""
+    tids = {}
+    events = []
+    for tid, (name, label) in enumerate(tracks, start=1):
+        tids[name] = tid
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": label}})
+        events.append({"name": "thread_sort_index", "ph": "M", "pid": 1, "tid": tid, "args": {"sort_index": tid}})
+    for name, start, duration in list(spans):
+        events.append({
+            "name": name,
+            "ph": "X",
+            "pid": 1,
+            "tid": tids.get(name, 0),
+            "ts": round((start - origin) * 1e6, 1),
+            "dur": round(duration * 1e6, 1),
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+PROFILER = FrameProfiler()
+
+
+_TILESET_SHEETS = {}
+
+
+def cached_tileset_loader(filename, colorkey, **kwargs):
+    """pytmx image_loader. 타일셋 PNG 는 맵끼리 공유해서 한 번만 디코딩하고,
+    맵에서 실제로 쓰는 GID 만 subsurface 로 잘라준다(복사 없음)."""
+    key = (os.path.abspath(filename), colorkey)
+    sheet = _TILESET_SHEETS.get(key)
+    if sheet is None:
+        sheet = ASSETS.sheet(filename)
+        if colorkey:
+            sheet = sheet.convert()
+            sheet.set_colorkey(pygame.Color(f"#{colorkey}"))
+        else:
+            sheet = sheet.convert_alpha()
+        _TILESET_SHEETS[key] = sheet
+
+    def load_image(rect=None, flags=None):
+        tile = sheet.subsurface(rect) if rect else sheet
+        if flags:
+            tile = handle_transformation(tile, flags)
+        return tile
+
+    return load_image
+
+
+class _PendingTile:
+    """워커 스레드에서 맵을 파싱하는 동안 타일 Surface 자리에 넣어두는 표시. TiledMap.resolve_images() 가 바꾼다."""
+    __slots__ = ("filename", "colorkey", "rect", "flags")
+
+    def __init__(self, filename, colorkey, rect, flags):
+        self.filename = filename
+        self.colorkey = colorkey
+        self.rect = rect
+        self.flags = flags
+
+
+def deferred_tileset_loader(filename, colorkey, **kwargs):
+    """cached_tileset_loader 대신 워커 스레드에서 쓰는 image_loader.
+    convert 는 메인 스레드에서만 하니까 여기서는 타일셋 PNG 디코딩만 걸어두고 타일 자리엔 _PendingTile 을 넣는다."""
+    if (os.path.abspath(filename), colorkey) not in _TILESET_SHEETS:
+        ASSETS.prefetch_sheet(filename)
+
+    def load_image(rect=None, flags=None):
+        return _PendingTile(filename, colorkey, rect, flags)
+
+    return load_image
+
+
+def _map_cache_stamps(paths):
+    stamps = []
+    for path in paths:
+        st = os.stat(path)
+        stamps.append([os.path.normpath(path), st.st_mtime_ns, st.st_size])
+    return stamps
+
+
+def _map_cache_hash(paths):
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _map_cache_sources(tmx_path):
+    """캐시 키에 들어갈 파일들: TMX 와 거기서 참조하는 외부 타일셋(.tsx)."""
+    with open(tmx_path, "rb") as f:
+        data = f.read()
+    base = os.path.dirname(tmx_path)
+    tsx = re.findall(rb'<tileset[^>]*\ssource="([^"]+)"', data)
+    return [tmx_path] + [os.path.join(base, src.decode("utf-8")) for src in tsx]
+
+
 #GPT작성
 class TiledMap:
-    def __init__(self, tmx_path, map_scale=MAP_SCALE):
-        self.tmx, self.scale = load_pygame(tmx_path), map_scale
-        self.tile_w, self.tile_h = self.tmx.tilewidth, self.tmx.tileheight
+    def __init__(self, tmx_path, map_scale=MAP_SCALE, chunk_tiles=MAP_CHUNK_TILES, max_chunks=MAP_CHUNK_CACHE_SIZE,
+                 lazy_tiles=TILESET_LAZY_LOAD, use_cache=MAP_CACHE_ENABLED, image_loader=cached_tileset_loader):
+        load_start = time.perf_counter()
+        self.tmx_path, self.scale, self.tmx = tmx_path, map_scale, None
+        self.image_loader = image_loader
+        self.loaded_from_cache = bool(use_cache) and self._load_compiled()
+        if not self.loaded_from_cache:
+            self._load_tmx(lazy_tiles)
+            if use_cache:
+                self.compile_cache()
         self.stile_w, self.stile_h = self.tile_w * self.scale, self.tile_h * self.scale
-        self.map_w_tiles, self.map_h_tiles = self.tmx.width, self.tmx.height
         self.pixel_w, self.pixel_h = self.map_w_tiles * self.stile_w, self.map_h_tiles * self.stile_h
-        self.blocked, self._scaled_cache = set(), {}
-        for layer in self.tmx.visible_layers:
-            if hasattr(layer, "data"):
-                layer_collides = bool(getattr(layer, "properties", {}).get("collision", False))
-                for x, y, gid in layer.iter_data():
-                    if gid != 0:
-                        props = self.tmx.get_tile_properties_by_gid(gid) or {}
-                        if layer_collides or props.get("collide", False) or props.get("collision", False):
-                            self.blocked.add((x, y))
+        # 충돌 그리드의 누적합(SAT): 어떤 타일 범위든 막힌 칸 수를 4번 조회로 구함
+        self._collision_sat = np.zeros((self.map_h_tiles + 1, self.map_w_tiles + 1), dtype=np.int32)
+        self._collision_sat[1:, 1:] = np.cumsum(np.cumsum(self.collision_grid, axis=0, dtype=np.int32), axis=1)
+        self._scaled_cache = {}
+        self.load_report = self._make_load_report(tmx_path, time.perf_counter() - load_start)
+        # 레이어 분류: 이름에 foreground 가 있거나 foreground 프로퍼티가 켜진 레이어는 캐릭터 위에 그림
+        self.background_layers, self.foreground_layers = [], []
+        for gids, is_foreground in zip(self.layer_gids, self.layer_foreground):
+            (self.foreground_layers if is_foreground else self.background_layers).append(gids)
+        # 청크 캐시: (그룹, cx, cy) -> 미리 합성된 청크 Surface (빈 청크는 None), 가장 오래 안 쓴 것부터 버림
+        self.chunk_tiles = chunk_tiles
+        self.chunk_w, self.chunk_h = self.stile_w * chunk_tiles, self.stile_h * chunk_tiles
+        self.max_chunks = max_chunks
+        self._chunks = OrderedDict()
+
+    def _load_tmx(self, lazy_tiles):
+        """TMX 를 파싱해서 레이어 GID 배열, 충돌 그리드, 오브젝트 테이블을 만든다."""
+        if lazy_tiles:
+            # pytmx 는 레이어 데이터를 먼저 읽어 쓰인 GID 를 등록한 뒤 image_loader 를 부른다
+            self.tmx = pytmx.TiledMap(self.tmx_path, image_loader=self.image_loader)
+        else:
+            self.tmx = load_pygame(self.tmx_path)
+        self.tile_w, self.tile_h = self.tmx.tilewidth, self.tmx.tileheight
+        self.map_w_tiles, self.map_h_tiles = self.tmx.width, self.tmx.height
+        self.images = self.tmx.images
+        self.tiles_declared = sum(getattr(ts, "tilecount", 0) or 0 for ts in self.tmx.tilesets)
+
+        tile_layers = [layer for layer in self.tmx.visible_layers if hasattr(layer, "data")]
+        self.layer_gids = np.array(
+            [layer.data for layer in tile_layers], dtype=np.uint32
+        ).reshape(len(tile_layers), self.map_h_tiles, self.map_w_tiles)
+        self.layer_foreground = [self._is_foreground_layer(layer) for layer in tile_layers]
+
+        self.collision_grid = np.zeros((self.map_h_tiles, self.map_w_tiles), dtype=bool)
+        for layer, gids in zip(tile_layers, self.layer_gids):
+            layer_collides = bool(getattr(layer, "properties", {}).get("collision", False))
+            if layer_collides:
+                self.collision_grid |= gids != 0
+                continue
+            for gid in np.unique(gids).tolist():
+                if gid != 0:
+                    props = self.tmx.get_tile_properties_by_gid(gid) or {}
+                    if props.get("collide", False) or props.get("collision", False):
+                        self.collision_grid |= gids == gid
+
+        self.enemy_spawns = self._scan_enemy_spawns()
+        self.portal_table = [
+            {"rect": tuple(p["rect"]), "portal_type": p["portal_type"], "target_spawn": p["target_spawn"]}
+            for p in self._scan_portals()
+        ]
+        self.quest_objects = self._scan_quest_objects()
+        self.spawn_points = self._scan_spawn_points()
+
+    def _cache_dir(self):
+        return self.tmx_path + ".cache"
+
+    def _load_compiled(self):
+        """캐시가 최신(버전, 스케일, 원본 mtime 또는 해시 일치)이면 거기서 읽어온다."""
+        cache_dir = self._cache_dir()
+        try:
+            with open(os.path.join(cache_dir, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != MAP_CACHE_VERSION or meta.get("scale") != self.scale:
+                return False
+            sources = meta["sources"]
+            if _map_cache_stamps(sources) != meta["stamps"] and _map_cache_hash(sources) != meta["hash"]:
+                return False
+            self.layer_gids = np.load(os.path.join(cache_dir, "layers.npy"), mmap_mode="r")
+            self.collision_grid = np.load(os.path.join(cache_dir, "collision.npy"), mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return False
+
+        self.tile_w, self.tile_h = meta["tile_size"]
+        self.map_w_tiles, self.map_h_tiles = meta["map_size"]
+        self.layer_foreground = meta["layer_foreground"]
+        self.tiles_declared = meta["tiles_declared"]
+        self.enemy_spawns = [tuple(spawn) for spawn in meta["enemy_spawns"]]
+        self.portal_table = meta["portals"]
+        self.quest_objects = [tuple(q) for q in meta["quest_objects"]]
+        self.spawn_points = meta["spawn_points"]
+
+        loaders = [self.image_loader(ts["image"], ts["trans"]) for ts in meta["tilesets"]]
+        self.images = [None] * meta["max_gid"]
+        for gid, ts_index, local_id, fh, fv, fd in meta["tiles"]:
+            ts = meta["tilesets"][ts_index]
+            col, row = local_id % ts["columns"], local_id // ts["columns"]
+            rect = (
+                ts["margin"] + col * (ts["tilewidth"] + ts["spacing"]),
+                ts["margin"] + row * (ts["tileheight"] + ts["spacing"]),
+                ts["tilewidth"],
+                ts["tileheight"],
+            )
+            flags = pytmx.TileFlags(fh, fv, fd) if (fh or fv or fd) else None
+            self.images[gid] = loaders[ts_index](rect, flags)
+        return True
+
+    def compile_cache(self):
+        """맵 옆에 <tmx>.cache/ 로 레이어 GID, 충돌 그리드(npy)와 스폰/포탈/퀘스트 테이블(json)을 써둔다."""
+        if self.tmx is None:
+            return False
+        tilesets, tiles = [], []
+        for ts in self.tmx.tilesets:
+            if ts.source is None:
+                return False  # 이미지 컬렉션 타일셋은 잘라서 복원할 수 없음
+            tilesets.append({
+                "image": os.path.join(os.path.dirname(self.tmx_path), ts.source),
+                "trans": getattr(ts, "trans", None),
+                "firstgid": ts.firstgid,
+                "tilewidth": ts.tilewidth,
+                "tileheight": ts.tileheight,
+                "margin": ts.margin,
+                "spacing": ts.spacing,
+                "columns": len(range(ts.margin, ts.width + ts.margin - ts.tilewidth + 1, ts.tilewidth + ts.spacing)),
+            })
+        for gid, image in enumerate(self.images):
+            if not image:
+                continue
+            tiled_gid = self.tmx.tiledgidmap[gid]
+            ts_index = max(i for i, ts in enumerate(tilesets) if ts["firstgid"] <= tiled_gid)
+            flags = next(f for g, f in self.tmx.gidmap[tiled_gid] if g == gid)
+            tiles.append([gid, ts_index, tiled_gid - tilesets[ts_index]["firstgid"],
+                          bool(flags.flipped_horizontally), bool(flags.flipped_vertically),
+                          bool(flags.flipped_diagonally)])
+
+        cache_dir = self._cache_dir()
+        meta_path = os.path.join(cache_dir, "meta.json")
+        try:
+            sources = _map_cache_sources(self.tmx_path)
+            os.makedirs(cache_dir, exist_ok=True)
+            if os.path.exists(meta_path):
+                os.remove(meta_path)  # 쓰는 도중 죽어도 반쯤 쓴 캐시를 읽지 않도록 meta 는 마지막에
+            np.save(os.path.join(cache_dir, "layers.npy"), self.layer_gids)
+            np.save(os.path.join(cache_dir, "collision.npy"), self.collision_grid)
+            meta = {
+                "version": MAP_CACHE_VERSION,
+                "scale": self.scale,
+                "sources": sources,
+                "stamps": _map_cache_stamps(sources),
+                "hash": _map_cache_hash(sources),
+                "tile_size": [self.tile_w, self.tile_h],
+                "map_size": [self.map_w_tiles, self.map_h_tiles],
+                "layer_foreground": self.layer_foreground,
+                "tiles_declared": self.tiles_declared,
+                "max_gid": len(self.images),
+                "tilesets": tilesets,
+                "tiles": tiles,
+                "enemy_spawns": self.enemy_spawns,
+                "portals": self.portal_table,
+                "quest_objects": self.quest_objects,
+                "spawn_points": self.spawn_points,
+            }
+            tmp_path = meta_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp_path, meta_path)
+        except OSError as e:
+            print(f"[WARN] 맵 캐시 저장 실패: {e}")
+            return False
+        return True
+
+    def _make_load_report(self, tmx_path, elapsed):
+        """로드 시간과, 타일셋 전체를 잘라 스케일했을 때 대비 아낀 Surface 바이트 수."""
+        loaded = sum(1 for image in self.images if image)
+        declared = self.tiles_declared
+        skipped = max(0, declared - loaded)
+        report = {
+            "from_cache": self.loaded_from_cache,
+            "load_ms": elapsed * 1000,
+            "tiles_loaded": loaded,
+            "tiles_declared": declared,
+            "bytes_saved": skipped * self.stile_w * self.stile_h * 4,
+        }
+        print(
+            f"[INFO] {tmx_path} 로드{'(캐시)' if self.loaded_from_cache else ''} {report['load_ms']:.0f}ms, 타일 {loaded}/{declared}개만 사용 "
+            f"(약 {report['bytes_saved'] / (1024 * 1024):.1f}MB 절약)"
+        )
+        return report
+
+    @staticmethod
+    def _is_foreground_layer(layer):
+        props = getattr(layer, "properties", {}) or {}
+        if "foreground" in (getattr(layer, "name", "") or "").lower():
+            return True
+        if str(props.get("foreground", "")).strip().lower() in ("true", "1", "yes"):
+            return True
+        return str(props.get("layer_group", "")).strip().lower() == "foreground"
 
     def _get_scaled(self, image):
         if self.scale == 1:
@@ -283,52 +1170,131 @@ class TiledMap:
         else:
             camera.y = max(0, min(int(camera.y), self.pixel_h - HEIGHT))
 
-    def draw(self, surface, camera):
-        start_tx = max(0, int(camera.x // self.stile_w))
-        start_ty = max(0, int(camera.y // self.stile_h))
-        end_tx = min(self.map_w_tiles, int((camera.x + WIDTH) // self.stile_w) + 1)
-        end_ty = min(self.map_h_tiles, int((camera.y + HEIGHT) // self.stile_h) + 1)
-        for layer in self.tmx.visible_layers:
-            if hasattr(layer, "tiles"):
-                for x, y, image in layer.tiles():
-                    if start_tx <= x < end_tx and start_ty <= y < end_ty and image:
-                        screen_x, screen_y = camera.apply_pos(
-                            x * self.stile_w, y * self.stile_h
-                        )
-                        surface.blit(self._get_scaled(image), (screen_x, screen_y))
+    def _build_chunk(self, group, cx, cy):
+        """청크 하나에 해당 그룹의 레이어를 전부 한 장으로 구워둔다. 그릴 타일이 없으면 None."""
+        layers = self.foreground_layers if group == "foreground" else self.background_layers
+        chunk = None
+        start_tx, start_ty = cx * self.chunk_tiles, cy * self.chunk_tiles
+        end_tx = min(self.map_w_tiles, start_tx + self.chunk_tiles)
+        end_ty = min(self.map_h_tiles, start_ty + self.chunk_tiles)
+        images = self.images
+        for gids in layers:
+            block = gids[start_ty:end_ty, start_tx:end_tx]
+            for ty, tx in zip(*np.nonzero(block)):
+                image = images[block[ty, tx]]
+                if image:
+                    if chunk is None:
+                        chunk = pygame.Surface((self.chunk_w, self.chunk_h), pygame.SRCALPHA)
+                        PROFILER.count("surfaces")
+                    chunk.blit(self._get_scaled(image), (int(tx) * self.stile_w, int(ty) * self.stile_h))
+        return chunk
+
+    def resolve_images(self):
+        """deferred_tileset_loader 로 읽은 맵이면 자리표시 타일을 진짜 Surface 로 바꾼다 (메인 스레드에서)."""
+        loaders = {}
+        for gid, image in enumerate(self.images):
+            if isinstance(image, _PendingTile):
+                key = (image.filename, image.colorkey)
+                loader = loaders.get(key)
+                if loader is None:
+                    loader = loaders[key] = cached_tileset_loader(image.filename, image.colorkey)
+                self.images[gid] = loader(image.rect, image.flags)
+        self.image_loader = cached_tileset_loader
+
+    def _get_chunk(self, group, cx, cy):
+        key = (group, cx, cy)
+        if key in self._chunks:
+            self._chunks.move_to_end(key)
+            return self._chunks[key]
+        chunk = self._build_chunk(group, cx, cy)
+        self._chunks[key] = chunk
+        while len(self._chunks) > self.max_chunks:
+            self._chunks.popitem(last=False)
+        return chunk
+
+    def invalidate_chunks(self):
+        self._chunks.clear()
+
+    def draw(self, surface, camera, group="background"):
+        """group 레이어 묶음을 그린다. 배경은 캐릭터 전에, 전경은 draw_foreground 로 캐릭터 뒤에."""
+        chunks_x = (self.map_w_tiles + self.chunk_tiles - 1) // self.chunk_tiles
+        chunks_y = (self.map_h_tiles + self.chunk_tiles - 1) // self.chunk_tiles
+        start_cx = max(0, int(camera.x // self.chunk_w))
+        start_cy = max(0, int(camera.y // self.chunk_h))
+        end_cx = min(chunks_x, int((camera.x + WIDTH) // self.chunk_w) + 1)
+        end_cy = min(chunks_y, int((camera.y + HEIGHT) // self.chunk_h) + 1)
+        drawn = 0
+        for cy in range(start_cy, end_cy):
+            for cx in range(start_cx, end_cx):
+                chunk = self._get_chunk(group, cx, cy)
+                if chunk is not None:
+                    surface.blit(chunk, camera.apply_pos(cx * self.chunk_w, cy * self.chunk_h))
+                    drawn += 1
+        PROFILER.count("blits", drawn)
+
+    def draw_foreground(self, surface, camera):
+        if self.foreground_layers:
+            self.draw(surface, camera, group="foreground")
 
     def rect_blocked(self, rect):
         if rect.right < 0 or rect.left >= self.pixel_w or rect.bottom < 0 or rect.top >= self.pixel_h:
             return True
-        left = max(0, int(rect.left // self.stile_w))
-        right = min(self.map_w_tiles - 1, int(rect.right // self.stile_w))
-        top = max(0, int(rect.top // self.stile_h))
-        bottom = min(self.map_h_tiles - 1, int(rect.bottom // self.stile_h))
-        for tx in range(left, right + 1):
-            for ty in range(top, bottom + 1):
-                if (tx, ty) in self.blocked:
-                    if rect.colliderect(pygame.Rect(tx * self.stile_w, ty * self.stile_h, self.stile_w, self.stile_h)):
-                        return True
-        return False
+        if rect.width <= 0 or rect.height <= 0:
+            return False
+        # rect 와 실제로 겹치는 타일만: 오른쪽/아래 경계에 딱 붙은 타일은 제외
+        left = max(0, rect.left // self.stile_w)
+        right = min(self.map_w_tiles - 1, (rect.right - 1) // self.stile_w)
+        top = max(0, rect.top // self.stile_h)
+        bottom = min(self.map_h_tiles - 1, (rect.bottom - 1) // self.stile_h)
+        sat = self._collision_sat
+        blocked = (sat.item(bottom + 1, right + 1) - sat.item(top, right + 1)
+                   - sat.item(bottom + 1, left) + sat.item(top, left))
+        return blocked > 0
+
+    def rects_blocked(self, xs, ys, widths, heights):
+        """여러 사각형(예: 모든 적의 다음 위치)을 한 번에 검사. rect_blocked 와 같은 규칙의 bool 배열을 돌려준다."""
+        left = np.trunc(np.asarray(xs, dtype=np.float64)).astype(np.int64)
+        top = np.trunc(np.asarray(ys, dtype=np.float64)).astype(np.int64)
+        w = np.broadcast_to(np.asarray(widths, dtype=np.int64), left.shape)
+        h = np.broadcast_to(np.asarray(heights, dtype=np.int64), left.shape)
+        right, bottom = left + w, top + h
+        outside = (right < 0) | (left >= self.pixel_w) | (bottom < 0) | (top >= self.pixel_h)
+        # 오른쪽/아래 끝이 딱 0 이면 겹치는 타일이 없다 (rect_blocked 는 타일 -1 이 돼서 합이 0)
+        empty = (w <= 0) | (h <= 0) | (right <= 0) | (bottom <= 0)
+
+        tl = np.clip(left // self.stile_w, 0, self.map_w_tiles - 1)
+        tr = np.clip((right - 1) // self.stile_w, 0, self.map_w_tiles - 1)
+        tt = np.clip(top // self.stile_h, 0, self.map_h_tiles - 1)
+        tb = np.clip((bottom - 1) // self.stile_h, 0, self.map_h_tiles - 1)
+        sat = self._collision_sat
+        counts = sat[tb + 1, tr + 1] - sat[tt, tr + 1] - sat[tb + 1, tl] + sat[tt, tl]
+        return outside | (~empty & (counts > 0))
+
+    def _scan_spawn_points(self):
+        """이름/타입/프로퍼티로 찾는 스폰 지점 테이블 (find_player_spawn, find_named_spawn 용)."""
+        points = []
+        for obj in self.tmx.objects:
+            props = getattr(obj, "properties", {}) or {}
+            points.append({
+                "name": (getattr(obj, "name", "") or "").strip().lower(),
+                "type": (getattr(obj, "type", "") or "").strip().lower(),
+                "spawn_type": str(props.get("spawn_type", "")).strip().lower(),
+                "keys": [k.strip().lower() for k in props.keys()],
+                "x": int(obj.x * self.scale),
+                "y": int(obj.y * self.scale),
+            })
+        return points
 
     def find_player_spawn(self):
         """기본 스폰 위치: player_spawn 이라는 이름/속성/프로퍼티 가진 오브젝트."""
-        for obj in self.tmx.objects:  
-            props = getattr(obj, "properties", {}) or {}
-            name = (getattr(obj, "name", "") or "").strip().lower()
-            otype = (getattr(obj, "type", "") or "").strip().lower()
-            spawn_type = str(props.get("spawn_type", "")).strip().lower()
-            prop_keys = [k.strip().lower() for k in props.keys()]
-
+        for point in self.spawn_points:
             if (
-                name == "player_spawn" or
-                otype == "player_spawn" or
-                "player_spawn" in prop_keys or
-                spawn_type == "player"
+                point["name"] == "player_spawn" or
+                point["type"] == "player_spawn" or
+                "player_spawn" in point["keys"] or
+                point["spawn_type"] == "player"
             ):
-                x = int(obj.x * self.scale)
-                y = int(obj.y * self.scale)
-                return x, y
+                return point["x"], point["y"]
 
         return 0, 0
 
@@ -340,24 +1306,29 @@ class TiledMap:
 
         sname = spawn_name.strip().lower()
         #왜안되는지 아직도 모르겠음
-        for obj in self.tmx.objects:
-            props = getattr(obj, "properties", {}) or {}
-            name  = (getattr(obj, "name", "") or "").strip().lower()
-            otype = (getattr(obj, "type", "") or "").strip().lower()
-            prop_keys = [k.strip().lower() for k in props.keys()]
-
+        for point in self.spawn_points:
             if (
-                name == sname or
-                otype == sname or
-                sname in prop_keys
+                point["name"] == sname or
+                point["type"] == sname or
+                sname in point["keys"]
             ):
-                x = int(obj.x * self.scale)
-                y = int(obj.y * self.scale)
-                return x, y
+                return point["x"], point["y"]
 
         return self.find_player_spawn()
 
     def find_enemy_spawns(self):
+        return list(self.enemy_spawns)
+
+    def find_portals(self):
+        return [
+            {"rect": pygame.Rect(p["rect"]), "portal_type": p["portal_type"], "target_spawn": p["target_spawn"]}
+            for p in self.portal_table
+        ]
+
+    def find_quest_objects(self):
+        return list(self.quest_objects)
+
+    def _scan_enemy_spawns(self):
             spawns = []
             for layer in self.tmx.layers:
                 layer_name = getattr(layer, "name", "")
@@ -395,7 +1366,7 @@ class TiledMap:
                             print("enemies 레이어에 적이 업슨")
             return spawns
 
-    def find_portals(self):
+    def _scan_portals(self):
             portals=[]
             for layer in self.tmx.layers:
                 if hasattr(layer,"tiles") or hasattr(layer,"data"):
@@ -420,7 +1391,7 @@ class TiledMap:
                     })
             return portals
 
-    def find_quest_objects(self):
+    def _scan_quest_objects(self):
         quests = []
         for layer in self.tmx.layers:
             if hasattr(layer, "tiles") or hasattr(layer, "data"):
@@ -444,40 +1415,286 @@ class TiledMap:
 
 
 
-class DamageText:
-    def __init__(self, x, y, damage, critical=False):
-        self.x = x
-        self.y = y
-        self.damage = damage
-        self.critical = critical
-        self.lifetime = 60
-        self.active = True
-        self.offset_y = 0
+DAMAGE_TEXT_LIFETIME = 60
+# 남은 수명 -> 알파. 모든 숫자가 같은 표를 쓴다.
+DAMAGE_TEXT_ALPHA = [int(255 * (life / DAMAGE_TEXT_LIFETIME)) for life in range(DAMAGE_TEXT_LIFETIME + 1)]
+
+
+class DamageNumberAtlas:
+    """'0'~'9', '!' 를 보통(흰색 24)/치명타(빨강 32) 스타일로 한 장씩 미리 그려둔 글자판."""
+    GLYPHS = "0123456789!"
+    STYLES = {False: (24, WHITE), True: (32, RED)}
+
+    def __init__(self):
+        self.sheets = {}
+        self.glyph_rects = {}
+        for critical, (size, color) in self.STYLES.items():
+            glyphs = [render_text(ch, size, color) for ch in self.GLYPHS]
+            height = max(g.get_height() for g in glyphs)
+            sheet = pygame.Surface((sum(g.get_width() for g in glyphs), height), pygame.SRCALPHA)
+            rects = {}
+            gx = 0
+            for ch, g in zip(self.GLYPHS, glyphs):
+                sheet.blit(g, (gx, 0))
+                rects[ch] = pygame.Rect(gx, 0, g.get_width(), height)
+                gx += g.get_width()
+            if pygame.display.get_surface() is not None:
+                sheet = sheet.convert_alpha()
+            self.sheets[critical] = sheet
+            self.glyph_rects[critical] = rects
+        self._layouts = {}
+
+    def layout(self, value, critical):
+        """숫자 하나를 그릴 (글자 영역, x 오프셋) 목록과 전체 크기."""
+        key = (value, critical)
+        cached = self._layouts.get(key)
+        if cached is None:
+            text = f"{value}!" if critical else f"{value}"
+            rects = self.glyph_rects[critical]
+            parts = []
+            width = 0
+            for ch in text:
+                rect = rects.get(ch)
+                if rect is None:
+                    continue
+                parts.append((rect, width))
+                width += rect.width
+            cached = self._layouts[key] = (parts, width, self.sheets[critical].get_height())
+        return cached
+
+
+_DAMAGE_ATLAS = None
+
+
+class DamageTextPool:
+    """떠오르며 사라지는 데미지 숫자들. 살아있는 숫자는 배열 앞쪽 count 칸에 모여 있다."""
+    def __init__(self, capacity=256):
+        self.count = 0
+        self.x = np.zeros(capacity, dtype=np.float64)
+        self.y = np.zeros(capacity, dtype=np.float64)
+        self.offset_y = np.zeros(capacity, dtype=np.float64)
+        self.lifetime = np.zeros(capacity, dtype=np.int32)
+        self.value = np.zeros(capacity, dtype=np.int64)
+        self.critical = np.zeros(capacity, dtype=np.bool_)
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self):
+        for name in ("x", "y", "offset_y", "lifetime", "value", "critical"):
+            arr = getattr(self, name)
+            grown = np.zeros(len(arr) * 2, dtype=arr.dtype)
+            grown[:len(arr)] = arr
+            setattr(self, name, grown)
+
+    def add(self, x, y, damage, critical=False):
+        if self.count == len(self.x):
+            self._grow()
+        i = self.count
+        self.x[i], self.y[i], self.offset_y[i] = x, y, 0
+        self.lifetime[i] = DAMAGE_TEXT_LIFETIME
+        self.value[i] = int(damage)
+        self.critical[i] = critical
+        self.count += 1
+
+    def clear(self):
+        self.count = 0
+
+    def update(self):
+        n = self.count
+        if n == 0:
+            return
+        self.lifetime[:n] -= 1
+        self.offset_y[:n] -= 1.5
+        alive = self.lifetime[:n] > 0
+        if alive.all():
+            return
+        keep = np.flatnonzero(alive)
+        for arr in (self.x, self.y, self.offset_y, self.lifetime, self.value, self.critical):
+            arr[:len(keep)] = arr[keep]
+        self.count = len(keep)
 
+    def draw(self, surface, camera):
+        global _DAMAGE_ATLAS
+        n = self.count
+        if n == 0:
+            return
+        if _DAMAGE_ATLAS is None:
+            _DAMAGE_ATLAS = DamageNumberAtlas()
+        atlas = _DAMAGE_ATLAS
+        sxs = (self.x[:n] - camera.x + camera.offset_x).astype(np.int64)
+        sys_ = (self.y[:n] + self.offset_y[:n] - camera.y + camera.offset_y).astype(np.int64)
+        lifetimes = np.clip(self.lifetime[:n], 0, DAMAGE_TEXT_LIFETIME)
+        # 스타일/알파가 같은 숫자끼리 모아서 blits 한 번으로 그린다 (그리는 순서는 유지)
+        batch, batch_key = [], None
+        for sx, sy, life, value, critical in zip(sxs.tolist(), sys_.tolist(), lifetimes.tolist(),
+                                                 self.value[:n].tolist(), self.critical[:n].tolist()):
+            key = (critical, DAMAGE_TEXT_ALPHA[life])
+            if key != batch_key:
+                if batch:
+                    sheet = atlas.sheets[batch_key[0]]
+                    sheet.set_alpha(batch_key[1])
+                    surface.blits(batch, doreturn=False)
+                    PROFILER.count("blits", len(batch))
+                batch, batch_key = [], key
+            parts, width, height = atlas.layout(value, critical)
+            left, top = sx - width // 2, sy - height // 2
+            sheet = atlas.sheets[critical]
+            for rect, gx in parts:
+                batch.append((sheet, (left + gx, top), rect))
+        if batch:
+            sheet = atlas.sheets[batch_key[0]]
+            sheet.set_alpha(batch_key[1])
+            surface.blits(batch, doreturn=False)
+            PROFILER.count("blits", len(batch))
+
+def _particle_dot(outer, size, inner=None, inner_size=0, inner_offset=(0, 0), alpha=255):
+    surf = pygame.Surface((size * 2 + 2, size * 2 + 2), pygame.SRCALPHA)
+    c = size + 1
+    pygame.draw.circle(surf, outer + (alpha,), (c, c), size)
+    if inner is not None:
+        pygame.draw.circle(surf, inner + (alpha,), (c + inner_offset[0], c + inner_offset[1]), max(1, inner_size))
+    return surf, c, c
+
+
+def _particle_ray(color, angle, length, width):
+    reach = int(length) + width + 1
+    surf = pygame.Surface((reach * 2, reach * 2), pygame.SRCALPHA)
+    end = (reach + math.cos(angle) * length, reach + math.sin(angle) * length)
+    pygame.draw.line(surf, color, (reach, reach), (int(end[0]), int(end[1])), width)
+    return surf, reach, reach
+
+
+class ParticleSystem:
+    """불꽃/물방울/전기 같은 작은 입자들. 살아있는 입자는 배열 앞쪽 count 칸에 모여 있고,
+    종류마다 미리 그려둔 스프라이트를 blits 한 번으로 찍는다."""
+    RAY_ANGLES = 16
+
+    def __init__(self, capacity=2048):
+        self.capacity = capacity
+        self.count = 0
+        self.x = np.zeros(capacity, dtype=np.float64)
+        self.y = np.zeros(capacity, dtype=np.float64)
+        self.vx = np.zeros(capacity, dtype=np.float64)
+        self.vy = np.zeros(capacity, dtype=np.float64)
+        self.life = np.zeros(capacity, dtype=np.int32)
+        self.sprite = np.zeros(capacity, dtype=np.int32)
+        self.rng = np.random.default_rng()
+        self.sprites = None
+        self.kinds = {}
+        self.pending = []
+
+    def _build_sprites(self):
+        # kinds[이름] = 그 종류 스프라이트 번호들 (크기/각도/투명도 순)
+        sprites = []
+
+        def add(kind, entries):
+            self.kinds[kind] = np.arange(len(sprites), len(sprites) + len(entries))
+            sprites.extend(entries)
+
+        add("flame", [_particle_dot((255, 100, 0), size, (255, 200, 0), size - 2) for size in range(3, 7)])
+        add("drop", [_particle_dot((100, 150, 255), size, (150, 200, 255), size - 1, (0, -1)) for size in range(2, 5)])
+        # 역류 물방울: 투명도 4단계 x 크기 3종
+        add("water", [_particle_dot((180, 230, 255), size, alpha=alpha)
+                      for alpha in (55, 110, 165, 220) for size in range(2, 5)])
+        angles = [math.tau * i / self.RAY_ANGLES for i in range(self.RAY_ANGLES)]
+        add("arc", [_particle_ray((255, 255, 120), ang, length, 2) for length in (14, 20, 26) for ang in angles])
+        add("crackle", [_particle_ray((255, 255, 200), ang, length, 1) for length in (12, 18) for ang in angles])
+        if pygame.display.get_surface() is not None:
+            sprites = [(surf.convert_alpha(), ox, oy) for surf, ox, oy in sprites]
+        self.sprites = sprites
+
+    def kind(self, name):
+        if self.sprites is None:
+            self._build_sprites()
+        return self.kinds[name]
+
+    def seed(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def clear(self):
+        self.count = 0
+        self.pending.clear()
+
+    def __len__(self):
+        return self.count
+
+    def emit(self, x, y, sprite, vx=0.0, vy=0.0, life=1):
+        """입자 여러 개를 한 번에 추가. 인자는 스칼라나 같은 길이의 배열. 자리가 없으면 넘치는 만큼 버린다."""
+        x, y, sprite, vx, vy, life = np.broadcast_arrays(
+            np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), np.asarray(sprite),
+            np.asarray(vx, dtype=np.float64), np.asarray(vy, dtype=np.float64), np.asarray(life))
+        n = min(x.size, self.capacity - self.count)
+        if n <= 0:
+            return
+        s = slice(self.count, self.count + n)
+        self.x[s] = x.ravel()[:n]
+        self.y[s] = y.ravel()[:n]
+        self.vx[s] = vx.ravel()[:n]
+        self.vy[s] = vy.ravel()[:n]
+        self.life[s] = life.ravel()[:n]
+        self.sprite[s] = sprite.ravel()[:n]
+        self.count += n
+
+    def emit_around(self, name, x, y, count, dx=(0, 0), dy=(0, 0), vx=0.0, vy=0.0, life=1):
+        """(x + dx 범위, y + dy 범위) 에 name 종류 입자 count 개. 스프라이트(크기 등)는 무작위.
+        적마다 부르는 곳이 많아서 모아뒀다가 다음 update() 끝에 한꺼번에 배열에 넣는다."""
+        kind = self.kind(name)
+        self.pending.append((x, y, dx[0], dx[1], dy[0], dy[1], vx, vy, life, kind[0], len(kind), count))
+
+    def emit_rays(self, name, x, y, count, life=1):
+        """(x, y) 에서 뻗는 무작위 방향 전기 줄기."""
+        self.emit_around(name, x, y, count, life=life)
+
+    def _flush_pending(self):
+        if not self.pending:
+            return
+        rows = np.array(self.pending, dtype=np.float64)
+        self.pending.clear()
+        rows = np.repeat(rows, rows[:, 11].astype(np.int64), axis=0)
+        n = len(rows)
+        rnd = self.rng.random((3, n))
+        self.emit(
+            rows[:, 0] + rows[:, 2] + rnd[0] * (rows[:, 3] - rows[:, 2]),
+            rows[:, 1] + rows[:, 4] + rnd[1] * (rows[:, 5] - rows[:, 4]),
+            rows[:, 9].astype(np.int64) + (rnd[2] * rows[:, 10]).astype(np.int64),
+            rows[:, 6], rows[:, 7], rows[:, 8].astype(np.int64),
+        )
 
     def update(self):
-        self.lifetime -= 1
-        self.offset_y -= 1.5
-        if self.lifetime <= 0:
-            self.active = False
+        """시뮬레이션 한 스텝. 있던 입자를 움직이고 나서 이번 스텝에 모인 입자를 넣는다
+        (새 입자는 다음 스텝부터 움직이니까 생긴 자리에서 한 번은 그려진다)."""
+        n = self.count
+        if n:
+            self.x[:n] += self.vx[:n]
+            self.y[:n] += self.vy[:n]
+            self.life[:n] -= 1
+            alive = self.life[:n] > 0
+            if not alive.all():
+                keep = np.flatnonzero(alive)
+                for arr in (self.x, self.y, self.vx, self.vy, self.life, self.sprite):
+                    arr[:len(keep)] = arr[keep]
+                self.count = len(keep)
+        self._flush_pending()
 
     def draw(self, surface, camera):
-        if not self.active:
+        self._flush_pending()
+        n = self.count
+        if n == 0:
             return
-        sx, sy = camera.apply_pos(self.x, self.y + self.offset_y)
-        if self.critical:
-            font = get_korean_font(32)
-            color = RED
-            text = f"{int(self.damage)}!"
-        else:
-            font = get_korean_font(24)
-            color = WHITE
-            text = f"{int(self.damage)}"
-        alpha = int(255 * (self.lifetime / 60))
-        text_surf = font.render(text, True, color)
-        text_surf.set_alpha(alpha)
-        text_rect = text_surf.get_rect(center=(int(sx), int(sy)))
-        surface.blit(text_surf, text_rect)
+        sxs = (self.x[:n] - camera.x + camera.offset_x).astype(np.int64).tolist()
+        sys_ = (self.y[:n] - camera.y + camera.offset_y).astype(np.int64).tolist()
+        sprites = self.sprites
+        batch = []
+        for sx, sy, idx in zip(sxs, sys_, self.sprite[:n].tolist()):
+            surf, ox, oy = sprites[idx]
+            batch.append((surf, (sx - ox, sy - oy)))
+        surface.blits(batch, doreturn=False)
+        PROFILER.count("blits", len(batch))
+
+
+PARTICLES = ParticleSystem()
+
 
 def xp_needed_for_level(level: int) -> int:
     return max(1, int(5 * (level ** 2) + 20 * level + 100))
@@ -633,7 +1850,9 @@ class Player:
 
         sound = self.spell_sounds.get(spell_type)
         if sound is not None:
-            sound.play()
+            # S랭크 마법 소리는 C랭크 소리보다 먼저 살아남는다
+            priority = 2 if self.known_spells.get(spell_type) == "S" else 1
+            SOUNDS.play(sound, "spell", priority=priority)
 
         sx = self.x + self.width // 2
         sy = self.y + self.height // 2
@@ -647,7 +1866,7 @@ class Player:
             center_x, center_y = target_world_pos
 
             if spell_type == "meteor":
-                radius = 140
+                radius = SPELL_AREA_RADIUS["meteor"]
                 extra = {
                     "start_pos": (sx, sy),
                     "damage_multiplier": weapon_mult,
@@ -657,7 +1876,7 @@ class Player:
                 )
 
             elif spell_type == "thunder":
-                radius = 200
+                radius = SPELL_AREA_RADIUS["thunder"]
                 base_damage = max(1, int(same_slime_hp * 0.05))
                 extra = {"damage": base_damage, "damage_multiplier": weapon_mult}
                 current_map.area_effects.append(
@@ -665,7 +1884,7 @@ class Player:
                 )
 
             elif spell_type == "iceberg":
-                radius = 130
+                radius = SPELL_AREA_RADIUS["iceberg"]
                 base_damage = max(1, int(same_slime_hp * 0.38))
                 extra = {
                     "damage": base_damage,
@@ -686,27 +1905,11 @@ class Player:
 
                 base_damage = max(1, int(same_slime_hp * 0.32 * weapon_mult))
 
-                for enemy in current_map.enemies:
+                for enemy in current_map.enemy_index.query_cone(sx, sy, dir_x, dir_y, max_range, cone_half_angle):
                     ex = enemy.x + enemy.width / 2
-                    ey = enemy.y + enemy.height / 2
-                    vx = ex - sx
-                    vy = ey - sy
-                    enemy_dist = math.hypot(vx, vy)
-                    if enemy_dist <= 0 or enemy_dist > max_range:
-                        continue
-
-                    nvx = vx / enemy_dist
-                    nvy = vy / enemy_dist
-                    dot = nvx * dir_x + nvy * dir_y
-                    dot = max(-1.0, min(1.0, dot))
-                    angle = math.acos(dot)
-
-                    if angle <= cone_half_angle:
-                        enemy.hp -= base_damage
-                        current_map.damage_texts.append(
-                            DamageText(ex, enemy.y, base_damage)
-                        )
-                        enemy.apply_slow(duration=360)
+                    enemy.hp -= base_damage
+                    current_map.damage_texts.add(ex, enemy.y, base_damage)
+                    enemy.apply_slow(duration=360)
 
                 extra = ((sx, sy), (dir_x, dir_y), cone_half_angle)
                 current_map.area_effects.append(
@@ -742,8 +1945,9 @@ class LightningChain:
         self.chain_delay = 0
         self.chain_delay_max = 10
         self.just_chained = False
+        self.bolt_points = None
 
-    def update(self, enemies, damage_texts):
+    def update(self, enemy_index, damage_texts):
         if not self.active:
             return
         self.lifetime -= 1
@@ -752,88 +1956,474 @@ class LightningChain:
             return
         self.chain_delay -= 1
         self.just_chained = False
-        if self.chain_delay > 0:
-            return
-        closest_enemy = None
-        closest_dist = 250
-        for enemy in enemies:
-            if id(enemy) in self.hit_enemies:
-                continue
-            if hasattr(enemy, 'dying') and enemy.dying:
-                continue
-            if hasattr(enemy, 'is_dummy') and enemy.is_dummy:
-                pass
-            elif enemy.hp <= 0:
-                continue
-            ex = enemy.x + enemy.width / 2
-            ey = enemy.y + enemy.height / 2
-            dist = math.hypot(ex - self.x, ey - self.y)
-            if dist < closest_dist:
-                closest_dist = dist
-                closest_enemy = enemy
-        if closest_enemy:
-            self.chain_x = self.x
-            self.chain_y = self.y
-            closest_enemy.hp -= self.damage
-            self.hit_enemies.add(id(closest_enemy))
-            damage_texts.append(DamageText(
-                closest_enemy.x + closest_enemy.width / 2,
-                closest_enemy.y,
-                self.damage
-            ))
-            self.x = closest_enemy.x + closest_enemy.width / 2
-            self.y = closest_enemy.y + closest_enemy.height / 2
-            self.chain_delay = self.chain_delay_max
-            self.just_chained = True
+        if self.chain_delay <= 0:
+            closest_enemy = enemy_index.nearest(self.x, self.y, max_dist=250, predicate=self._can_chain_to)
+            if closest_enemy:
+                self.chain_x = self.x
+                self.chain_y = self.y
+                closest_enemy.hp -= self.damage
+                self.hit_enemies.add(id(closest_enemy))
+                damage_texts.add(
+                    closest_enemy.x + closest_enemy.width / 2,
+                    closest_enemy.y,
+                    self.damage
+                )
+                self.x = closest_enemy.x + closest_enemy.width / 2
+                self.y = closest_enemy.y + closest_enemy.height / 2
+                self.chain_delay = self.chain_delay_max
+                self.just_chained = True
+        # 전기 줄기는 draw 가 아니라 스텝마다 (화면 주기에 따라 개수가 달라지면 안 된다).
+        # crackle 은 원래 draw 가 매 프레임 긋던 10~20px 짧은 줄기 3개를 그대로 옮긴 것
+        if self.chain_x == self.x and self.chain_y == self.y:
+            PARTICLES.emit_rays("arc", self.x, self.y, 5)
+            self.bolt_points = None
+        else:
+            self._jitter_bolt()
+        PARTICLES.emit_rays("crackle", self.x, self.y, 3)
+
+    def _jitter_bolt(self, segments=8):
+        """직전 적 -> 지금 적 번개를 8토막으로 나눠 마디마다 수직으로 ±10px 흔든다 (월드 좌표).
+        마디 길이와 방향이 연결마다 달라서 미리 그린 입자 스프라이트로는 못 찍으니 선으로 남긴다."""
+        dx = self.x - self.chain_x
+        dy = self.y - self.chain_y
+        length = math.hypot(dx, dy)
+        t = np.linspace(0.0, 1.0, segments + 1)
+        px = self.chain_x + dx * t
+        py = self.chain_y + dy * t
+        if length > 0:
+            offset = PARTICLES.rng.uniform(-10, 10, segments + 1)
+            px += -dy / length * offset
+            py += dx / length * offset
+        self.bolt_points = list(zip(px.tolist(), py.tolist()))
+
+    def _can_chain_to(self, enemy):
+        if id(enemy) in self.hit_enemies:
+            return False
+        if hasattr(enemy, 'dying') and enemy.dying:
+            return False
+        if hasattr(enemy, 'is_dummy') and enemy.is_dummy:
+            return True
+        return enemy.hp > 0
 
     def draw(self, surface, camera):
         if not self.active:
             return
         sx, sy = camera.apply_pos(self.x, self.y)
         if self.chain_x != self.x or self.chain_y != self.y:
-            chain_sx, chain_sy = camera.apply_pos(self.chain_x, self.chain_y)
-            segments = 8
-            points = []
-            for i in range(segments + 1):
-                t = i / segments
-                mid_x = chain_sx + (sx - chain_sx) * t
-                mid_y = chain_sy + (sy - chain_sy) * t
-                dx = sx - chain_sx
-                dy = sy - chain_sy
-                length = math.hypot(dx, dy)
-                if length > 0:
-                    perp_x = -dy / length
-                    perp_y = dx / length
-                    offset = random.uniform(-10, 10)
-                    mid_x += perp_x * offset
-                    mid_y += perp_y * offset
-                points.append((int(mid_x), int(mid_y)))
-            if len(points) >= 2:
+            # 흔들린 마디는 update() 가 스텝마다 정해둔다. 여기서는 긋기만
+            if self.bolt_points:
+                points = [camera.apply_pos(px, py) for px, py in self.bolt_points]
                 pygame.draw.lines(surface, (255, 255, 100), False, points, 4)
                 pygame.draw.lines(surface, (255, 255, 255), False, points, 2)
         else:
-            jitter_points = []
-            for i in range(5):
-                ang = random.uniform(0, math.tau)
-                dist = random.uniform(12, 28)
-                px = sx + math.cos(ang) * dist
-                py = sy + math.sin(ang) * dist
-                jitter_points.append((px, py))
-                pygame.draw.line(surface, (255, 255, 120), (int(sx), int(sy)), (int(px), int(py)), 2)
-            if jitter_points:
-                pygame.draw.circle(surface, (255, 255, 200), (int(sx), int(sy)), 6, 2)
+            pygame.draw.circle(surface, (255, 255, 200), (int(sx), int(sy)), 6, 2)
         radius = 8 + int(3 * math.sin(pygame.time.get_ticks() / 100))
         pygame.draw.circle(surface, (255, 255, 180), (int(sx), int(sy)), radius)
         pygame.draw.circle(surface, YELLOW, (int(sx), int(sy)), radius - 2)
-        for _ in range(3):
-            angle = random.uniform(0, math.pi * 2)
-            dist = random.uniform(10, 20)
-            px = sx + math.cos(angle) * dist
-            py = sy + math.sin(angle) * dist
-            pygame.draw.line(surface, (255, 255, 200), (int(sx), int(sy)), (int(px), int(py)), 1)
+
+
+class EffectAnimation:
+    """구워둔 이펙트 프레임 묶음. 프레임마다 그려진 부분만 잘라서 시트 한 장에 선반식으로 붙여둔다."""
+    SHEET_WIDTH = 4096
+
+    def __init__(self, frames):
+        # frames: [(캔버스, (중심 x, 중심 y))]
+        crops = []
+        for canvas, (anchor_x, anchor_y) in frames:
+            rect = self._content_rect(canvas)
+            crops.append((canvas, rect, anchor_x - rect.x, anchor_y - rect.y))
+
+        positions = []
+        x = y = shelf_h = sheet_w = 0
+        for _, rect, _, _ in crops:
+            if x + rect.w > self.SHEET_WIDTH and x > 0:
+                x, y, shelf_h = 0, y + shelf_h, 0
+            positions.append((x, y))
+            x += rect.w
+            shelf_h = max(shelf_h, rect.h)
+            sheet_w = max(sheet_w, x)
+
+        sheet = pygame.Surface((max(1, sheet_w), max(1, y + shelf_h)), pygame.SRCALPHA)
+        self.frames = []
+        for (canvas, rect, off_x, off_y), (px, py) in zip(crops, positions):
+            sheet.blit(canvas, (px, py), rect)
+            self.frames.append((pygame.Rect(px, py, rect.w, rect.h), off_x, off_y))
+        if pygame.display.get_surface() is not None:
+            sheet = sheet.convert_alpha()
+        self.sheet = sheet
+        self.nbytes = sheet.get_width() * sheet.get_height() * sheet.get_bytesize()
+
+    @staticmethod
+    def _content_rect(canvas):
+        # get_bounding_rect 보다 훨씬 빠르다
+        alpha = pygame.surfarray.pixels_alpha(canvas)
+        cols = np.flatnonzero(alpha.any(axis=1))
+        rows = np.flatnonzero(alpha.any(axis=0))
+        del alpha
+        if len(cols) == 0:
+            return pygame.Rect(0, 0, 0, 0)
+        return pygame.Rect(cols[0], rows[0], cols[-1] - cols[0] + 1, rows[-1] - rows[0] + 1)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def blit_item(self, index, cx, cy):
+        """중심이 (cx, cy) 인 index 번째 프레임의 (시트, 위치, 영역). 빈 프레임이면 None."""
+        area, off_x, off_y = self.frames[max(0, min(index, len(self.frames) - 1))]
+        if area.w == 0 or area.h == 0:
+            return None
+        return (self.sheet, (cx - off_x, cy - off_y), area)
+
+
+class EffectAnimationCache:
+    """(이펙트, 크기, 변형) -> EffectAnimation. 처음 쓸 때 굽고, 바이트 예산을 넘으면 오래 안 쓴 것부터 버린다."""
+    def __init__(self, budget_bytes=EFFECT_CACHE_BUDGET):
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.entries = OrderedDict()
+
+    def get(self, key, bake):
+        anim = self.entries.get(key)
+        if anim is not None:
+            self.entries.move_to_end(key)
+            return anim
+        # 변형마다 같은 모양이 나오도록 굽기 전용 난수를 쓴다
+        anim = EffectAnimation(bake(random.Random(":".join(map(str, key)))))
+        PROFILER.count("surfaces")
+        while self.entries and self.used_bytes + anim.nbytes > self.budget_bytes:
+            _, old = self.entries.popitem(last=False)
+            self.used_bytes -= old.nbytes
+        self.entries[key] = anim
+        self.used_bytes += anim.nbytes
+        return anim
+
+
+_EFFECT_ANIMATIONS = EffectAnimationCache()
+_SCREEN_TINTS = {}
+
+
+def blit_screen_tint(surface, color, alpha):
+    """화면 전체를 color 로 alpha 만큼 덮는다. 덮개 Surface 는 (크기, 색) 마다 한 번만 만든다."""
+    key = (surface.get_size(), color)
+    tint = _SCREEN_TINTS.get(key)
+    if tint is None:
+        tint = _SCREEN_TINTS[key] = pygame.Surface(surface.get_size())
+        PROFILER.count("surfaces")
+        tint.fill(color)
+    tint.set_alpha(alpha)
+    surface.blit(tint, (0, 0))
+
+
+def _draw_meteor_head(surface, mx, my, rng):
+    pygame.draw.circle(surface, (255, 180, 0), (int(mx), int(my)), 14)
+    pygame.draw.circle(surface, (255, 80, 0), (int(mx), int(my)), 10)
+    for _ in range(5):
+        off = rng.randint(-8, 8)
+        pygame.draw.line(
+            surface, (255, 120, 0),
+            (int(mx + off), int(my + off)),
+            (int(mx), int(my + 25)), 2
+        )
+
+
+def bake_meteor_head(impact_t, rng):
+    frames = []
+    for _ in range(impact_t):
+        canvas = pygame.Surface((48, 64), pygame.SRCALPHA)
+        _draw_meteor_head(canvas, 24, 20, rng)
+        frames.append((canvas, (24, 20)))
+    return frames
+
+
+# 내가짠거 - 1차 메테오
+# if self.age >= impact_t:
+#     explosion_t = (self.age - impact_t) / max(1, (total_t - impact_t))
+#     explosion_t = max(0.0, min(1.0, explosion_t))
+#     explosion_r = int(self.size * (0.5 + 0.5 * explosion_t))
+#     alpha = int(220 * (1 - explosion_t))
+#     expl_surf = pygame.Surface(
+#         (explosion_r * 2, explosion_r * 2), pygame.SRCALPHA
+#     )
+#     pygame.draw.circle(
+#         expl_surf, (255, 120, 0, alpha),
+#         (explosion_r, explosion_r), explosion_r
+#     )
+#     pygame.draw.circle(
+#         expl_surf, (255, 220, 0, alpha),
+#         (explosion_r, explosion_r), int(explosion_r * 0.7)
+#     )
+#     surface.blit(expl_surf, (cx - explosion_r, cy - explosion_r))
+
+# 이후 Meteor는 GPT
+def bake_meteor_explosion(size, impact_t, total_t, rng):
+    """착탄 프레임(impact_t)부터 total_t 까지. 착탄 순간의 메테오 머리도 같이 굽는다."""
+    half = int(size * 1.9) + 12
+    frames = []
+    for age in range(impact_t, total_t + 1):
+        surface = pygame.Surface((half * 2, half * 2), pygame.SRCALPHA)
+        cx = cy = half
+        if age == impact_t:
+            _draw_meteor_head(surface, cx, cy, rng)
+
+        phase = (age - impact_t) / max(1, (total_t - impact_t))
+        phase = max(0.0, min(1.0, phase))
+        base_radius = size
+        main_r = int(base_radius * (0.7 + 0.6 * phase))
+        inner_r = int(main_r * 0.55)
+        core_r = int(main_r * 0.3)
+        smoke_r = int(main_r * 1.3)
+        expl_surf = pygame.Surface((main_r * 2, main_r * 2), pygame.SRCALPHA)
+        center = (main_r, main_r)
+
+        smoke_alpha = int(180 * (1 - phase))
+        if smoke_alpha > 0:
+            pygame.draw.circle(expl_surf, (40, 40, 40, smoke_alpha), center, smoke_r)
+        outer_alpha = int(230 * (1 - phase * 0.7))
+        if outer_alpha > 0:
+            pygame.draw.circle(expl_surf, (255, 120, 0, outer_alpha), center, main_r)
+        mid_alpha = int(240 * (1 - phase * 0.8))
+        if mid_alpha > 0:
+            pygame.draw.circle(expl_surf, (255, 220, 0, mid_alpha), center, inner_r)
+        core_alpha = int(255 * (1 - phase))
+        if core_alpha > 0:
+            pygame.draw.circle(expl_surf, (255, 255, 255, core_alpha), center, core_r)
+
+        surface.blit(expl_surf, (cx - main_r, cy - main_r))
+
+        wave_r = int(base_radius * (0.4 + phase * 1.5))
+        wave_alpha = int(220 * (1 - phase))
+        if wave_alpha > 0 and wave_r > 0:
+            ring_surf = pygame.Surface((wave_r * 2, wave_r * 2), pygame.SRCALPHA)
+            pygame.draw.circle(ring_surf, (255, 230, 200, wave_alpha), (wave_r, wave_r), wave_r, width=4)
+            pygame.draw.circle(ring_surf, (255, 255, 255, min(255, wave_alpha + 20)), (wave_r, wave_r), int(wave_r * 0.85), width=2)
+            surface.blit(ring_surf, (cx - wave_r, cy - wave_r))
+
+        # 화면에 바로 그리던 불꽃은 불투명하게 찍힌다
+        num_sparks = 26
+        for _ in range(num_sparks):
+            ang = rng.uniform(0, math.tau)
+            dist = rng.uniform(base_radius * 0.3, base_radius * (0.6 + phase * 1.2))
+            px = cx + math.cos(ang) * dist
+            py = cy + math.sin(ang) * dist
+            spark_size = rng.randint(2, 4)
+            spark_alpha = int(255 * (1 - phase))
+            if spark_alpha <= 0:
+                continue
+            pygame.draw.circle(surface, (255, 200, 120), (int(px), int(py)), spark_size)
+            pygame.draw.circle(surface, (255, 255, 220), (int(px), int(py)), max(1, spark_size - 1))
+
+        if impact_t <= age <= impact_t + 10:
+            scorch_r = int(base_radius * 1.2)
+            scorch_surf = pygame.Surface((scorch_r * 2, scorch_r * 2), pygame.SRCALPHA)
+            pygame.draw.circle(scorch_surf, (20, 10, 5, 140), (scorch_r, scorch_r), scorch_r)
+            pygame.draw.circle(scorch_surf, (60, 35, 15, 110), (scorch_r, scorch_r), int(scorch_r * 0.6))
+            surface.blit(scorch_surf, (cx - scorch_r, cy - scorch_r))
+        frames.append((surface, (cx, cy)))
+    return frames
+
+
+# ----- 천둥: 1차
+# elif self.effect_type == "thunder":
+#     strike_duration = 25
+#     for s in self.strikes:
+#         if s["start"] <= self.age <= s["start"] + strike_duration:
+#             sx, sy = camera.apply_pos(s["x"], s["y"])
+#             height = 260
+#             top_y = sy - height // 2
+#             bottom_y = sy + height // 2
+#             points = []
+#             segs = 25
+#             for i in range(segs + 1):
+#                 ty = top_y + (bottom_y - top_y) * i / segs
+#                 jitter = random.randint(-8, 8)
+#                 points.append((sx + jitter, ty))
+#             pygame.draw.lines(surface, (255, 255, 200), False, points, 4)
+#             pygame.draw.lines(surface, (255, 255, 255), False, points, 2)
+#             wave_r = int(self.strike_radius * (self.age - s["start"]) / strike_duration)
+#             if wave_r > 0:
+#                 pygame.draw.circle(surface, (255, 255, 180), (sx, sy), wave_r, 2)
+#     glow_r = int(self.size * 1.1)
+#     glow_alpha = int(80 + 60 * math.sin(self.age * 0.3))
+#     glow_surf = pygame.Surface((glow_r * 2, glow_r * 2), pygame.SRCALPHA)
+#     pygame.draw.circle(glow_surf, (255, 255, 200, max(0, glow_alpha)),
+#                        (glow_r, glow_r), glow_r, 3)
+#     surface.blit(glow_surf, (cx - glow_r, cy - glow_r))
+# 이후 번개는 GPT
+def bake_thunder_strike(strike_radius, strike_duration, rng):
+    """낙뢰 한 줄기의 0 ~ strike_duration 프레임 (번개 줄기, 폭발, 잔전기)."""
+    half_w = max(strike_radius, 40) + 16
+    half_h = 150 + 12
+    frames = []
+    for t in range(strike_duration + 1):
+        surface = pygame.Surface((half_w * 2, half_h * 2), pygame.SRCALPHA)
+        sx, sy = half_w, half_h
+        height = 300
+        top_y = sy - height // 2
+        bottom_y = sy + height // 2
+
+        points = []
+        segs = 18
+        for i in range(segs + 1):
+            ty = top_y + (bottom_y - top_y) * i / segs
+            jitter = rng.randint(-14, 14)
+            points.append((sx + jitter, ty))
+        if len(points) >= 2:
+            pygame.draw.lines(surface, (255, 255, 140), False, points, 7)
+            pygame.draw.lines(surface, (255, 255, 255), False, points, 3)
+
+        explosion_r = int(strike_radius * t / strike_duration)
+        if explosion_r > 0:
+            boom_alpha = int(180 * (1 - (explosion_r / max(1, strike_radius * 1.4))))
+            boom_surf = pygame.Surface((explosion_r * 2, explosion_r * 2), pygame.SRCALPHA)
+            pygame.draw.circle(boom_surf, (255, 240, 150, boom_alpha), (explosion_r, explosion_r), explosion_r)
+            pygame.draw.circle(boom_surf, (255, 255, 255, int(boom_alpha * 0.7)), (explosion_r, explosion_r), int(explosion_r * 0.6))
+            surface.blit(boom_surf, (sx - explosion_r, sy - explosion_r))
+
+        for _ in range(8):
+            ang = rng.uniform(0, math.tau)
+            dist = rng.uniform(10, 40)
+            px = sx + math.cos(ang) * dist
+            py = sy + math.sin(ang) * dist
+            pygame.draw.line(surface, (255, 255, 180), (sx, sy), (int(px), int(py)), 1)
+        frames.append((surface, (sx, sy)))
+    return frames
+
+
+def bake_thunder_glow(size, rng):
+    """천둥 범위 테두리. 알파는 그릴 때 set_alpha 로 준다."""
+    glow_r = int(size * 1.4)
+    glow_surf = pygame.Surface((glow_r * 2, glow_r * 2), pygame.SRCALPHA)
+    pygame.draw.circle(glow_surf, (200, 240, 255, 255), (glow_r, glow_r), glow_r, 4)
+    return [(glow_surf, (glow_r, glow_r))]
+
+
+# ----- 빙산: 1차 
+# elif self.effect_type == "iceberg":
+#     spike_count = 10
+#     base_r = self.size * 0.3
+#     grow_time = self.max_lifetime * (1/3)
+#     if self.age < grow_time:
+#         spike_progress = self.age / grow_time
+#     else:
+#         spike_progress = 1.0
+#     spike_len = self.size * 0.7 * spike_progress
+#     for i in range(spike_count):
+#         angle = (2 * math.pi / spike_count) * i
+#         bx = cx + math.cos(angle) * base_r
+#         by = cy + math.sin(angle) * base_r
+#         tipx = bx + math.cos(angle) * spike_len
+#         tipy = by + math.sin(angle) * spike_len * 1.1
+#         jitter = math.sin(self.age * 0.2 + i) * 3
+#         tipy += jitter
+#         points = [
+#             (bx - 8 * math.sin(angle), by + 8 * math.cos(angle)),
+#             (bx + 8 * math.sin(angle), by - 8 * math.cos(angle)),
+#             (tipx, tipy),
+#         ]
+#         pygame.draw.polygon(surface, (180, 240, 255), points)
+#         pygame.draw.polygon(surface, (220, 255, 255), points, 1)
+#     pygame.draw.circle(surface, (150, 220, 255), (int(cx), int(cy)),
+#                        int(self.size * 0.25), 2)
+# 이후 빙산 GPT
+def bake_iceberg(size, max_lifetime, rng):
+    half = int(size * 1.5) + 16
+    frames = []
+    for age in range(max_lifetime + 1):
+        surface = pygame.Surface((half * 2, half * 2), pygame.SRCALPHA)
+        cx = cy = half
+        phase = age / max_lifetime
+        phase = max(0.0, min(1.0, phase))
+        base_r = size * 0.35
+        max_spike_len = size * 0.9
+        grow_time = max_lifetime * (1/3)
+        if age < grow_time:
+            spike_progress = age / grow_time
+        else:
+            spike_progress = 1.0
+        spike_len_outer = max_spike_len * spike_progress
+        spike_len_inner = spike_len_outer * 0.6
+
+        aura_r = int(size * (0.6 + 0.1 * math.sin(age * 0.25)))
+        aura_alpha = int(140 * (1 - phase * 0.7))
+        if aura_alpha > 0:
+            aura_surf = pygame.Surface((aura_r * 2, aura_r * 2), pygame.SRCALPHA)
+            center = (aura_r, aura_r)
+            pygame.draw.circle(aura_surf, (80, 180, 255, aura_alpha), center, aura_r)
+            pygame.draw.circle(aura_surf, (200, 245, 255, int(aura_alpha * 0.8)), center, int(aura_r * 0.65))
+            surface.blit(aura_surf, (cx - aura_r, cy - aura_r))
+
+        if phase < 0.6:
+            crack_r = size * 0.85
+            for i in range(7):
+                ang = (math.tau / 7) * i + math.sin(age * 0.1) * 0.15
+                length = crack_r * (0.6 + 0.4 * rng.random())
+                x1 = cx + math.cos(ang) * 10
+                y1 = cy + math.sin(ang) * 10
+                x2 = cx + math.cos(ang) * length
+                y2 = cy + math.sin(ang) * length
+                pygame.draw.line(surface, (200, 230, 255), (int(x1), int(y1)), (int(x2), int(y2)), 1)
+
+        inner_count = 10
+        angle_offset = age * 0.05
+        for i in range(inner_count):
+            angle = (math.tau / inner_count) * i + angle_offset
+            bx = cx + math.cos(angle) * (base_r * 0.5)
+            by = cy + math.sin(angle) * (base_r * 0.5)
+            tipx = bx + math.cos(angle) * spike_len_inner
+            tipy = by + math.sin(angle) * spike_len_inner * 1.05
+            jitter = math.sin(age * 0.3 + i) * 2
+            tipx += math.cos(angle + math.pi/2) * jitter
+            tipy += math.sin(angle + math.pi/2) * jitter
+            points = [
+                (bx - 6 * math.sin(angle), by + 6 * math.cos(angle)),
+                (bx + 6 * math.sin(angle), by - 6 * math.cos(angle)),
+                (tipx, tipy),
+            ]
+            pygame.draw.polygon(surface, (170, 230, 255), points)
+            pygame.draw.polygon(surface, (220, 255, 255), points, 1)
+
+        outer_count = 12
+        for i in range(outer_count):
+            angle = (math.tau / outer_count) * i - angle_offset * 0.7
+            bx = cx + math.cos(angle) * (base_r * 1.0)
+            by = cy + math.sin(angle) * (base_r * 1.0)
+            tipx = bx + math.cos(angle) * spike_len_outer
+            tipy = by + math.sin(angle) * spike_len_outer * 1.1
+            swing = math.sin(age * 0.2 + i * 0.5) * 4
+            tipx += math.cos(angle + math.pi/2) * swing
+            tipy += math.sin(angle + math.pi/2) * swing
+            points = [
+                (bx - 9 * math.sin(angle), by + 9 * math.cos(angle)),
+                (bx + 9 * math.sin(angle), by - 9 * math.cos(angle)),
+                (tipx, tipy),
+            ]
+            pygame.draw.polygon(surface, (150, 210, 255), points)
+            pygame.draw.polygon(surface, (230, 255, 255), points, 1)
+
+        core_r = int(size * 0.3)
+        pygame.draw.circle(surface, (160, 220, 255), (int(cx), int(cy)), core_r, 2)
+        pygame.draw.circle(surface, (220, 250, 255), (int(cx), int(cy)), int(core_r * 0.55), 1)
+
+        flake_count = 24
+        for _ in range(flake_count):
+            ang = rng.uniform(0, math.tau)
+            dist = rng.uniform(size * 0.1, size * 1.4)
+            fx = cx + math.cos(ang) * dist
+            fy = cy + math.sin(ang) * dist - phase * 10
+            flake_size = rng.randint(1, 3)
+            alpha = int(220 * (1 - phase * 0.9))
+            if alpha <= 0:
+                continue
+            pygame.draw.circle(surface, (230, 240, 255), (int(fx), int(fy)), flake_size)
+            if flake_size >= 2:
+                pygame.draw.circle(surface, (255, 255, 255), (int(fx), int(fy)), flake_size - 1)
+        frames.append((surface, (cx, cy)))
+    return frames
 
 
 class AreaEffect:
+    STRIKE_DURATION = 25
+
     def __init__(self, effect_type, x, y, size, extra=None):
         self.effect_type = effect_type
         self.x = x
@@ -844,6 +2434,9 @@ class AreaEffect:
         self.damage_multiplier = self.extra_dict.get("damage_multiplier", 1.0)
         self.age = 0
         self.active = True
+        self.variant = random.randrange(EFFECT_VARIANTS)
+        self._canvas = None
+        self._canvas_age = None
 
         if effect_type == "meteor":
             self.max_lifetime = 60
@@ -867,6 +2460,7 @@ class AreaEffect:
                     "y": sy,
                     "start": 5 + i * self.strike_interval,
                     "hit": False,
+                    "variant": random.randrange(EFFECT_VARIANTS),
                 })
         elif effect_type == "iceberg":
             self.max_lifetime = 60
@@ -884,20 +2478,16 @@ class AreaEffect:
         if self.effect_type == "meteor" and not self.impact_done:
             if self.age == self.impact_frame:
                 radius = self.size
-                for enemy in game_map.enemies:
+                for enemy in game_map.enemy_index.query_radius(self.x, self.y, radius):
                     ex = enemy.x + enemy.width / 2
-                    ey = enemy.y + enemy.height / 2
-                    if math.hypot(ex - self.x, ey - self.y) <= radius:
-                        max_hp = getattr(enemy, "max_hp", 100)
-                        damage = max(1, int(max_hp * 0.20 * self.damage_multiplier))
+                    max_hp = getattr(enemy, "max_hp", 100)
+                    damage = max(1, int(max_hp * 0.20 * self.damage_multiplier))
 
-                        enemy.hp -= damage
-                        game_map.damage_texts.append(
-                            DamageText(ex, enemy.y, damage, critical=True)
-                        )
+                    enemy.hp -= damage
+                    game_map.damage_texts.add(ex, enemy.y, damage, critical=True)
 
-                        enemy.apply_burn(duration=600, total_damage=120)
-                        enemy.apply_slow(duration=300)
+                    enemy.apply_burn(duration=600, total_damage=120)
+                    enemy.apply_slow(duration=300)
 
                 self.impact_done = True
 
@@ -908,17 +2498,13 @@ class AreaEffect:
                     sy = s["y"]
                     default_base = max(1, int(100 * 0.05 * self.damage_multiplier))
                     last_damage = None
-                    for enemy in game_map.enemies:
+                    for enemy in game_map.enemy_index.query_radius(sx, sy, self.strike_radius):
                         ex = enemy.x + enemy.width / 2
-                        ey = enemy.y + enemy.height / 2
-                        if math.hypot(ex - sx, ey - sy) <= self.strike_radius:
-                            enemy_max_hp = getattr(enemy, "max_hp", 100)
-                            damage = max(1, int(enemy_max_hp * 0.05 * self.damage_multiplier))
-                            last_damage = damage
-                            enemy.hp -= damage
-                            game_map.damage_texts.append(
-                                DamageText(ex, enemy.y, damage)
-                            )
+                        enemy_max_hp = getattr(enemy, "max_hp", 100)
+                        damage = max(1, int(enemy_max_hp * 0.05 * self.damage_multiplier))
+                        last_damage = damage
+                        enemy.hp -= damage
+                        game_map.damage_texts.add(ex, enemy.y, damage)
                     s["hit"] = True
                     base_for_chain = last_damage if last_damage is not None else default_base
                     chain_damage = max(1, int(base_for_chain * 0.6))
@@ -930,415 +2516,238 @@ class AreaEffect:
         elif self.effect_type == "iceberg":
             max_hit_radius = self.size * 1.5
             base_damage = max(1, int(self.base_damage))
-            for enemy in game_map.enemies:
-                ex = enemy.x + enemy.width / 2
-                ey = enemy.y + enemy.height / 2
-                dist = math.hypot(ex - self.x, ey - self.y)
-                if dist <= max_hit_radius:
-                    if id(enemy) not in self.hit_enemies:
-                        enemy.hp -= base_damage
-                        game_map.damage_texts.append(
-                            DamageText(ex, enemy.y, base_damage)
-                        )
-                        enemy.frozen_timer = max(enemy.frozen_timer, self.freeze_time)
-                        enemy.ice_hit_count = 0
-                        self.hit_enemies.add(id(enemy))
+            for enemy in game_map.enemy_index.query_radius(self.x, self.y, max_hit_radius):
+                if id(enemy) not in self.hit_enemies:
+                    ex = enemy.x + enemy.width / 2
+                    enemy.hp -= base_damage
+                    game_map.damage_texts.add(ex, enemy.y, base_damage)
+                    enemy.frozen_timer = max(enemy.frozen_timer, self.freeze_time)
+                    enemy.ice_hit_count = 0
+                    self.hit_enemies.add(id(enemy))
+
+        elif self.effect_type == "backflow" and self.age < self.max_lifetime:
+            self._emit_backflow_drops()
 
         if self.age >= self.max_lifetime:
             self.active = False
 
+    def _animation(self, bake, *params, variant=0):
+        key = (bake.__name__,) + params + (variant,)
+        return _EFFECT_ANIMATIONS.get(key, lambda rng: bake(*params, rng))
+
+    def prebake(self, variant):
+        """draw 가 쓸 애니메이션 중 variant 번째를 미리 굽는다 (마법을 배울 때 호출)."""
+        if self.effect_type == "meteor":
+            self._animation(bake_meteor_head, self.impact_frame, variant=variant)
+            self._animation(bake_meteor_explosion, self.size, self.impact_frame, self.max_lifetime, variant=variant)
+        elif self.effect_type == "thunder":
+            self._animation(bake_thunder_strike, self.strike_radius, self.STRIKE_DURATION, variant=variant)
+            self._animation(bake_thunder_glow, self.size)
+        elif self.effect_type == "iceberg":
+            self._animation(bake_iceberg, self.size, self.max_lifetime, variant=variant)
+
     def draw(self, surface, camera):
         if not self.active:
             return
         cx, cy = camera.apply_pos(self.x, self.y)
 
         if self.effect_type == "meteor":
-            impact_t = self.impact_frame
-            total_t = self.max_lifetime
-            start_pos = self.extra.get("start_pos", (self.x, self.y - 300))
-            sx, sy = camera.apply_pos(start_pos[0], start_pos[1] - 300)
-
-
-            if self.age <= impact_t:
-                flight_t = self.age / impact_t
+            if self.age < self.impact_frame:
+                start_pos = self.extra.get("start_pos", (self.x, self.y - 300))
+                sx, sy = camera.apply_pos(start_pos[0], start_pos[1] - 300)
+                flight_t = self.age / self.impact_frame
                 mx = sx + (cx - sx) * flight_t
                 my = sy + (cy - sy) * flight_t
-                pygame.draw.circle(surface, (255, 180, 0), (int(mx), int(my)), 14)
-                pygame.draw.circle(surface, (255, 80, 0), (int(mx), int(my)), 10)
-                for _ in range(5):
-                    off = random.randint(-8, 8)
-                    pygame.draw.line(
-                        surface, (255, 120, 0),
-                        (int(mx + off), int(my + off)),
-                        (int(mx), int(my + 25)), 2
-                    )
+                anim = self._animation(bake_meteor_head, self.impact_frame, variant=self.variant)
+                item = anim.blit_item(self.age, int(mx), int(my))
+            else:
+                anim = self._animation(bake_meteor_explosion, self.size, self.impact_frame, self.max_lifetime, variant=self.variant)
+                item = anim.blit_item(self.age - self.impact_frame, cx, cy)
+            if item:
+                surface.blit(*item)
+                PROFILER.count("blits")
 
-            # 내가짠거 - 1차 메테오
-            # if self.age >= impact_t:
-            #     explosion_t = (self.age - impact_t) / max(1, (total_t - impact_t))
-            #     explosion_t = max(0.0, min(1.0, explosion_t))
-            #     explosion_r = int(self.size * (0.5 + 0.5 * explosion_t))
-            #     alpha = int(220 * (1 - explosion_t))
-            #     expl_surf = pygame.Surface(
-            #         (explosion_r * 2, explosion_r * 2), pygame.SRCALPHA
-            #     )
-            #     pygame.draw.circle(
-            #         expl_surf, (255, 120, 0, alpha),
-            #         (explosion_r, explosion_r), explosion_r
-            #     )
-            #     pygame.draw.circle(
-            #         expl_surf, (255, 220, 0, alpha),
-            #         (explosion_r, explosion_r), int(explosion_r * 0.7)
-            #     )
-            #     surface.blit(expl_surf, (cx - explosion_r, cy - explosion_r))
-
-            # 이후 Meteor는 GPT
-            if self.age >= impact_t:
-                phase = (self.age - impact_t) / max(1, (total_t - impact_t))
-                phase = max(0.0, min(1.0, phase))
-                base_radius = self.size
-                main_r = int(base_radius * (0.7 + 0.6 * phase))
-                inner_r = int(main_r * 0.55)
-                core_r = int(main_r * 0.3)
-                smoke_r = int(main_r * 1.3)
-                expl_surf = pygame.Surface((main_r * 2, main_r * 2), pygame.SRCALPHA)
-                center = (main_r, main_r)
-
-                smoke_alpha = int(180 * (1 - phase))
-                if smoke_alpha > 0:
-                    pygame.draw.circle(expl_surf, (40, 40, 40, smoke_alpha), center, smoke_r)
-                outer_alpha = int(230 * (1 - phase * 0.7))
-                if outer_alpha > 0:
-                    pygame.draw.circle(expl_surf, (255, 120, 0, outer_alpha), center, main_r)
-                mid_alpha = int(240 * (1 - phase * 0.8))
-                if mid_alpha > 0:
-                    pygame.draw.circle(expl_surf, (255, 220, 0, mid_alpha), center, inner_r)
-                core_alpha = int(255 * (1 - phase))
-                if core_alpha > 0:
-                    pygame.draw.circle(expl_surf, (255, 255, 255, core_alpha), center, core_r)
-
-                surface.blit(expl_surf, (cx - main_r, cy - main_r))
-
-                wave_r = int(base_radius * (0.4 + phase * 1.5))
-                wave_alpha = int(220 * (1 - phase))
-                if wave_alpha > 0 and wave_r > 0:
-                    ring_surf = pygame.Surface((wave_r * 2, wave_r * 2), pygame.SRCALPHA)
-                    pygame.draw.circle(ring_surf, (255, 230, 200, wave_alpha), (wave_r, wave_r), wave_r, width=4)
-                    pygame.draw.circle(ring_surf, (255, 255, 255, min(255, wave_alpha + 20)), (wave_r, wave_r), int(wave_r * 0.85), width=2)
-                    surface.blit(ring_surf, (cx - wave_r, cy - wave_r))
-
-                num_sparks = 26
-                for _ in range(num_sparks):
-                    ang = random.uniform(0, math.tau)
-                    dist = random.uniform(base_radius * 0.3, base_radius * (0.6 + phase * 1.2))
-                    px = cx + math.cos(ang) * dist
-                    py = cy + math.sin(ang) * dist
-                    size = random.randint(2, 4)
-                    spark_alpha = int(255 * (1 - phase))
-                    if spark_alpha <= 0:
-                        continue
-                    pygame.draw.circle(surface, (255, 200, 120, spark_alpha), (int(px), int(py)), size)
-                    pygame.draw.circle(surface, (255, 255, 220, min(255, spark_alpha + 40)), (int(px), int(py)), max(1, size - 1))
-
-                if impact_t <= self.age <= impact_t + 10:
-                    scorch_r = int(base_radius * 1.2)
-                    scorch_surf = pygame.Surface((scorch_r * 2, scorch_r * 2), pygame.SRCALPHA)
-                    pygame.draw.circle(scorch_surf, (20, 10, 5, 140), (scorch_r, scorch_r), scorch_r)
-                    pygame.draw.circle(scorch_surf, (60, 35, 15, 110), (scorch_r, scorch_r), int(scorch_r * 0.6))
-                    surface.blit(scorch_surf, (cx - scorch_r, cy - scorch_r))
-
-        # ----- 천둥: 1차
-        # elif self.effect_type == "thunder":
-        #     strike_duration = 25
-        #     for s in self.strikes:
-        #         if s["start"] <= self.age <= s["start"] + strike_duration:
-        #             sx, sy = camera.apply_pos(s["x"], s["y"])
-        #             height = 260
-        #             top_y = sy - height // 2
-        #             bottom_y = sy + height // 2
-        #             points = []
-        #             segs = 25
-        #             for i in range(segs + 1):
-        #                 ty = top_y + (bottom_y - top_y) * i / segs
-        #                 jitter = random.randint(-8, 8)
-        #                 points.append((sx + jitter, ty))
-        #             pygame.draw.lines(surface, (255, 255, 200), False, points, 4)
-        #             pygame.draw.lines(surface, (255, 255, 255), False, points, 2)
-        #             wave_r = int(self.strike_radius * (self.age - s["start"]) / strike_duration)
-        #             if wave_r > 0:
-        #                 pygame.draw.circle(surface, (255, 255, 180), (sx, sy), wave_r, 2)
-        #     glow_r = int(self.size * 1.1)
-        #     glow_alpha = int(80 + 60 * math.sin(self.age * 0.3))
-        #     glow_surf = pygame.Surface((glow_r * 2, glow_r * 2), pygame.SRCALPHA)
-        #     pygame.draw.circle(glow_surf, (255, 255, 200, max(0, glow_alpha)),
-        #                        (glow_r, glow_r), glow_r, 3)
-        #     surface.blit(glow_surf, (cx - glow_r, cy - glow_r))
-
-        # 이후 번개는 GPT
         elif self.effect_type == "thunder":
-            strike_duration = 25
+            strike_duration = self.STRIKE_DURATION
             dark_alpha = int(110 * (0.5 + 0.5 * math.sin(self.age * 0.25)))
             if dark_alpha > 0:
-                dark_surf = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-                dark_surf.fill((0, 0, 20, dark_alpha))
-                surface.blit(dark_surf, (0, 0))
+                blit_screen_tint(surface, (0, 0, 20), dark_alpha)
 
+            items = []
             for s in self.strikes:
                 if s["start"] <= self.age <= s["start"] + strike_duration:
+                    anim = self._animation(bake_thunder_strike, self.strike_radius, strike_duration, variant=s["variant"])
                     sx, sy = camera.apply_pos(s["x"], s["y"])
-                    height = 300
-                    top_y = sy - height // 2
-                    bottom_y = sy + height // 2
-
-                    points = []
-                    segs = 18
-                    for i in range(segs + 1):
-                        ty = top_y + (bottom_y - top_y) * i / segs
-                        jitter = random.randint(-14, 14)
-                        points.append((sx + jitter, ty))
-                    if len(points) >= 2:
-                        pygame.draw.lines(surface, (255, 255, 140), False, points, 7)
-                        pygame.draw.lines(surface, (255, 255, 255), False, points, 3)
-
-                    explosion_r = int(self.strike_radius * (self.age - s["start"]) / strike_duration)
-                    if explosion_r > 0:
-                        boom_alpha = int(180 * (1 - (explosion_r / max(1, self.strike_radius * 1.4))))
-                        boom_surf = pygame.Surface((explosion_r * 2, explosion_r * 2), pygame.SRCALPHA)
-                        pygame.draw.circle(boom_surf, (255, 240, 150, boom_alpha), (explosion_r, explosion_r), explosion_r)
-                        pygame.draw.circle(boom_surf, (255, 255, 255, int(boom_alpha * 0.7)), (explosion_r, explosion_r), int(explosion_r * 0.6))
-                        surface.blit(boom_surf, (sx - explosion_r, sy - explosion_r))
-
-                    for _ in range(8):
-                        ang = random.uniform(0, math.tau)
-                        dist = random.uniform(10, 40)
-                        px = sx + math.cos(ang) * dist
-                        py = sy + math.sin(ang) * dist
-                        pygame.draw.line(surface, (255, 255, 180), (sx, sy), (int(px), int(py)), 1)
-
-            glow_r = int(self.size * 1.4)
-            glow_alpha = int(90 + 60 * math.sin(self.age * 0.4))
-            glow_surf = pygame.Surface((glow_r * 2, glow_r * 2), pygame.SRCALPHA)
-            pygame.draw.circle(glow_surf, (200, 240, 255, max(0, glow_alpha)), (glow_r, glow_r), glow_r, 4)
-            surface.blit(glow_surf, (cx - glow_r, cy - glow_r))
-
-        # ----- 빙산: 1차 
-        # elif self.effect_type == "iceberg":
-        #     spike_count = 10
-        #     base_r = self.size * 0.3
-        #     grow_time = self.max_lifetime * (1/3)
-        #     if self.age < grow_time:
-        #         spike_progress = self.age / grow_time
-        #     else:
-        #         spike_progress = 1.0
-        #     spike_len = self.size * 0.7 * spike_progress
-        #     for i in range(spike_count):
-        #         angle = (2 * math.pi / spike_count) * i
-        #         bx = cx + math.cos(angle) * base_r
-        #         by = cy + math.sin(angle) * base_r
-        #         tipx = bx + math.cos(angle) * spike_len
-        #         tipy = by + math.sin(angle) * spike_len * 1.1
-        #         jitter = math.sin(self.age * 0.2 + i) * 3
-        #         tipy += jitter
-        #         points = [
-        #             (bx - 8 * math.sin(angle), by + 8 * math.cos(angle)),
-        #             (bx + 8 * math.sin(angle), by - 8 * math.cos(angle)),
-        #             (tipx, tipy),
-        #         ]
-        #         pygame.draw.polygon(surface, (180, 240, 255), points)
-        #         pygame.draw.polygon(surface, (220, 255, 255), points, 1)
-        #     pygame.draw.circle(surface, (150, 220, 255), (int(cx), int(cy)),
-        #                        int(self.size * 0.25), 2)
-
-        # 이후 빙산 GPT
+                    item = anim.blit_item(self.age - s["start"], sx, sy)
+                    if item:
+                        items.append(item)
+
+            glow = self._animation(bake_thunder_glow, self.size)
+            item = glow.blit_item(0, cx, cy)
+            if item:
+                glow.sheet.set_alpha(max(0, int(90 + 60 * math.sin(self.age * 0.4))))
+                items.append(item)
+            surface.blits(items, doreturn=False)
+            PROFILER.count("blits", len(items))
+
         elif self.effect_type == "iceberg":
-            phase = self.age / self.max_lifetime
-            phase = max(0.0, min(1.0, phase))
-            base_r = self.size * 0.35
-            max_spike_len = self.size * 0.9
-            grow_time = self.max_lifetime * (1/3)
-            if self.age < grow_time:
-                spike_progress = self.age / grow_time
-            else:
-                spike_progress = 1.0
-            spike_len_outer = max_spike_len * spike_progress
-            spike_len_inner = spike_len_outer * 0.6
-
-            aura_r = int(self.size * (0.6 + 0.1 * math.sin(self.age * 0.25)))
-            aura_alpha = int(140 * (1 - phase * 0.7))
-            if aura_alpha > 0:
-                aura_surf = pygame.Surface((aura_r * 2, aura_r * 2), pygame.SRCALPHA)
-                center = (aura_r, aura_r)
-                pygame.draw.circle(aura_surf, (80, 180, 255, aura_alpha), center, aura_r)
-                pygame.draw.circle(aura_surf, (200, 245, 255, int(aura_alpha * 0.8)), center, int(aura_r * 0.65))
-                surface.blit(aura_surf, (cx - aura_r, cy - aura_r))
-
-            if phase < 0.6:
-                crack_r = self.size * 0.85
-                for i in range(7):
-                    ang = (math.tau / 7) * i + math.sin(self.age * 0.1) * 0.15
-                    length = crack_r * (0.6 + 0.4 * random.random())
-                    x1 = cx + math.cos(ang) * 10
-                    y1 = cy + math.sin(ang) * 10
-                    x2 = cx + math.cos(ang) * length
-                    y2 = cy + math.sin(ang) * length
-                    pygame.draw.line(surface, (200, 230, 255), (int(x1), int(y1)), (int(x2), int(y2)), 1)
-
-            inner_count = 10
-            angle_offset = self.age * 0.05
-            for i in range(inner_count):
-                angle = (math.tau / inner_count) * i + angle_offset
-                bx = cx + math.cos(angle) * (base_r * 0.5)
-                by = cy + math.sin(angle) * (base_r * 0.5)
-                tipx = bx + math.cos(angle) * spike_len_inner
-                tipy = by + math.sin(angle) * spike_len_inner * 1.05
-                jitter = math.sin(self.age * 0.3 + i) * 2
-                tipx += math.cos(angle + math.pi/2) * jitter
-                tipy += math.sin(angle + math.pi/2) * jitter
-                points = [
-                    (bx - 6 * math.sin(angle), by + 6 * math.cos(angle)),
-                    (bx + 6 * math.sin(angle), by - 6 * math.cos(angle)),
-                    (tipx, tipy),
-                ]
-                pygame.draw.polygon(surface, (170, 230, 255), points)
-                pygame.draw.polygon(surface, (220, 255, 255), points, 1)
-
-            outer_count = 12
-            for i in range(outer_count):
-                angle = (math.tau / outer_count) * i - angle_offset * 0.7
-                bx = cx + math.cos(angle) * (base_r * 1.0)
-                by = cy + math.sin(angle) * (base_r * 1.0)
-                tipx = bx + math.cos(angle) * spike_len_outer
-                tipy = by + math.sin(angle) * spike_len_outer * 1.1
-                swing = math.sin(self.age * 0.2 + i * 0.5) * 4
-                tipx += math.cos(angle + math.pi/2) * swing
-                tipy += math.sin(angle + math.pi/2) * swing
-                points = [
-                    (bx - 9 * math.sin(angle), by + 9 * math.cos(angle)),
-                    (bx + 9 * math.sin(angle), by - 9 * math.cos(angle)),
-                    (tipx, tipy),
-                ]
-                pygame.draw.polygon(surface, (150, 210, 255), points)
-                pygame.draw.polygon(surface, (230, 255, 255), points, 1)
-
-            core_r = int(self.size * 0.3)
-            pygame.draw.circle(surface, (160, 220, 255), (int(cx), int(cy)), core_r, 2)
-            pygame.draw.circle(surface, (220, 250, 255), (int(cx), int(cy)), int(core_r * 0.55), 1)
-
-            flake_count = 24
-            for _ in range(flake_count):
-                ang = random.uniform(0, math.tau)
-                dist = random.uniform(self.size * 0.1, self.size * 1.4)
-                fx = cx + math.cos(ang) * dist
-                fy = cy + math.sin(ang) * dist - phase * 10
-                size = random.randint(1, 3)
-                alpha = int(220 * (1 - phase * 0.9))
-                if alpha <= 0:
-                    continue
-                pygame.draw.circle(surface, (230, 240, 255), (int(fx), int(fy)), size)
-                if size >= 2:
-                    pygame.draw.circle(surface, (255, 255, 255), (int(fx), int(fy)), size - 1)
-
-        # ----- 역류: 1차
-        # elif self.effect_type == "backflow":
-        #     origin, direction, half_angle = self.extra
-        #     ox, oy = camera.apply_pos(origin[0], origin[1])
-        #     if direction == (0, 0):
-        #         base_angle = 0.0
-        #     else:
-        #         base_angle = math.atan2(direction[1], direction[0])
-        #     left_angle = base_angle - half_angle
-        #     right_angle = base_angle + half_angle
-        #     length = self.size * (0.6 + 0.4 * (self.age / self.max_lifetime))
-        #     p0 = (ox, oy)
-        #     p1 = (ox + math.cos(left_angle) * length, oy + math.sin(left_angle) * length)
-        #     p2 = (ox + math.cos(right_angle) * length, oy + math.sin(right_angle) * length)
-        #     wave_surf = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        #     pygame.draw.polygon(wave_surf, (0, 120, 255, 110), [p0, p1, p2])
-        #     pygame.draw.polygon(wave_surf, (200, 240, 255, 90), [p0, p1, p2])
-        #     surface.blit(wave_surf, (0, 0))
-        #     for k in range(4):
-        #         f = (k + self.age * 0.3) / 6
-        #         wf = f * length
-        #         px = ox + math.cos(base_angle) * wf
-        #         py = oy + math.sin(base_angle) * wf
-        #         pygame.draw.circle(surface, (180, 220, 255), (int(px), int(py)), 4)
-
-        # 이후 역류 GPT
+            anim = self._animation(bake_iceberg, self.size, self.max_lifetime, variant=self.variant)
+            item = anim.blit_item(self.age, cx, cy)
+            if item:
+                surface.blit(*item)
+                PROFILER.count("blits")
+
         elif self.effect_type == "backflow":
-            origin, direction, half_angle = self.extra
-            ox, oy = camera.apply_pos(origin[0], origin[1])
-            if direction == (0, 0):
-                base_angle = 0.0
-            else:
-                base_angle = math.atan2(direction[1], direction[0])
-
-            t = self.age / self.max_lifetime
-            t = max(0.0, min(1.0, t))
-            max_len = self.size
-            length = max_len * (0.7 + 0.3 * t)
-            left_angle = base_angle - half_angle
-            right_angle = base_angle + half_angle
-
-            cone_surf = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-
-            outer_color = (0, 80, 180, 110)
-            inner_color = (0, 170, 255, 180)
-            p0 = (ox, oy)
-            p1 = (ox + math.cos(left_angle) * length, oy + math.sin(left_angle) * length)
-            p2 = (ox + math.cos(right_angle) * length, oy + math.sin(right_angle) * length)
-            pygame.draw.polygon(cone_surf, outer_color, [p0, p1, p2])
-
-            inner_half_angle = half_angle * 0.55
-            il = base_angle - inner_half_angle
-            ir = base_angle + inner_half_angle
-            inner_len = length * 0.9
-            ip1 = (ox + math.cos(il) * inner_len, oy + math.sin(il) * inner_len)
-            ip2 = (ox + math.cos(ir) * inner_len, oy + math.sin(ir) * inner_len)
-            pygame.draw.polygon(cone_surf, inner_color, [p0, ip1, ip2])
-
-            edge_color = (200, 240, 255, 230)
-            pygame.draw.line(cone_surf, edge_color, p0, p1, 4)
-            pygame.draw.line(cone_surf, edge_color, p0, p2, 4)
-
-            ring_count = 5
-            for i in range(ring_count):
-                f = (i + t * 3) / ring_count
-                r = length * f
-                if r < 15 or r > length:
-                    continue
-                segs = 20
-                for j in range(segs):
-                    ang = il + (ir - il) * (j / segs)
-                    jitter = math.sin(t * 10 + j * 0.5) * 3
-                    px = ox + math.cos(ang) * (r + jitter)
-                    py = oy + math.sin(ang) * (r + jitter)
-                    alpha = int(150 * (1 - f))
-                    pygame.draw.circle(cone_surf, (180, 230, 255, max(0, alpha)), (int(px), int(py)), 2)
-
-            whirl_r = int(24 + 6 * math.sin(self.age * 0.5))
-            pygame.draw.circle(cone_surf, (0, 110, 230, 230), (int(ox), int(oy)), whirl_r, 3)
-            pygame.draw.circle(cone_surf, (210, 245, 255, 210), (int(ox), int(oy)), int(whirl_r * 0.6), 2)
-
-            drop_count = 18
-            for _ in range(drop_count):
-                f = random.uniform(0.2, 1.0) * t
-                if f <= 0:
-                    continue
-                r = length * f
-                ang = base_angle + random.uniform(-inner_half_angle * 0.8, inner_half_angle * 0.8)
-                px = ox + math.cos(ang) * r
-                py = oy + math.sin(ang) * r
-                size = random.randint(2, 4)
-                alpha = int(220 * (1 - f))
-                pygame.draw.circle(cone_surf, (180, 230, 255, max(0, alpha)), (int(px), int(py)), size)
+            self._draw_backflow(surface, camera)
+
+    def _backflow_canvas(self, base_angle, half_angle):
+        """부채꼴이 들어가는 크기의 캔버스를 이펙트마다 한 번만 만든다. (캔버스, 캔버스 안의 원점)"""
+        if self._canvas is None:
+            reach = self.size + 8
+            xs, ys = [-32, 32], [-32, 32]
+            for ang in (base_angle - half_angle, base_angle + half_angle):
+                xs.append(math.cos(ang) * reach)
+                ys.append(math.sin(ang) * reach)
+            for k in range(4):
+                ang = k * math.pi / 2
+                if abs((ang - base_angle + math.pi) % math.tau - math.pi) <= half_angle:
+                    xs.append(math.cos(ang) * reach)
+                    ys.append(math.sin(ang) * reach)
+            left, top = math.floor(min(xs)), math.floor(min(ys))
+            size = (math.ceil(max(xs)) - left + 1, math.ceil(max(ys)) - top + 1)
+            self._canvas = pygame.Surface(size, pygame.SRCALPHA)
+            PROFILER.count("surfaces")
+            self._canvas_origin = (-left, -top)
+        return self._canvas, self._canvas_origin
+
+    # ----- 역류: 1차
+    # elif self.effect_type == "backflow":
+    #     origin, direction, half_angle = self.extra
+    #     ox, oy = camera.apply_pos(origin[0], origin[1])
+    #     if direction == (0, 0):
+    #         base_angle = 0.0
+    #     else:
+    #         base_angle = math.atan2(direction[1], direction[0])
+    #     left_angle = base_angle - half_angle
+    #     right_angle = base_angle + half_angle
+    #     length = self.size * (0.6 + 0.4 * (self.age / self.max_lifetime))
+    #     p0 = (ox, oy)
+    #     p1 = (ox + math.cos(left_angle) * length, oy + math.sin(left_angle) * length)
+    #     p2 = (ox + math.cos(right_angle) * length, oy + math.sin(right_angle) * length)
+    #     wave_surf = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+    #     pygame.draw.polygon(wave_surf, (0, 120, 255, 110), [p0, p1, p2])
+    #     pygame.draw.polygon(wave_surf, (200, 240, 255, 90), [p0, p1, p2])
+    #     surface.blit(wave_surf, (0, 0))
+    #     for k in range(4):
+    #         f = (k + self.age * 0.3) / 6
+    #         wf = f * length
+    #         px = ox + math.cos(base_angle) * wf
+    #         py = oy + math.sin(base_angle) * wf
+    #         pygame.draw.circle(surface, (180, 220, 255), (int(px), int(py)), 4)
+    # 이후 역류 GPT
+    def _emit_backflow_drops(self):
+        # 물방울: 스텝마다 6개씩, 3스텝 동안 바깥으로 흘러간다 (부채꼴 모양은 _draw_backflow 와 같다)
+        origin, direction, half_angle = self.extra
+        base_angle = 0.0 if direction == (0, 0) else math.atan2(direction[1], direction[0])
+        t = max(0.0, min(1.0, self.age / self.max_lifetime))
+        length = self.size * (0.7 + 0.3 * t)
+        inner_half_angle = half_angle * 0.55
+        rng = PARTICLES.rng
+        f = rng.uniform(0.2, 1.0, 6) * t
+        f = f[f > 0]
+        if len(f):
+            r = length * f
+            ang = base_angle + rng.uniform(-inner_half_angle * 0.8, inner_half_angle * 0.8, len(f))
+            alpha_level = np.clip(((1 - f) * 4).astype(np.int64), 0, 3)
+            sprite = PARTICLES.kind("water")[alpha_level * 3 + rng.integers(0, 3, len(f))]
+            PARTICLES.emit(origin[0] + np.cos(ang) * r, origin[1] + np.sin(ang) * r, sprite,
+                           vx=np.cos(ang) * 3, vy=np.sin(ang) * 3, life=3)
+
+    def _draw_backflow(self, surface, camera):
+        # 부채꼴은 방향마다 모양이 달라서 방향별로 구우면 시트 하나가 40MB 넘게 든다.
+        # 대신 이 이펙트의 캔버스에 age 가 바뀔 때(시뮬레이션 스텝마다)만 다시 그리고, 화면에는 한 장만 찍는다
+        origin, direction, half_angle = self.extra
+        screen_ox, screen_oy = camera.apply_pos(origin[0], origin[1])
+        cone_surf, (ox, oy) = self._backflow_frame()
+        surface.blit(cone_surf, (screen_ox - ox, screen_oy - oy))
+        PROFILER.count("blits")
+
+        t = max(0.0, min(1.0, self.age / self.max_lifetime))
+        mist_alpha = int(70 * (1 - abs(0.5 - t) * 2))
+        if mist_alpha > 0:
+            blit_screen_tint(surface, (0, 40, 70), mist_alpha)
+
+    def _backflow_frame(self):
+        """지금 age 의 부채꼴과 물결 고리를 캔버스에 그려서 (캔버스, 캔버스 안의 원점). 물방울은 PARTICLES 가 그린다."""
+        origin, direction, half_angle = self.extra
+        if direction == (0, 0):
+            base_angle = 0.0
+        else:
+            base_angle = math.atan2(direction[1], direction[0])
+
+        t = self.age / self.max_lifetime
+        t = max(0.0, min(1.0, t))
+        max_len = self.size
+        length = max_len * (0.7 + 0.3 * t)
+        left_angle = base_angle - half_angle
+        right_angle = base_angle + half_angle
+
+        cone_surf, (ox, oy) = self._backflow_canvas(base_angle, half_angle)
+        if self._canvas_age == self.age:
+            return cone_surf, (ox, oy)
+        self._canvas_age = self.age
+        cone_surf.fill((0, 0, 0, 0))
+
+        outer_color = (0, 80, 180, 110)
+        inner_color = (0, 170, 255, 180)
+        p0 = (ox, oy)
+        p1 = (ox + math.cos(left_angle) * length, oy + math.sin(left_angle) * length)
+        p2 = (ox + math.cos(right_angle) * length, oy + math.sin(right_angle) * length)
+        pygame.draw.polygon(cone_surf, outer_color, [p0, p1, p2])
+
+        inner_half_angle = half_angle * 0.55
+        il = base_angle - inner_half_angle
+        ir = base_angle + inner_half_angle
+        inner_len = length * 0.9
+        ip1 = (ox + math.cos(il) * inner_len, oy + math.sin(il) * inner_len)
+        ip2 = (ox + math.cos(ir) * inner_len, oy + math.sin(ir) * inner_len)
+        pygame.draw.polygon(cone_surf, inner_color, [p0, ip1, ip2])
+
+        edge_color = (200, 240, 255, 230)
+        pygame.draw.line(cone_surf, edge_color, p0, p1, 4)
+        pygame.draw.line(cone_surf, edge_color, p0, p2, 4)
+
+        ring_count = 5
+        for i in range(ring_count):
+            f = (i + t * 3) / ring_count
+            r = length * f
+            if r < 15 or r > length:
+                continue
+            segs = 20
+            for j in range(segs):
+                ang = il + (ir - il) * (j / segs)
+                jitter = math.sin(t * 10 + j * 0.5) * 3
+                px = ox + math.cos(ang) * (r + jitter)
+                py = oy + math.sin(ang) * (r + jitter)
+                alpha = int(150 * (1 - f))
+                pygame.draw.circle(cone_surf, (180, 230, 255, max(0, alpha)), (int(px), int(py)), 2)
+
+        whirl_r = int(24 + 6 * math.sin(self.age * 0.5))
+        pygame.draw.circle(cone_surf, (0, 110, 230, 230), (int(ox), int(oy)), whirl_r, 3)
+        pygame.draw.circle(cone_surf, (210, 245, 255, 210), (int(ox), int(oy)), int(whirl_r * 0.6), 2)
+        return cone_surf, (ox, oy)
+
+
+def effect_prebake_tasks(spells):
+    """spells 중 범위 마법의 이펙트 굽기 목록. 크기는 Player.cast_spell 과 같은 SPELL_AREA_RADIUS 를 쓴다."""
+    effects = [AreaEffect(name, 0, 0, SPELL_AREA_RADIUS[name]) for name in spells if name in SPELL_AREA_RADIUS]
+    return [lambda e=effect, v=variant: e.prebake(v) for variant in range(EFFECT_VARIANTS) for effect in effects]
 
-            mist_alpha = int(70 * (1 - abs(0.5 - t) * 2))
-            if mist_alpha > 0:
-                mist = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-                mist.fill((0, 40, 70, mist_alpha))
-                cone_surf.blit(mist, (0, 0))
 
-            surface.blit(cone_surf, (0, 0))
+def prebake_spell_effects(spells):
+    """마법을 배운 순간에 그 이펙트를 구워서, 처음 쓸 때 전투 중에 멈추지 않게 한다."""
+    for task in effect_prebake_tasks(spells):
+        task()
 
 
 class Spell:
@@ -1474,6 +2883,32 @@ class Spell:
 
 
 
+_FROZEN_OVERLAYS = {}
+
+
+def frozen_overlay(width, height):
+    """얼음 상태 덮개 (반투명 얼음 + 눈꽃). 적 크기마다 한 번만 그린다."""
+    overlay = _FROZEN_OVERLAYS.get((width, height))
+    if overlay is None:
+        overlay = pygame.Surface((width + 10, height + 10), pygame.SRCALPHA)
+        PROFILER.count("surfaces")
+        ice_color = (150, 220, 255, 150)
+        pygame.draw.rect(overlay, ice_color, (0, 0, width + 10, height + 10), 0)
+        for i in range(3):
+            pygame.draw.rect(overlay, (200, 240, 255, 100), (i, i, width + 10 - i*2, height + 10 - i*2), 1)
+        cx = 5 + width / 2
+        cy = 5 + height / 2
+        for angle in range(0, 360, 60):
+            rad = math.radians(angle)
+            x1 = cx + math.cos(rad) * 5
+            y1 = cy + math.sin(rad) * 5
+            x2 = cx + math.cos(rad) * 15
+            y2 = cy + math.sin(rad) * 15
+            pygame.draw.line(overlay, (200, 240, 255), (int(x1), int(y1)), (int(x2), int(y2)), 2)
+        _FROZEN_OVERLAYS[(width, height)] = overlay
+    return overlay
+
+
 class BaseEnemy:
     def __init__(self, x, y):
         self.home_x, self.home_y, self.x, self.y = x, y, x, y
@@ -1518,11 +2953,11 @@ class BaseEnemy:
                 self.hp -= burn['damage_per_tick']
                 burn['last_tick'] = 0
                 if damage_texts is not None:
-                    damage_texts.append(DamageText(
+                    damage_texts.add(
                         self.x + self.width / 2,
                         self.y,
                         burn['damage_per_tick']
-                    ))
+                    )
             if burn['remaining'] <= 0:
                 self.burn_stacks.remove(burn)
 
@@ -1532,6 +2967,16 @@ class BaseEnemy:
             self.slow_timer -= 1
             if self.slow_timer == 0:
                 self.speed = self.original_speed
+        self.emit_status_particles()
+
+    def emit_status_particles(self):
+        # 불꽃/물방울은 시뮬레이션 스텝마다 뿌리고, PARTICLES 가 나중에 한꺼번에 그린다
+        if self.burn_stacks:
+            PARTICLES.emit_around("flame", self.x + self.width / 2, self.y, 1,
+                                  dx=(-10, 10), dy=(0, self.height), vy=-1.0, life=2)
+        if self.slow_timer > 0:
+            PARTICLES.emit_around("drop", self.x + self.width / 2, self.y, 1,
+                                  dx=(-15, 15), dy=(-5, self.height), vy=1.0, life=3)
 
     def _move_towards(self, target_x, target_y, game_map):
         if self.frozen_timer > 0:
@@ -1580,44 +3025,14 @@ class BaseEnemy:
     def draw_level_bar(self,surface,sx,sy):
         if not hasattr(self, "level"):
             return
-        font = get_korean_font(18)
-        text = font.render(f"Lv.{self.level}", True, WHITE)
+        text = render_text(f"Lv.{self.level}", 18, WHITE)
         rect = text.get_rect(midbottom=(sx + self.width // 2, sy - 2))
         surface.blit(text, rect)
 
     def draw_status_effects(self, surface, sx, sy):
-        if self.burn_stacks:
-            for _ in range(2):
-                flame_x = sx + self.width / 2 + random.randint(-10, 10)
-                flame_y = sy + random.randint(0, self.height)
-                flame_size = random.randint(3, 6)
-                pygame.draw.circle(surface, (255, 100, 0), (int(flame_x), int(flame_y)), flame_size)
-                pygame.draw.circle(surface, (255, 200, 0), (int(flame_x), int(flame_y)), max(1, flame_size - 2))
-
+        # 불꽃/물방울 입자는 update_status_effects 에서 뿌린다
         if self.frozen_timer > 0:
-            ice_surf = pygame.Surface((self.width + 10, self.height + 10), pygame.SRCALPHA)
-            ice_color = (150, 220, 255, 150)
-            pygame.draw.rect(ice_surf, ice_color, (0, 0, self.width + 10, self.height + 10), 0)
-            for i in range(3):
-                pygame.draw.rect(ice_surf, (200, 240, 255, 100), (i, i, self.width + 10 - i*2, self.height + 10 - i*2), 1)
-            surface.blit(ice_surf, (sx - 5, sy - 5))
-            cx = sx + self.width / 2
-            cy = sy + self.height / 2
-            for angle in range(0, 360, 60):
-                rad = math.radians(angle)
-                x1 = cx + math.cos(rad) * 5
-                y1 = cy + math.sin(rad) * 5
-                x2 = cx + math.cos(rad) * 15
-                y2 = cy + math.sin(rad) * 15
-                pygame.draw.line(surface, (200, 240, 255), (int(x1), int(y1)), (int(x2), int(y2)), 2)
-
-        if self.slow_timer > 0:
-            for _ in range(3):
-                drop_x = sx + self.width / 2 + random.randint(-15, 15)
-                drop_y = sy + random.randint(-5, self.height)
-                drop_size = random.randint(2, 4)
-                pygame.draw.circle(surface, (100, 150, 255), (int(drop_x), int(drop_y)), drop_size)
-                pygame.draw.circle(surface, (150, 200, 255), (int(drop_x), int(drop_y - 1)), max(1, drop_size - 1))
+            surface.blit(frozen_overlay(self.width, self.height), (sx - 5, sy - 5))
 
     def draw(self, surface, camera):
         sx, sy = camera.apply(self)
@@ -1708,7 +3123,7 @@ class Dummy(BaseEnemy):
 
         font_size = int(14 * self.scale)
         font = get_korean_font(font_size)
-        label = font.render("훈련용", True, (100, 100, 100))
+        label = render_text("훈련용", font_size, (100, 100, 100))
         label_rect = label.get_rect(center=(sx + w / 2, sy + h + font.get_height()))
         surface.blit(label, label_rect)
 
@@ -1733,14 +3148,14 @@ class Slime(BaseEnemy):
         self.enemy_type = "slime"
         self.original_speed = self.speed
         self.stand_frame_index = 0
-        self.stand_last_change_time = pygame.time.get_ticks()
+        self.stand_last_change_time = sim_ticks()
         self.dying = False
         self.death_frame_index = 0
-        self.death_last_change_time = pygame.time.get_ticks()
+        self.death_last_change_time = sim_ticks()
         self.death_finished = False
 
     def update(self, player, game_map, projectiles, damage_texts=None):
-        now = pygame.time.get_ticks()
+        now = sim_ticks()
         if self.dying:
             if SLIME_DIE_FRAMES and len(SLIME_DIE_FRAMES) == len(SLIME_DIE_DELAYS):
                 delay = SLIME_DIE_DELAYS[self.death_frame_index]
@@ -1803,8 +3218,7 @@ class Slime(BaseEnemy):
             draw_color = (100, 255, 100) if self.state == 'chasing' else (0, 150, 150) if self.state == 'returning' else self.color
             pygame.draw.circle(surface, draw_color, (sx + self.width // 2, sy + self.height // 2), self.width // 2)
         # 레벨 표시
-        lvl_font = get_korean_font(18)
-        lvl_text = lvl_font.render(f"LEVEL: {self.level}", True, WHITE)
+        lvl_text = render_text(f"LEVEL: {self.level}", 18, WHITE)
         lvl_rect = lvl_text.get_rect(midbottom=(sx + self.width // 2, sy - 4))
         surface.blit(lvl_text, lvl_rect)
         self.draw_health_bar(surface, sx, sy)
@@ -1913,9 +3327,8 @@ class ItemDrop:
         else:
             pygame.draw.circle(surface, ORANGE, (int(sx), int(sy)), self.radius)
             pygame.draw.circle(surface, YELLOW, (int(sx), int(sy)), self.radius - 4)
-            font = get_korean_font(16)
             short_name = self.item_name[0]
-            text = font.render(short_name, True, BLACK)
+            text = render_text(short_name, 16, BLACK)
             text_rect = text.get_rect(center=(int(sx), int(sy)))
             surface.blit(text, text_rect)
 
@@ -1952,21 +3365,527 @@ class XPOrb:
 
 
 
-class GameMap:
-    def __init__(self, map_name, tiled_map):
-        self.name = map_name
-        self.tiled_map = tiled_map
-        self.enemies = []
-        self.enemies_spawned = False
-        self.portals = self.tiled_map.find_portals()
-        self.respawn_queue = []
-        self.lightning_chains = []
-        self.damage_texts = []
-        self.area_effects = []
-        self.quest_npcs = []
+ENEMY_GRID_CELL = 128
 
 
-class Button:
+class EnemySpatialHash:
+    """적 중심 좌표 기준 균일 격자. 적이 움직이면 update() 로 칸만 옮긴다.
+    칸은 dict 라서 순회 순서가 삽입 순서대로 고정된다."""
+    def __init__(self, cell_size=ENEMY_GRID_CELL):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.enemy_cells = {}
+        self.max_half_size = 0
+
+    def _cell_of(self, enemy):
+        return (
+            int((enemy.x + enemy.width / 2) // self.cell_size),
+            int((enemy.y + enemy.height / 2) // self.cell_size),
+        )
+
+    def insert(self, enemy):
+        key = self._cell_of(enemy)
+        self.cells.setdefault(key, {})[enemy] = None
+        self.enemy_cells[enemy] = key
+        self.max_half_size = max(self.max_half_size, enemy.width / 2, enemy.height / 2)
+
+    def remove(self, enemy):
+        key = self.enemy_cells.pop(enemy, None)
+        if key is None:
+            return
+        cell = self.cells[key]
+        del cell[enemy]
+        if not cell:
+            del self.cells[key]
+
+    def update(self, enemy):
+        key = self._cell_of(enemy)
+        if self.enemy_cells.get(enemy) != key:
+            self.remove(enemy)
+            self.cells.setdefault(key, {})[enemy] = None
+            self.enemy_cells[enemy] = key
+
+    def _in_box(self, min_x, min_y, max_x, max_y):
+        cs = self.cell_size
+        for cy in range(int(min_y // cs), int(max_y // cs) + 1):
+            for cx in range(int(min_x // cs), int(max_x // cs) + 1):
+                cell = self.cells.get((cx, cy))
+                if cell:
+                    yield from cell
+
+    def query_radius(self, x, y, radius):
+        """중심이 (x, y) 에서 radius 이내인 적."""
+        found = []
+        for enemy in self._in_box(x - radius, y - radius, x + radius, y + radius):
+            ex = enemy.x + enemy.width / 2
+            ey = enemy.y + enemy.height / 2
+            if math.hypot(ex - x, ey - y) <= radius:
+                found.append(enemy)
+        return found
+
+    def hit_test(self, x, y, radius):
+        """반지름 radius 인 원과 몸통(폭/2 원)이 겹치는 첫 번째 적. 없으면 None."""
+        reach = radius + self.max_half_size
+        for enemy in self._in_box(x - reach, y - reach, x + reach, y + reach):
+            if math.hypot(x - (enemy.x + enemy.width / 2), y - (enemy.y + enemy.height / 2)) < radius + enemy.width / 2:
+                return enemy
+        return None
+
+    def query_cone(self, ox, oy, dir_x, dir_y, max_range, half_angle):
+        """(ox, oy) 에서 (dir_x, dir_y) 방향, 반각 half_angle 부채꼴 안의 적 (원점과 겹친 적은 제외)."""
+        found = []
+        for enemy in self._in_box(ox - max_range, oy - max_range, ox + max_range, oy + max_range):
+            vx = enemy.x + enemy.width / 2 - ox
+            vy = enemy.y + enemy.height / 2 - oy
+            dist = math.hypot(vx, vy)
+            if dist <= 0 or dist > max_range:
+                continue
+            dot = max(-1.0, min(1.0, (vx / dist) * dir_x + (vy / dist) * dir_y))
+            if math.acos(dot) <= half_angle:
+                found.append(enemy)
+        return found
+
+    def _ring(self, ccx, ccy, ring):
+        if ring == 0:
+            yield ccx, ccy
+            return
+        for cx in range(ccx - ring, ccx + ring + 1):
+            yield cx, ccy - ring
+            yield cx, ccy + ring
+        for cy in range(ccy - ring + 1, ccy + ring):
+            yield ccx - ring, cy
+            yield ccx + ring, cy
+
+    def nearest(self, x, y, max_dist=float("inf"), predicate=None):
+        """max_dist 보다 가까운 적 중 가장 가까운 것. 가운데 칸부터 고리 모양으로 넓혀가며 찾는다."""
+        if not self.cells:
+            return None
+        cs = self.cell_size
+        ccx, ccy = int(x // cs), int(y // cs)
+        if math.isinf(max_dist):
+            max_ring = max(max(abs(kx - ccx), abs(ky - ccy)) for kx, ky in self.cells)
+        else:
+            max_ring = int(max_dist // cs) + 1
+        best, best_dist = None, max_dist
+        for ring in range(max_ring + 1):
+            # 이 고리 안의 점은 최소 (ring - 1) 칸 거리만큼 떨어져 있음
+            if best is not None and (ring - 1) * cs >= best_dist:
+                break
+            for key in self._ring(ccx, ccy, ring):
+                cell = self.cells.get(key)
+                if not cell:
+                    continue
+                for enemy in cell:
+                    if predicate is not None and not predicate(enemy):
+                        continue
+                    dist = math.hypot(enemy.x + enemy.width / 2 - x, enemy.y + enemy.height / 2 - y)
+                    if dist < best_dist:
+                        best, best_dist = enemy, dist
+        return best
+
+ENEMY_STATES = ('waiting', 'chasing', 'returning')
+ENEMY_STATE_CODES = {name: i for i, name in enumerate(ENEMY_STATES)}
+ENEMY_MAX_BURN_STACKS = 8
+
+
+class _ArrayEnemyMixin:
+    """EnemyArrays.attach() 가 클래스를 바꿔 끼우는 뷰. 그리기/드롭 코드는 그대로 쓴다.
+    값은 평범한 속성으로도 들고 있어서 그리기/공간 해시/충돌/보간 코드가 읽을 때는 객체 모드와 똑같다.
+    밖에서 ARRAY_FIELDS 를 쓰면 dirty 에 적어뒀다가 step() 이 시작할 때 한꺼번에 배열로 옮긴다."""
+    ARRAY_FIELDS = frozenset((
+        "x", "y", "home_x", "home_y", "width", "height", "speed", "original_speed",
+        "max_hp", "hp", "damage", "attack_cooldown", "attack_range", "aggro_radius", "leash_radius",
+        "ice_hit_count", "frozen_timer", "slow_timer", "state",
+    ))
+
+    def __setattr__(self, name, value):
+        if name in self.ARRAY_FIELDS:
+            self._store.dirty.add((self._slot, name))
+        object.__setattr__(self, name, value)
+
+    @property
+    def burn_stacks(self):
+        """화상 칸의 읽기 전용 사본(tuple). 추가는 apply_burn(), 진행은 EnemyArrays.step() 이 한다."""
+        return tuple(self._store.burn_snapshot(self._slot))
+
+    @burn_stacks.setter
+    def burn_stacks(self, value):
+        raise TypeError("EnemyArrays 에 붙은 적의 burn_stacks 는 바꿀 수 없습니다 (apply_burn() 을 쓰세요)")
+
+    def apply_burn(self, duration=600, total_damage=50):
+        self._store.add_burn(self._slot, duration, total_damage / (duration / 30))
+
+    def update_status_effects(self, damage_texts=None):
+        raise TypeError("EnemyArrays 에 붙은 적의 상태이상은 EnemyArrays.step() 이 진행합니다")
+
+
+class ArrayBaseEnemy(_ArrayEnemyMixin, BaseEnemy):
+    pass
+
+
+class ArraySlime(_ArrayEnemyMixin, Slime):
+    ARRAY_FIELDS = _ArrayEnemyMixin.ARRAY_FIELDS | {
+        "dying", "death_finished", "death_frame_index", "death_last_change_time",
+        "stand_frame_index", "stand_last_change_time",
+    }
+
+
+class ArrayDummy(_ArrayEnemyMixin, Dummy):
+    ARRAY_FIELDS = _ArrayEnemyMixin.ARRAY_FIELDS | {"hp_regen_rate", "hp_regen_counter"}
+
+
+class EnemyArrays:
+    """적 시뮬레이션 값을 필드별 numpy 배열로 들고 있는 저장소 (struct-of-arrays).
+    step() 한 번으로 화면 근처 적 전체의 상태이상/AI/이동/공격/애니메이션을 계산한다.
+    붙은 적 객체는 ArraySlime/ArrayDummy 뷰가 된다. 속성 값은 뷰에도 그대로 있고, step() 이
+    밖에서 바뀐 칸(dirty)을 배열로 가져온 뒤 계산하고, 값이 바뀐 칸만 뷰 속성에 돌려놓는다."""
+    KIND_BASE, KIND_SLIME, KIND_DUMMY = 0, 1, 2
+    VIEW_CLASSES = {BaseEnemy: (ArrayBaseEnemy, KIND_BASE), Slime: (ArraySlime, KIND_SLIME), Dummy: (ArrayDummy, KIND_DUMMY)}
+    FIELDS = {
+        "x": np.float64, "y": np.float64, "home_x": np.float64, "home_y": np.float64,
+        "width": np.int32, "height": np.int32,
+        "speed": np.float64, "original_speed": np.float64,
+        "max_hp": np.int64, "hp": np.float64, "damage": np.int64,
+        "attack_cooldown": np.int32, "attack_range": np.float64,
+        "aggro_radius": np.float64, "leash_radius": np.float64,
+        "ice_hit_count": np.int32, "frozen_timer": np.int32, "slow_timer": np.int32,
+        "state": np.int8,
+        "dying": np.bool_, "death_finished": np.bool_,
+        "death_frame_index": np.int32, "death_last_change_time": np.int64,
+        "stand_frame_index": np.int32, "stand_last_change_time": np.int64,
+        "hp_regen_rate": np.int64, "hp_regen_counter": np.int32,
+    }
+
+    def __init__(self, capacity=64):
+        self.capacity = 0
+        self.size = 0
+        self.free_slots = []
+        self.views = []
+        self.arrays = {}
+        self.dirty = set()
+        self.used = np.zeros(0, dtype=np.bool_)
+        self.kind = np.zeros(0, dtype=np.int8)
+        self.cell_x = np.zeros(0, dtype=np.int64)
+        self.cell_y = np.zeros(0, dtype=np.int64)
+        self.burn_remaining = np.zeros((0, ENEMY_MAX_BURN_STACKS), dtype=np.int32)
+        self.burn_last_tick = np.zeros((0, ENEMY_MAX_BURN_STACKS), dtype=np.int32)
+        self.burn_damage = np.zeros((0, ENEMY_MAX_BURN_STACKS), dtype=np.float64)
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        def grown(arr):
+            out = np.zeros((capacity,) + arr.shape[1:], dtype=arr.dtype)
+            out[:len(arr)] = arr
+            return out
+        for name, dtype in self.FIELDS.items():
+            self.arrays[name] = grown(self.arrays.get(name, np.zeros(0, dtype=dtype)))
+        self.used = grown(self.used)
+        self.kind = grown(self.kind)
+        self.cell_x = grown(self.cell_x)
+        self.cell_y = grown(self.cell_y)
+        self.burn_remaining = grown(self.burn_remaining)
+        self.burn_last_tick = grown(self.burn_last_tick)
+        self.burn_damage = grown(self.burn_damage)
+        self.views.extend([None] * (capacity - self.capacity))
+        self.capacity = capacity
+
+    def supports(self, enemy):
+        return type(enemy) in self.VIEW_CLASSES
+
+    def get(self, name, slot):
+        value = self.arrays[name][slot]
+        if name == "state":
+            return ENEMY_STATES[value]
+        return value.item()
+
+    def set(self, name, slot, value):
+        if name == "state":
+            value = ENEMY_STATE_CODES[value]
+        self.arrays[name][slot] = value
+
+    def attach(self, enemy, cell):
+        """enemy 의 값을 빈 칸으로 옮기고 뷰 클래스로 바꾼다."""
+        view_cls, kind = self.VIEW_CLASSES[type(enemy)]
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            if self.size >= self.capacity:
+                self._grow(self.capacity * 2)
+            slot = self.size
+            self.size += 1
+        values = enemy.__dict__
+        for name in self.FIELDS:
+            if name in values:
+                self.set(name, slot, values[name])
+            else:
+                self.arrays[name][slot] = 0
+                if name in view_cls.ARRAY_FIELDS:
+                    values[name] = self.get(name, slot)
+        self.burn_remaining[slot] = 0
+        for burn in values.pop("burn_stacks", [])[-ENEMY_MAX_BURN_STACKS:]:
+            self.add_burn(slot, burn['remaining'], burn['damage_per_tick'], burn['last_tick'])
+        self.used[slot] = True
+        self.kind[slot] = kind
+        self.cell_x[slot], self.cell_y[slot] = cell
+        self.views[slot] = enemy
+        values["_store"], values["_slot"] = self, slot
+        enemy.__class__ = view_cls
+
+    def detach(self, enemy):
+        """attach 의 반대. 값을 객체로 돌려주고 원래 클래스로 되돌린다."""
+        slot = enemy._slot
+        base_cls = next(cls for cls, (view_cls, _) in self.VIEW_CLASSES.items() if view_cls is type(enemy))
+        # 속성은 뷰가 이미 최신으로 들고 있다. 화상만 배열에서 꺼내 준다
+        burn_stacks = self.burn_snapshot(slot)
+        enemy.__class__ = base_cls
+        del enemy.__dict__["_store"], enemy.__dict__["_slot"]
+        enemy.burn_stacks = burn_stacks
+        self.used[slot] = False
+        self.burn_remaining[slot] = 0
+        self.views[slot] = None
+        self.free_slots.append(slot)
+
+    def add_burn(self, slot, remaining, damage_per_tick, last_tick=0):
+        """빈 화상 칸에 넣는다. 칸이 다 찼으면 남은 시간이 가장 짧은 것을 덮어쓴다."""
+        row = self.burn_remaining[slot]
+        empty = np.flatnonzero(row <= 0)
+        k = empty[0] if len(empty) else int(np.argmin(row))
+        self.burn_remaining[slot, k] = remaining
+        self.burn_damage[slot, k] = damage_per_tick
+        self.burn_last_tick[slot, k] = last_tick
+
+    def burn_snapshot(self, slot):
+        return [
+            {'remaining': int(self.burn_remaining[slot, k]), 'damage_per_tick': float(self.burn_damage[slot, k]),
+             'tick_interval': 30, 'last_tick': int(self.burn_last_tick[slot, k])}
+            for k in np.flatnonzero(self.burn_remaining[slot] > 0)
+        ]
+
+    def _pull_dirty(self):
+        """지난 step() 뒤로 밖에서 쓴 속성(주문 피해, 보간 등)을 배열로 옮긴다."""
+        views = self.views
+        for slot, name in self.dirty:
+            view = views[slot]
+            if view is not None:
+                self.set(name, slot, view.__dict__[name])
+        self.dirty.clear()
+
+    def _push_changed(self, before, n):
+        """step() 이 값을 바꾼 칸만 뷰 속성으로 돌려놓는다 (dirty 로 적히지 않게 __dict__ 에 바로)."""
+        views = self.views
+        for name, arr in self.arrays.items():
+            current = arr[:n]
+            changed = np.flatnonzero(current != before[name])
+            if not len(changed):
+                continue
+            values = current[changed].tolist()
+            if name == "state":
+                values = [ENEMY_STATES[v] for v in values]
+            for i, value in zip(changed.tolist(), values):
+                views[i].__dict__[name] = value
+
+    def step(self, player, tiled_map, camera, damage_texts, enemy_index, margin=180):
+        """화면 근처(margin) 적 전체를 한 프레임 진행한다. 규칙은 Slime.update / Dummy.update 와 같다."""
+        if self.dirty:
+            self._pull_dirty()
+        n = self.size
+        if n == 0:
+            return
+        a = {name: arr[:n] for name, arr in self.arrays.items()}
+        x, y, w, h = a["x"], a["y"], a["width"], a["height"]
+        kind = self.kind[:n]
+        now = sim_ticks()
+
+        # is_on_screen 과 같은 판정 (Rect 는 정수로 잘림)
+        left, top = np.trunc(x).astype(np.int64), np.trunc(y).astype(np.int64)
+        view_l, view_t = camera.x - margin, camera.y - margin
+        view_r, view_b = view_l + WIDTH + margin * 2, view_t + HEIGHT + margin * 2
+        active = self.used[:n] & (left < view_r) & (view_l < left + w) & (top < view_b) & (view_t < top + h) & (w > 0) & (h > 0)
+        if not active.any():
+            return
+        before = {name: arr.copy() for name, arr in a.items()}
+
+        slime = kind == self.KIND_SLIME
+        dummy = kind == self.KIND_DUMMY
+
+        # 죽는 중인 슬라임은 애니메이션만
+        dying = active & slime & a["dying"]
+        if dying.any():
+            if SLIME_DIE_FRAMES and len(SLIME_DIE_FRAMES) == len(SLIME_DIE_DELAYS):
+                frame = a["death_frame_index"]
+                delays = np.asarray(SLIME_DIE_DELAYS)[np.minimum(frame, len(SLIME_DIE_DELAYS) - 1)]
+                advance = dying & (now - a["death_last_change_time"] >= delays)
+                a["death_last_change_time"][advance] = now
+                frame[advance] += 1
+                a["death_finished"][advance & (frame >= len(SLIME_DIE_FRAMES))] = True
+            else:
+                a["death_finished"][dying] = True
+        live = active & ~dying
+
+        # 상태이상
+        burning = live[:, None] & (self.burn_remaining[:n] > 0)
+        if burning.any():
+            remaining, last_tick = self.burn_remaining[:n], self.burn_last_tick[:n]
+            remaining[burning] -= 1
+            last_tick[burning] += 1
+            ticks = burning & (last_tick >= 30)
+            if ticks.any():
+                burn_damage = self.burn_damage[:n]
+                a["hp"][:] -= np.where(ticks, burn_damage, 0.0).sum(axis=1)
+                last_tick[ticks] = 0
+                if damage_texts is not None:
+                    for i, k in zip(*np.nonzero(ticks)):
+                        damage_texts.add(x[i] + w[i] / 2, y[i], float(burn_damage[i, k]))
+        frozen = a["frozen_timer"]
+        frozen[live & (frozen > 0)] -= 1
+        slow = a["slow_timer"]
+        slowed = live & (slow > 0)
+        slow[slowed] -= 1
+        recovered = slowed & (slow == 0)
+        a["speed"][recovered] = a["original_speed"][recovered]
+        # BaseEnemy.emit_status_particles 와 같은 입자
+        burning_now = live & (self.burn_remaining[:n] > 0).any(axis=1)
+        slowed_now = live & (slow > 0)
+        for i in np.flatnonzero(burning_now | slowed_now).tolist():
+            cx = x[i] + w[i] / 2
+            if burning_now[i]:
+                PARTICLES.emit_around("flame", cx, y[i], 1, dx=(-10, 10), dy=(0, h[i]), vy=-1.0, life=2)
+            if slowed_now[i]:
+                PARTICLES.emit_around("drop", cx, y[i], 1, dx=(-15, 15), dy=(-5, h[i]), vy=1.0, life=3)
+
+        # 허수아비: 체력 회복
+        regen = live & dummy
+        if regen.any():
+            counter, hp = a["hp_regen_counter"], a["hp"]
+            counter[regen] += 1
+            heal = regen & (counter >= 3)
+            hp[heal] = np.minimum(a["max_hp"][heal], hp[heal] + a["hp_regen_rate"][heal])
+            counter[heal] = 0
+            hp[regen & (hp < 1)] = 1
+
+        ai = live & ~dummy
+        if ai.any():
+            self._step_ai(ai, a, player, tiled_map)
+
+        # 체력이 다 된 슬라임은 죽는 애니메이션 시작, 나머지는 서 있는 애니메이션
+        walking = ai & slime
+        dead = walking & (a["hp"] <= 0)
+        a["dying"][dead] = True
+        a["death_frame_index"][dead] = 0
+        a["death_last_change_time"][dead] = now
+        standing = walking & ~dead
+        if standing.any() and SLIME_STAND_FRAMES and len(SLIME_STAND_FRAMES) == len(SLIME_STAND_DELAYS):
+            frame = a["stand_frame_index"]
+            delays = np.asarray(SLIME_STAND_DELAYS)[frame % len(SLIME_STAND_DELAYS)]
+            advance = standing & (now - a["stand_last_change_time"] >= delays)
+            a["stand_last_change_time"][advance] = now
+            frame[advance] = (frame[advance] + 1) % len(SLIME_STAND_FRAMES)
+
+        self._push_changed(before, n)
+
+        # 칸이 바뀐 적만 공간 해시에 다시 넣는다
+        cs = enemy_index.cell_size
+        cell_x = np.floor((x + w / 2) / cs).astype(np.int64)
+        cell_y = np.floor((y + h / 2) / cs).astype(np.int64)
+        moved = active & ((cell_x != self.cell_x[:n]) | (cell_y != self.cell_y[:n]))
+        for i in np.flatnonzero(moved):
+            enemy_index.update(self.views[i])
+        self.cell_x[:n][moved] = cell_x[moved]
+        self.cell_y[:n][moved] = cell_y[moved]
+
+    def _step_ai(self, ai, a, player, tiled_map):
+        x, y, state = a["x"], a["y"], a["state"]
+        px, py = player.x, player.y
+        dist_to_player = np.hypot(x - px, y - py)
+        dist_to_home = np.hypot(x - a["home_x"], y - a["home_y"])
+
+        cooldown = a["attack_cooldown"]
+        cooldown[ai & (cooldown > 0)] -= 1
+
+        waiting = ai & (state == ENEMY_STATE_CODES['waiting'])
+        chasing = ai & (state == ENEMY_STATE_CODES['chasing'])
+        returning = ai & (state == ENEMY_STATE_CODES['returning'])
+        aggro = waiting & (dist_to_player < a["aggro_radius"])
+        give_up = chasing & ((dist_to_home > a["leash_radius"]) | (dist_to_player > a["aggro_radius"] * 1.2))
+        chase = chasing & ~give_up
+        state[aggro] = ENEMY_STATE_CODES['chasing']
+        state[give_up] = ENEMY_STATE_CODES['returning']
+
+        # _move_towards: x 먼저, 그 다음 옮겨진 x 로 y
+        speed = a["speed"]
+        target_x = np.where(chase, px, a["home_x"])
+        target_y = np.where(chase, py, a["home_y"])
+        dx, dy = target_x - x, target_y - y
+        dist = np.hypot(dx, dy)
+        movable = (chase | returning) & (a["frozen_timer"] <= 0) & (dist > speed)
+        idx = np.flatnonzero(movable)
+        if len(idx):
+            vx = dx[idx] / dist[idx] * speed[idx]
+            vy = dy[idx] / dist[idx] * speed[idx]
+            w, h = a["width"][idx], a["height"][idx]
+            if tiled_map is not None:
+                ok_x = ~tiled_map.rects_blocked(x[idx] + vx, y[idx], w, h)
+            else:
+                ok_x = np.ones(len(idx), dtype=np.bool_)
+            x[idx[ok_x]] += vx[ok_x]
+            if tiled_map is not None:
+                ok_y = ~tiled_map.rects_blocked(x[idx], y[idx] + vy, w, h)
+            else:
+                ok_y = np.ones(len(idx), dtype=np.bool_)
+            y[idx[ok_y]] += vy[ok_y]
+
+        home = returning & (dist < speed)
+        x[home], y[home] = a["home_x"][home], a["home_y"][home]
+        a["hp"][home] = a["max_hp"][home]
+        state[home] = ENEMY_STATE_CODES['waiting']
+
+        attackers = chase & (a["frozen_timer"] <= 0) & (cooldown <= 0) & (np.hypot(x - px, y - py) < a["attack_range"])
+        if attackers.any():
+            player.hp -= int(a["damage"][attackers].sum())
+            cooldown[attackers] = 60
+
+
+
+class GameMap:
+    def __init__(self, map_name, tiled_map, enemy_backend=None):
+        self.name = map_name
+        self.tiled_map = tiled_map
+        self.enemies = []
+        self.enemy_index = EnemySpatialHash()
+        self.enemy_store = EnemyArrays() if (enemy_backend or ENEMY_BACKEND) == "arrays" else None
+        self.enemies_spawned = False
+        self.portals = self.tiled_map.find_portals()
+        self.respawn_queue = []
+        self.lightning_chains = []
+        self.damage_texts = DamageTextPool()
+        self.area_effects = []
+        self.quest_npcs = []
+
+    def add_enemy(self, enemy):
+        self.enemies.append(enemy)
+        self.enemy_index.insert(enemy)
+        if self.enemy_store is not None and self.enemy_store.supports(enemy):
+            self.enemy_store.attach(enemy, self.enemy_index.enemy_cells[enemy])
+
+    def remove_enemy(self, enemy):
+        self.enemies.remove(enemy)
+        self.enemy_index.remove(enemy)
+        if getattr(enemy, "_store", None) is self.enemy_store and self.enemy_store is not None:
+            self.enemy_store.detach(enemy)
+
+    def update_enemies(self, player, camera, projectiles):
+        """화면 근처 적만 진행. arrays 백엔드면 붙은 적은 EnemyArrays.step() 한 번으로 처리한다."""
+        if self.enemy_store is not None:
+            self.enemy_store.step(player, self.tiled_map, camera, self.damage_texts, self.enemy_index)
+        for enemy in self.enemies:
+            if "_store" in enemy.__dict__:
+                continue
+            if is_on_screen(enemy, camera, margin=180):
+                enemy.update(player, self.tiled_map, projectiles, self.damage_texts)
+                self.enemy_index.update(enemy)
+
+
+class Button:
     def __init__(self, x, y, w, h, text, color, hover_color):
         self.rect, self.text, self.color, self.hover_color = pygame.Rect(x, y, w, h), text, color, hover_color
         self.is_hovered = False
@@ -1974,7 +3893,7 @@ class Button:
     def draw(self, surface):
         pygame.draw.rect(surface, self.hover_color if self.is_hovered else self.color, self.rect)
         pygame.draw.rect(surface, WHITE, self.rect, 3)
-        text_surf = get_korean_font(36).render(self.text, True, WHITE)
+        text_surf = render_text(self.text, 36, WHITE)
         surface.blit(text_surf, text_surf.get_rect(center=self.rect.center))
 
     def check_hover(self, pos):
@@ -2004,17 +3923,31 @@ def distance_between(a, b):
     return math.hypot(ax - bx, ay - by)
 
 
-def show_splash_screen(duration_ms=3000):
+def draw_loading_progress(surface, done, total):
+    """스플래시 아래쪽 에셋 로딩 진행 바."""
+    if total <= 0:
+        return
+    # start.png 아래쪽 캐릭터 그림을 가리지 않게 화면 맨 아래에 얇게
+    rect = pygame.Rect(WIDTH // 2 - 300, HEIGHT - 26, 600, 12)
+    pygame.draw.rect(surface, DARK_GRAY, rect)
+    pygame.draw.rect(surface, CYAN, (rect.x, rect.y, int(rect.w * done / total), rect.h))
+    pygame.draw.rect(surface, WHITE, rect, 1)
+    # 숫자가 매 프레임 바뀌니 글자 캐시(render_text)는 안 쓴다
+    text = get_korean_font(16).render(f"불러오는 중... {done}/{total}", True, WHITE)
+    surface.blit(text, text.get_rect(midright=(rect.x - 12, rect.centery)))
+
+
+def show_splash_screen(duration_ms=3000, tasks=None):
     splash = None
     splash_path = os.path.join("img", "start.png")
-    if os.path.exists(splash_path):
-        try:
-            img = pygame.image.load(splash_path).convert_alpha()
-            splash = pygame.transform.scale(img, (WIDTH, HEIGHT))
-        except Exception as e:
-            print(f"start.png 이상함")
+    # 첫 프레임은 바로 띄우고, 스플래시 그림은 에셋 스레드가 디코딩하는 대로 다음 프레임부터 쓴다
+    splash_pending = os.path.exists(splash_path)
+    tasks = list(tasks or [])
+    total_tasks = len(tasks)
     start_time = pygame.time.get_ticks()
-    while pygame.time.get_ticks() - start_time < duration_ms:
+    first_frame = True
+    # 할 일이 남아 있으면 duration_ms 가 지나도 다 끝날 때까지 스플래시를 유지
+    while pygame.time.get_ticks() - start_time < duration_ms or tasks:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
@@ -2023,15 +3956,31 @@ def show_splash_screen(duration_ms=3000):
             screen.blit(splash, (0, 0))
         else:
             screen.fill(BLACK)
+        done, total = ASSETS.progress()
+        draw_loading_progress(screen, done + total_tasks - len(tasks), total + total_tasks)
         pygame.display.flip()
+        if first_frame:
+            startup_mark("첫 프레임 (스플래시)")
+            first_frame = False
+        if splash_pending:
+            splash_pending = False
+            try:
+                splash = ASSETS.image(splash_path, (WIDTH, HEIGHT))
+            except Exception as e:
+                print(f"start.png 이상함")
+            continue
+        # 어차피 기다리는 시간이니 프레임마다 할 일을 하나씩 처리
+        if tasks:
+            tasks.pop(0)()
+            if not tasks:
+                startup_mark("스플래시 작업 완료")
         clock.tick(60)
 
 
 def load_preview_image(path, target_w, target_h, fallback_color):
     if os.path.exists(path):
         try:
-            img = pygame.image.load(path).convert_alpha()
-            return pygame.transform.scale(img, (target_w, target_h))
+            return ASSETS.image(path, (target_w, target_h))
         except Exception as e:
             print(f"프리뷰 이미지 이상함")
     surf = pygame.Surface((target_w, target_h))
@@ -2040,15 +3989,14 @@ def load_preview_image(path, target_w, target_h, fallback_color):
 
 
 def main_menu():
-    show_splash_screen()
+    show_splash_screen(tasks=startup_asset_tasks())
     selected_gender = "male"
 
     bg_img = None
     bg_path = os.path.join("img", "background.png")
     if os.path.exists(bg_path):
         try:
-            raw_bg = pygame.image.load(bg_path).convert_alpha()
-            bg_img = pygame.transform.scale(raw_bg, (WIDTH, HEIGHT))
+            bg_img = ASSETS.image(bg_path, (WIDTH, HEIGHT))
         except Exception as e:
             print(f"백그라운드 이상함")
 
@@ -2175,115 +4123,210 @@ def draw_rounded_bar(surface, x, y, w, h, ratio, back_color, fill_color, border_
         pygame.draw.rect(surface, fill_color, inner_rect, border_radius=10)
     pygame.draw.rect(surface, border_color, base_rect, width=2, border_radius=12)
 
-def draw_ui(surface, player, current_map, target_set):
+class HudLayer:
+    """HUD 위젯마다 그려둔 Surface 를 들고 있다가, 입력(key)이 바뀐 위젯만 다시 그린다.
+    화면에 붙일 때는 위젯당 blit 한 번."""
+    def __init__(self):
+        self.widgets = {}
+        self.rebuilds = 0
+
+    def get(self, name, key, build):
+        entry = self.widgets.get(name)
+        if entry is None or entry[0] != key:
+            entry = (key, build())
+            self.widgets[name] = entry
+            self.rebuilds += 1
+            PROFILER.count("surfaces")
+        return entry[1]
+
+    def blit(self, surface, name, key, pos, build):
+        surface.blit(self.get(name, key, build), pos)
+
+    def clear(self):
+        self.widgets.clear()
+
+
+_HUD = HudLayer()
+
+HUD_BAR_W = 300
+HUD_BAR_H = 40
 
-    big_font = get_korean_font(26)
-    font = get_korean_font(18)
+
+def build_hud_bar(label, ratio, fill_color, border_color):
+    bar = pygame.Surface((HUD_BAR_W, HUD_BAR_H), pygame.SRCALPHA)
+    draw_rounded_bar(bar, 0, 0, HUD_BAR_W, HUD_BAR_H, ratio, DARK_GRAY, fill_color, border_color)
+    text = render_text(label, 18, WHITE)
+    bar.blit(text, text.get_rect(center=(HUD_BAR_W // 2, HUD_BAR_H // 2)))
+    return bar
+
+
+def hud_bar_fill(ratio):
+    # draw_rounded_bar 가 실제로 칠하는 픽셀 폭. 이게 같으면 막대 모양도 같다
+    ratio = max(0.0, min(1.0, ratio))
+    return int((HUD_BAR_W - 6) * ratio)
+
+
+def build_level_badge(level):
+    badge_w = 90
+    badge_h = 60
+    badge = pygame.Surface((badge_w, badge_h), pygame.SRCALPHA)
+    badge_rect = badge.get_rect()
+    pygame.draw.rect(badge, DARK_GRAY, badge_rect, border_radius=14)
+    pygame.draw.rect(badge, YELLOW, badge_rect, width=2, border_radius=14)
+    lvl_label = render_text("LEVEL", 18, LIGHT_GRAY)
+    lvl_value = render_text(str(level), 26, YELLOW)
+    badge.blit(lvl_label, lvl_label.get_rect(center=(badge_w // 2, badge_h // 3)))
+    badge.blit(lvl_value, lvl_value.get_rect(center=(badge_w // 2, badge_h * 2 // 3 + 2)))
+    return badge
+
+
+def build_hud_label(text, color=WHITE, size=18):
+    # 위젯이 Surface 를 들고 있으니 글자 캐시(render_text)에는 안 넣는다 (위치처럼 자주 바뀌는 글자가 캐시를 밀어낸다)
+    return get_korean_font(size).render(text, True, color)
+
+
+def draw_ui(surface, player, current_map, target_set, player_pos=None):
+    """player_pos 는 보간 전 시뮬레이션 좌표. 위치 글자가 렌더 프레임마다 바뀌지 않게 이걸로 쓴다."""
 
     bar_x = 20
     bar_y = 20
-    bar_w = 300
-    bar_h = 40
+    bar_h = HUD_BAR_H
     gap = 10
 
     hp_ratio = player.hp / player.max_hp if player.max_hp > 0 else 0
-    draw_rounded_bar(surface, bar_x, bar_y, bar_w, bar_h, hp_ratio, DARK_GRAY, RED, (60, 0, 0))
-    hp_text = font.render(f"HP {int(player.hp)}/{player.max_hp}", True, WHITE)
-    hp_text_rect = hp_text.get_rect(center=(bar_x + bar_w // 2, bar_y + bar_h // 2))
-    surface.blit(hp_text, hp_text_rect)
+    hp_label = f"HP {int(player.hp)}/{player.max_hp}"
+    _HUD.blit(surface, "hp", (hp_label, hud_bar_fill(hp_ratio)), (bar_x, bar_y),
+              lambda: build_hud_bar(hp_label, hp_ratio, RED, (60, 0, 0)))
 
     mp_y = bar_y + bar_h + gap
     mp_ratio = player.mp / player.max_mp if player.max_mp > 0 else 0
-    draw_rounded_bar(surface, bar_x, mp_y, bar_w, bar_h, mp_ratio, DARK_GRAY, BLUE, (0, 0, 80))
-    mp_text = font.render(f"MP {int(player.mp)}/{player.max_mp}", True, WHITE)
-    mp_text_rect = mp_text.get_rect(center=(bar_x + bar_w // 2, mp_y + bar_h // 2))
-    surface.blit(mp_text, mp_text_rect)
+    mp_label = f"MP {int(player.mp)}/{player.max_mp}"
+    _HUD.blit(surface, "mp", (mp_label, hud_bar_fill(mp_ratio)), (bar_x, mp_y),
+              lambda: build_hud_bar(mp_label, mp_ratio, BLUE, (0, 0, 80)))
 
     exp_y = mp_y + bar_h + gap
     if player.xp_to_next > 0:
         exp_ratio = player.xp / player.xp_to_next
     else:
         exp_ratio = 0
-    draw_rounded_bar(surface, bar_x, exp_y, bar_w, bar_h, exp_ratio, DARK_GRAY, GREEN, (0, 60, 0))
-    exp_text = font.render(f"EXP {int(player.xp)}/{player.xp_to_next}", True, WHITE)
-    exp_text_rect = exp_text.get_rect(center=(bar_x + bar_w // 2, exp_y + bar_h // 2))
-    surface.blit(exp_text, exp_text_rect)
+    exp_label = f"EXP {int(player.xp)}/{player.xp_to_next}"
+    _HUD.blit(surface, "exp", (exp_label, hud_bar_fill(exp_ratio)), (bar_x, exp_y),
+              lambda: build_hud_bar(exp_label, exp_ratio, GREEN, (0, 60, 0)))
+
+    _HUD.blit(surface, "level", player.level, (bar_x + HUD_BAR_W + 25, bar_y),
+              lambda: build_level_badge(player.level))
 
-    lvl_x = bar_x + bar_w + 25
-    lvl_y = bar_y
-    badge_w = 90
-    badge_h = 60
-    badge_rect = pygame.Rect(lvl_x, lvl_y, badge_w, badge_h)
-    pygame.draw.rect(surface, DARK_GRAY, badge_rect, border_radius=14)
-    pygame.draw.rect(surface, YELLOW, badge_rect, width=2, border_radius=14)
-    lvl_label = font.render("LEVEL", True, LIGHT_GRAY)
-    lvl_value = big_font.render(str(player.level), True, YELLOW)
-    lvl_label_rect = lvl_label.get_rect(center=(lvl_x + badge_w // 2, lvl_y + badge_h // 3))
-    lvl_value_rect = lvl_value.get_rect(center=(lvl_x + badge_w // 2, lvl_y + badge_h * 2 // 3 + 2))
-    surface.blit(lvl_label, lvl_label_rect)
-    surface.blit(lvl_value, lvl_value_rect)
-
-    info_font = get_korean_font(18)
     rx = WIDTH - 260
     ry = 24
     if current_map:
-        enemies_text = info_font.render(f"적 수: {len(current_map.enemies)}", True, WHITE)
-        surface.blit(enemies_text, (rx, ry))
+        enemy_count = len(current_map.enemies)
+        _HUD.blit(surface, "enemies", enemy_count, (rx, ry),
+                  lambda: build_hud_label(f"적 수: {enemy_count}"))
         ry += 24
-    pos_text = info_font.render(f"위치: ({int(player.x)}, {int(player.y)})", True, WHITE)
-    surface.blit(pos_text, (rx, ry))
+    px, py = player_pos if player_pos is not None else (player.x, player.y)
+    pos = (int(px), int(py))
+    _HUD.blit(surface, "position", pos, (rx, ry),
+              lambda: build_hud_label(f"위치: ({pos[0]}, {pos[1]})"))
 
     status_text, status_color = (
         ("타겟 설정됨 - Enter: 공격", CYAN) if target_set else ("마우스 우클릭으로 공격할 위치 지정", GRAY)
     )
-    status_surf = info_font.render(status_text, True, status_color)
-    surface.blit(status_surf, (bar_x, exp_y + bar_h + 14))
-    weapon_text = info_font.render(f"무기: {player.weapon}", True, WHITE)
-    surface.blit(weapon_text, (bar_x, exp_y + bar_h + 38))
+    _HUD.blit(surface, "status", target_set, (bar_x, exp_y + bar_h + 14),
+              lambda: build_hud_label(status_text, status_color))
+    _HUD.blit(surface, "weapon", player.weapon, (bar_x, exp_y + bar_h + 38),
+              lambda: build_hud_label(f"무기: {player.weapon}"))
+
+
+class MenuPanel:
+    """메뉴 창 하나를 그려둔 retained Surface.
+    labels 는 (글자, 크기, 색, 위치, 가운데정렬) 튜플들이고, 라벨/스타일이 지난번과 같으면
+    다시 그리지 않고 만들어둔 Surface 를 그대로 쓴다."""
+    _UNSET = object()
+
+    def __init__(self, size):
+        self.size = size
+        self.surface = pygame.Surface(size)
+        self.key = MenuPanel._UNSET
+        self.rebuilds = 0
+
+    def invalidate(self):
+        self.key = MenuPanel._UNSET
+
+    def update(self, labels, fill=DARK_GRAY, alpha=None, border=3, decorate=None, extra_key=None):
+        """내용이 바뀌어서 다시 그렸으면 True."""
+        key = (labels, fill, alpha, border, extra_key)
+        if key == self.key:
+            return False
+        surf = self.surface
+        surf.fill(fill)
+        if border:
+            pygame.draw.rect(surf, WHITE, (0, 0, self.size[0], self.size[1]), border)
+        for text, size, color, pos, centered in labels:
+            text_surf = render_text(text, size, color)
+            surf.blit(text_surf, text_surf.get_rect(center=pos) if centered else pos)
+        if decorate is not None:
+            decorate(surf)
+        surf.set_alpha(alpha)
+        self.key = key
+        self.rebuilds += 1
+        return True
+
+    def draw(self, target, pos, labels, **style):
+        changed = self.update(labels, **style)
+        target.blit(self.surface, pos)
+        return changed
+
+
+_MENU_PANELS = {}
+
+
+def menu_panel(size):
+    """크기별로 하나씩만 만들어서 돌려쓴다. 전체 화면 오버레이도 메뉴끼리 한 장을 공유."""
+    panel = _MENU_PANELS.get(size)
+    if panel is None:
+        panel = MenuPanel(size)
+        _MENU_PANELS[size] = panel
+    return panel
+
+
+def menu_overlay():
+    return menu_panel((WIDTH, HEIGHT))
+
+
+def show_menu_notice(title, subtitle, wait_ms=1000):
+    labels = (
+        (title, 32, WHITE, (WIDTH//2, HEIGHT//2 - 20), True),
+        (subtitle, 20, LIGHT_GRAY, (WIDTH//2, HEIGHT//2 + 20), True),
+    )
+    menu_overlay().draw(screen, (0, 0), labels, fill=BLACK, alpha=220, border=0)
+    pygame.display.flip()
+    pygame.time.wait(wait_ms)
 
 
 def draw_inventory(surface, player):
     inv_w, inv_h = 600, 400
     inv_x = (WIDTH - inv_w) // 2
     inv_y = (HEIGHT - inv_h) // 2
-    inv_surf = pygame.Surface((inv_w, inv_h))
-    inv_surf.set_alpha(200)
-    inv_surf.fill(DARK_GRAY)
-    pygame.draw.rect(inv_surf, WHITE, (0, 0, inv_w, inv_h), 3)
 
-    title_font = get_korean_font(36)
-    item_font = get_korean_font(25)
-    title_surf = title_font.render("인벤토리 (I: 닫기, 1~9: 사용)", True, WHITE)
-    inv_surf.blit(title_surf, title_surf.get_rect(center=(inv_w // 2, 40)))
+    labels = [("인벤토리 (I: 닫기, 1~9: 사용)", 36, WHITE, (inv_w // 2, 40), True)]
 
     start_y = 90
     line_height = 35
     if not player.inventory:
-        empty_surf = item_font.render("인벤토리가 비어 있습니다.", True, LIGHT_GRAY)
-        inv_surf.blit(empty_surf, empty_surf.get_rect(center=(inv_w // 2, inv_h // 2)))
+        labels.append(("인벤토리가 비어 있습니다.", 25, LIGHT_GRAY, (inv_w // 2, inv_h // 2), True))
     else:
         for idx, (item_name, count) in enumerate(player.inventory.items()):
             label = f"{idx+1}. {item_name} x{count}"
-            text_surf = item_font.render(label, True, WHITE)
-            inv_surf.blit(text_surf, (40, start_y + idx * line_height))
-    surface.blit(inv_surf, (inv_x, inv_y))
+            labels.append((label, 25, WHITE, (40, start_y + idx * line_height), False))
+    menu_panel((inv_w, inv_h)).draw(surface, (inv_x, inv_y), tuple(labels), alpha=200)
 
 
 def draw_setting(surface, volume):
     set_w, set_h = 1000, 600
     set_x = (WIDTH - set_w) // 2
     set_y = (HEIGHT - set_h) // 2
-    set_surf = pygame.Surface((set_w, set_h))
-    set_surf.set_alpha(220)
-    set_surf.fill(DARK_GRAY)
-    pygame.draw.rect(set_surf, WHITE, (0, 0, set_w, set_h), 3)
 
-    title_font = get_korean_font(54)
-    item_font = get_korean_font(32)
-    small_font = get_korean_font(20)
-
-    title_surf = title_font.render("설정 (ESC: 닫기)", True, WHITE)
-    set_surf.blit(title_surf, title_surf.get_rect(center=(set_w // 2, 60)))
+    labels = [("설정 (ESC: 닫기)", 54, WHITE, (set_w // 2, 60), True)]
 
     info_lines = [
         "전체 볼륨 조절",
@@ -2291,8 +4334,7 @@ def draw_setting(surface, volume):
         "인벤토리: I, 무기 & 마법 확인: E",
     ]
     for idx, line in enumerate(info_lines):
-        text_surf = small_font.render(line, True, WHITE)
-        set_surf.blit(text_surf, (40, 130 + idx * 28))
+        labels.append((line, 20, WHITE, (40, 130 + idx * 28), False))
 
 
     slider_x = 60
@@ -2300,85 +4342,61 @@ def draw_setting(surface, volume):
     slider_w = 700
     slider_h = 24
 
-
-    pygame.draw.rect(
-        set_surf,
-        DARK_GRAY,
-        (slider_x, slider_y, slider_w, slider_h),
-        border_radius=12
-    )
-
-
     ratio = max(0.0, min(1.0, volume))
     fill_w = int(slider_w * ratio)
-    if fill_w > 0:
+
+    labels.append((f"전체 볼륨: {int(ratio * 100)}%", 32, WHITE, (slider_x, slider_y - 40), False))
+    labels.append(("※ 클릭, 드래그해서 볼륨을 조절", 20, LIGHT_GRAY, (slider_x, slider_y + slider_h + 20), False))
+
+    def draw_slider(set_surf):
         pygame.draw.rect(
             set_surf,
-            GREEN,
-            (slider_x, slider_y, fill_w, slider_h),
+            DARK_GRAY,
+            (slider_x, slider_y, slider_w, slider_h),
             border_radius=12
         )
 
- 
-    pygame.draw.rect(
-        set_surf,
-        WHITE,
-        (slider_x, slider_y, slider_w, slider_h),
-        width=2,
-        border_radius=12
-    )
-
-
-    handle_x = slider_x + fill_w
-    handle_y = slider_y + slider_h // 2
-    pygame.draw.circle(set_surf, WHITE, (handle_x, handle_y), slider_h // 2 + 4)
-    pygame.draw.circle(set_surf, GREEN, (handle_x, handle_y), slider_h // 2)
-
+        if fill_w > 0:
+            pygame.draw.rect(
+                set_surf,
+                GREEN,
+                (slider_x, slider_y, fill_w, slider_h),
+                border_radius=12
+            )
 
-    vol_text = item_font.render(f"전체 볼륨: {int(ratio * 100)}%", True, WHITE)
-    set_surf.blit(vol_text, (slider_x, slider_y - 40))
+        pygame.draw.rect(
+            set_surf,
+            WHITE,
+            (slider_x, slider_y, slider_w, slider_h),
+            width=2,
+            border_radius=12
+        )
 
-    hint = small_font.render("※ 클릭, 드래그해서 볼륨을 조절", True, LIGHT_GRAY)
-    set_surf.blit(hint, (slider_x, slider_y + slider_h + 20))
+        handle_x = slider_x + fill_w
+        handle_y = slider_y + slider_h // 2
+        pygame.draw.circle(set_surf, WHITE, (handle_x, handle_y), slider_h // 2 + 4)
+        pygame.draw.circle(set_surf, GREEN, (handle_x, handle_y), slider_h // 2)
 
-    surface.blit(set_surf, (set_x, set_y))
+    # 슬라이더는 채워진 폭(fill_w)이 바뀔 때만 다시 그린다
+    menu_panel((set_w, set_h)).draw(
+        surface, (set_x, set_y), tuple(labels), alpha=220, decorate=draw_slider, extra_key=fill_w
+    )
 
 
     return pygame.Rect(set_x + slider_x, set_y + slider_y, slider_w, slider_h)
 
-def draw_swap_menu(surface, player, swap_phase, swap_selected_slot, swap_selected_index, swap_unequipped_spells):
-    title_font = get_korean_font(34)
-    item_font = get_korean_font(24)
-    small_font = get_korean_font(18)
-
-    overlay = pygame.Surface((WIDTH, HEIGHT))
-    overlay.set_alpha(230)
-    overlay.fill(DARK_GRAY)
-
-    title = title_font.render("마법 교체 (M)", True, WHITE)
-    overlay.blit(title, title.get_rect(center=(WIDTH//2, 90)))
-
-    if swap_phase == 0:
-        info1 = small_font.render("1단계: 교체할 마법 선택", True, YELLOW)
-        info2 = small_font.render("↑↓ 또는 1~4 선택", True, WHITE)
-        info3 = small_font.render("Enter/Space: 다음 단계", True, LIGHT_GRAY)
-    else:
-        info1 = small_font.render("2단계: 장착할 마법 선택", True, YELLOW)
-        info2 = small_font.render("↑↓", True, WHITE)
-        info3 = small_font.render("Enter/Space: 장착", True, LIGHT_GRAY)
-
-    overlay.blit(info1, (WIDTH//2 - 260, 130))
-    overlay.blit(info2, (WIDTH//2 - 260, 160))
-    overlay.blit(info3, (WIDTH//2 - 260, 190))
+def swap_menu_labels(player, phase, selected_slot, selected_index, unequipped_spells, steps, start_y, slot_y, spell_y, right_x, esc_y):
+    """draw_swap_menu / swap_skills 가 같이 쓰는 라벨 목록. 좌표만 조금씩 다르다."""
+    labels = [("마법 교체 (M)", 34, WHITE, (WIDTH//2, 90), True)]
+    for i, (line, color) in enumerate(zip(steps[phase], (YELLOW, WHITE, LIGHT_GRAY))):
+        labels.append((line, 18, color, (WIDTH//2 - 260, 130 + i * 30), False))
 
     left_x = WIDTH//2 - 320
-    start_y = 240
     line_h = 40
-    slot_title = item_font.render("슬롯 (장착 중)", True, WHITE)
-    overlay.blit(slot_title, (left_x, start_y))
+    labels.append(("슬롯 (장착 중)", 24, WHITE, (left_x, start_y), False))
 
     for i in range(MAX_SPELL_SLOTS):
-        if i < len(player.equipped_spells):
+        if i < len(player.equipped_spells[:MAX_SPELL_SLOTS]):
             spl = player.equipped_spells[i]
             name = SPELL_DISPLAY_NAMES.get(spl, spl)
             rank = player.known_spells.get(spl, "?")
@@ -2386,39 +4404,46 @@ def draw_swap_menu(surface, player, swap_phase, swap_selected_slot, swap_selecte
         else:
             label = f"{i+1}. - 비어 있음 -"
 
-        if i == swap_selected_slot:
-            color = YELLOW if swap_phase == 0 else CYAN
+        if i == selected_slot:
+            color = YELLOW if phase == 0 else CYAN
             prefix = "▶ "
         else:
             color = WHITE
             prefix = "  "
 
-        text = item_font.render(prefix + label, True, color)
-        overlay.blit(text, (left_x, start_y + i * line_h + 20 + 20))
+        labels.append((prefix + label, 24, color, (left_x, slot_y + i * line_h), False))
 
-    right_x = WIDTH//2 + 30 + 10
-    spell_title = item_font.render("장착 가능 마법 (미장착)", True, WHITE)
-    overlay.blit(spell_title, (right_x, start_y))
+    labels.append(("장착 가능 마법 (미장착)", 24, WHITE, (right_x, start_y), False))
 
-    for idx, sid in enumerate(swap_unequipped_spells):
+    for idx, sid in enumerate(unequipped_spells):
         name = SPELL_DISPLAY_NAMES.get(sid, sid)
         rank = player.known_spells.get(sid, "?")
         label = f"{name} ({rank}랭크)"
 
-        if swap_phase == 1 and idx == swap_selected_index:
+        if phase == 1 and idx == selected_index:
             color = YELLOW
             prefix = "▶ "
         else:
             color = WHITE
             prefix = "  "
 
-        text = item_font.render(prefix + label, True, color)
-        overlay.blit(text, (right_x, start_y + idx * line_h + 40))
+        labels.append((prefix + label, 24, color, (right_x, spell_y + idx * line_h), False))
+
+    labels.append(("ESC: 취소", 18, LIGHT_GRAY, (WIDTH//2 - 40, esc_y), False))
+    return tuple(labels)
 
-    esc_text = small_font.render("ESC: 취소", True, LIGHT_GRAY)
-    overlay.blit(esc_text, (WIDTH//2 - 40, HEIGHT))
 
-    surface.blit(overlay, (0, 0))
+def draw_swap_menu(surface, player, swap_phase, swap_selected_slot, swap_selected_index, swap_unequipped_spells):
+    steps = (
+        ("1단계: 교체할 마법 선택", "↑↓ 또는 1~4 선택", "Enter/Space: 다음 단계"),
+        ("2단계: 장착할 마법 선택", "↑↓", "Enter/Space: 장착"),
+    )
+    start_y = 240
+    labels = swap_menu_labels(
+        player, swap_phase, swap_selected_slot, swap_selected_index, swap_unequipped_spells, steps,
+        start_y=start_y, slot_y=start_y + 40, spell_y=start_y + 40, right_x=WIDTH//2 + 30 + 10, esc_y=HEIGHT,
+    )
+    menu_overlay().draw(surface, (0, 0), labels, alpha=230, border=0)
 
 def swap_skills(player, selected_slot):
     spells = list(player.known_spells.keys())
@@ -2426,27 +4451,20 @@ def swap_skills(player, selected_slot):
     unequipped_spells = [sid for sid in spells if sid not in equipped_set]
 
     if not unequipped_spells:
-        overlay = pygame.Surface((WIDTH, HEIGHT))
-        overlay.set_alpha(220)
-        overlay.fill(BLACK)
-        font = get_korean_font(32)
-        small = get_korean_font(20)
-        t1 = font.render("장착되지 않은 마법이 없습니다.", True, WHITE)
-        t2 = small.render("새로 끼울 마법이 없습니다.", True, LIGHT_GRAY)
-        overlay.blit(t1, t1.get_rect(center=(WIDTH//2, HEIGHT//2 - 20)))
-        overlay.blit(t2, t2.get_rect(center=(WIDTH//2, HEIGHT//2 + 20)))
-        screen.blit(overlay, (0,0))
-        pygame.display.flip()
-        pygame.time.wait(1000)
+        show_menu_notice("장착되지 않은 마법이 없습니다.", "새로 끼울 마법이 없습니다.")
         return None
 
     selected_slot = max(0, min(selected_slot, MAX_SPELL_SLOTS - 1))
     selected_index = 0
     phase = 0
 
-    title_font = get_korean_font(34)
-    item_font = get_korean_font(24)
-    small_font = get_korean_font(18)
+    steps = (
+        ("1단계: 교체할 슬롯 선택", "↑↓/WS 또는 1~4 선택", "Enter/Space: 다음 단계"),
+        ("2단계: 장착할 마법 선택", "↑↓/WS", "Enter/Space: 장착"),
+    )
+    background = screen.copy()
+    overlay = menu_overlay()
+    overlay.invalidate()
 
     while True:
         for event in pygame.event.get():
@@ -2454,6 +4472,9 @@ def swap_skills(player, selected_slot):
                 pygame.quit()
                 exit()
 
+            if event.type == pygame.WINDOWEXPOSED:
+                overlay.invalidate()
+
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     return None
@@ -2489,75 +4510,16 @@ def swap_skills(player, selected_slot):
 
                         return selected_slot
 
-        overlay = pygame.Surface((WIDTH, HEIGHT))
-        overlay.set_alpha(230)
-        overlay.fill(DARK_GRAY)
-
-        title = title_font.render("마법 교체 (M)", True, WHITE)
-        overlay.blit(title, title.get_rect(center=(WIDTH//2, 90)))
-
-        if phase == 0:
-            info1 = small_font.render("1단계: 교체할 슬롯 선택", True, YELLOW)
-            info2 = small_font.render("↑↓/WS 또는 1~4 선택", True, WHITE)
-            info3 = small_font.render("Enter/Space: 다음 단계", True, LIGHT_GRAY)
-        else:
-            info1 = small_font.render("2단계: 장착할 마법 선택", True, YELLOW)
-            info2 = small_font.render("↑↓/WS", True, WHITE)
-            info3 = small_font.render("Enter/Space: 장착", True, LIGHT_GRAY)
-
-        overlay.blit(info1, (WIDTH//2 - 260, 130))
-        overlay.blit(info2, (WIDTH//2 - 260, 160))
-        overlay.blit(info3, (WIDTH//2 - 260, 190))
-
-        left_x = WIDTH//2 - 320
         start_y = 240
-        line_h = 40
-        slot_title = item_font.render("슬롯 (장착 중)", True, WHITE)
-        overlay.blit(slot_title, (left_x, start_y - 40))
-
-        for i in range(MAX_SPELL_SLOTS):
-            if i < len(player.equipped_spells[:MAX_SPELL_SLOTS]):
-                spl = player.equipped_spells[i]
-                name = SPELL_DISPLAY_NAMES.get(spl, spl)
-                rank = player.known_spells.get(spl, "?")
-                label = f"{i+1}. {name} ({rank}랭크)"
-            else:
-                label = f"{i+1}. - 비어 있음 -"
-
-            if i == selected_slot:
-                color = YELLOW if phase == 0 else CYAN
-                prefix = "▶ "
-            else:
-                color = WHITE
-                prefix = "  "
-
-            text = item_font.render(prefix + label, True, color)
-            overlay.blit(text, (left_x, start_y + i * line_h))
-
-        right_x = WIDTH//2 + 40
-        spell_title = item_font.render("장착 가능 마법 (미장착)", True, WHITE)
-        overlay.blit(spell_title, (right_x, start_y - 40))
-
-        for idx, sid in enumerate(unequipped_spells):
-            name = SPELL_DISPLAY_NAMES.get(sid, sid)
-            rank = player.known_spells.get(sid, "?")
-            label = f"{name} ({rank}랭크)"
-
-            if phase == 1 and idx == selected_index:
-                color = YELLOW
-                prefix = "▶ "
-            else:
-                color = WHITE
-                prefix = "  "
-
-            text = item_font.render(prefix + label, True, color)
-            overlay.blit(text, (right_x, start_y + idx * line_h))
-
-        esc_text = small_font.render("ESC: 취소", True, LIGHT_GRAY)
-        overlay.blit(esc_text, (WIDTH//2 - 40, HEIGHT - 80))
-
-        screen.blit(overlay, (0, 0))
-        pygame.display.flip()
+        labels = swap_menu_labels(
+            player, phase, selected_slot, selected_index, unequipped_spells, steps,
+            start_y=start_y - 40, slot_y=start_y, spell_y=start_y, right_x=WIDTH//2 + 40, esc_y=HEIGHT - 80,
+        )
+        # 바뀐 게 없으면 화면을 그대로 두고 flip 도 건너뛴다
+        if overlay.update(labels, alpha=230, border=0):
+            screen.blit(background, (0, 0))
+            screen.blit(overlay.surface, (0, 0))
+            pygame.display.flip()
         clock.tick(60)
    
 
@@ -2602,6 +4564,8 @@ def learn_spell_from_book(player, item_name):
     display_name = SPELL_DISPLAY_NAMES.get(spell_id, spell_id)
     prev_rank = player.known_spells.get(spell_id)
     player.known_spells[spell_id] = new_rank
+    if prev_rank is None:
+        prebake_spell_effects([spell_id])
 
     if spell_id not in player.equipped_spells and len(player.equipped_spells) < MAX_SPELL_SLOTS:
         player.equipped_spells.append(spell_id)
@@ -2629,15 +4593,516 @@ def equip_weapon(player, item_name):
 
 
 
-def record_audio_to_file(filename, duration=3, samplerate=44100):
-    recording = sd.rec(
-        int(duration * samplerate),
-        samplerate=samplerate,
-        channels=1,
-        dtype='int16'
+class SoundChannels:
+    """mixer 채널을 그룹(ui / spell / world)별로 나눠 예약해두고 직접 골라서 재생한다.
+    - 같은 Sound 는 voice_limit 개까지만 동시에 (넘으면 그 Sound 의 제일 오래된 재생을 끊음)
+    - 그룹 채널이 꽉 차면 우선순위가 같거나 낮은 것 중 제일 오래된 걸 뺏고, 없으면 안 튼다
+    - 볼륨은 master * 그룹 * 개별 값으로 여기서만 맞춘다 (배경음악 포함)"""
+    def __init__(self, groups, master_volume=1.0):
+        total = sum(groups.values())
+        if pygame.mixer.get_num_channels() < total:
+            pygame.mixer.set_num_channels(total)
+        # 전부 예약해서 Sound.play() 가 멋대로 채널을 가져가지 못하게 한다
+        pygame.mixer.set_reserved(total)
+        self.groups = {}
+        index = 0
+        for name, count in groups.items():
+            self.groups[name] = list(range(index, index + count))
+            index += count
+        self.channels = [pygame.mixer.Channel(i) for i in range(total)]
+        # 채널별 (sound, priority, 시작 순번, 개별 볼륨)
+        self.voices = [None] * total
+        self.group_volume = {name: 1.0 for name in groups}
+        self.master_volume = master_volume
+        self.serial = 0
+        self.dropped = 0
+        self.stolen = 0
+
+    def _live(self, index):
+        voice = self.voices[index]
+        if voice is not None and not self.channels[index].get_busy():
+            voice = None
+            self.voices[index] = None
+        return voice
+
+    def play(self, sound, group="world", priority=0, volume=1.0, voice_limit=SOUND_VOICE_LIMIT):
+        if sound is None:
+            return None
+        slots = self.groups[group]
+        free = None
+        same = []
+        victim = None
+        for index in slots:
+            voice = self._live(index)
+            if voice is None:
+                if free is None:
+                    free = index
+                continue
+            if voice[0] is sound:
+                same.append(index)
+            if voice[1] <= priority and (
+                victim is None or (voice[1], voice[2]) < (self.voices[victim][1], self.voices[victim][2])
+            ):
+                victim = index
+
+        if len(same) >= voice_limit:
+            index = min(same, key=lambda i: self.voices[i][2])
+            self.stolen += 1
+        elif free is not None:
+            index = free
+        elif victim is not None:
+            index = victim
+            self.stolen += 1
+        else:
+            self.dropped += 1
+            return None
+
+        self.serial += 1
+        channel = self.channels[index]
+        channel.play(sound)
+        channel.set_volume(self.master_volume * self.group_volume[group] * volume)
+        self.voices[index] = (sound, priority, self.serial, volume, group)
+        return channel
+
+    def _apply_volumes(self):
+        for index, channel in enumerate(self.channels):
+            voice = self._live(index)
+            if voice is not None:
+                channel.set_volume(self.master_volume * self.group_volume[voice[4]] * voice[3])
+
+    def set_master_volume(self, volume):
+        self.master_volume = max(0.0, min(1.0, volume))
+        pygame.mixer.music.set_volume(self.master_volume)
+        self._apply_volumes()
+
+    def set_group_volume(self, group, volume):
+        self.group_volume[group] = max(0.0, min(1.0, volume))
+        self._apply_volumes()
+
+    def stop_group(self, group):
+        for index in self.groups[group]:
+            self.channels[index].stop()
+            self.voices[index] = None
+
+
+SOUNDS = SoundChannels(SOUND_GROUPS, master_volume=VOLUME)
+
+
+class AudioCapture:
+    """sounddevice 콜백 스트림으로 녹음한다. 오디오 스레드가 미리 잡아둔 numpy 링 버퍼에
+    바로 써넣고, UI 쪽은 level / waveform() 으로 현재 상태만 읽어간다 (read/wait 로 안 멈춤).
+    버퍼는 max_duration 만큼이라 그보다 길게 켜두면 마지막 max_duration 초만 남는다."""
+    def __init__(self, samplerate=44100, max_duration=3.0):
+        self.samplerate = samplerate
+        self.capacity = int(samplerate * max_duration)
+        self.buffer = np.zeros(self.capacity, dtype=np.int16)
+        self.write_pos = 0
+        self.total = 0
+        self.level = 0.0
+        self.peak = 0.0
+        self.overflowed = False
+        self.stream = None
+
+    @property
+    def active(self):
+        return self.stream is not None
+
+    @property
+    def elapsed(self):
+        return self.total / self.samplerate
+
+    def _callback(self, indata, frames, time_info, status):
+        # 오디오 스레드. 여기서는 복사랑 레벨 계산만 한다
+        callback_start = time.perf_counter()
+        if status and status.input_overflow:
+            self.overflowed = True
+        block = indata[:, 0]
+        n = len(block)
+        if n == 0:
+            return
+        if n > self.capacity:
+            block = block[-self.capacity:]
+            n = self.capacity
+        pos = self.write_pos
+        end = pos + n
+        if end <= self.capacity:
+            self.buffer[pos:end] = block
+        else:
+            first = self.capacity - pos
+            self.buffer[pos:] = block[:first]
+            self.buffer[:n - first] = block[first:]
+        self.write_pos = end % self.capacity
+        self.total += n
+        f = block.astype(np.float32) * (1.0 / 32768.0)
+        self.level = float(np.sqrt(np.mean(f * f)))
+        self.peak = float(np.abs(f).max())
+        PROFILER.span("audio", callback_start, time.perf_counter())
+
+    def start(self):
+        self.write_pos = 0
+        self.total = 0
+        self.level = 0.0
+        self.peak = 0.0
+        self.overflowed = False
+        self.stream = load_sounddevice().InputStream(
+            samplerate=self.samplerate, channels=1, dtype='int16', callback=self._callback
+        )
+        self.stream.start()
+
+    def stop(self):
+        stream = self.stream
+        self.stream = None
+        if stream is not None:
+            try:
+                stream.stop()
+                stream.close()
+            except Exception as e:
+                print(f"녹음 종료 중 오류: {e}")
+        self.level = 0.0
+        if self.overflowed:
+            print("[WARN] 녹음 중 입력 버퍼가 넘쳐서 일부 샘플이 빠졌습니다.")
+
+    def samples(self):
+        """지금까지 녹음된 샘플 (시간 순서, 복사본)."""
+        count = min(self.total, self.capacity)
+        if count < self.capacity:
+            return self.buffer[:count].copy()
+        return np.roll(self.buffer, -self.write_pos)
+
+    def waveform(self, points, window=1.0):
+        """최근 window 초를 points 칸으로 나눈 (min, max) 포락선, -1~1 범위."""
+        count = min(self.total, self.capacity, int(self.samplerate * window))
+        if count < points:
+            zeros = np.zeros(points, dtype=np.float32)
+            return zeros, zeros
+        idx = (self.write_pos - count + np.arange(count)) % self.capacity
+        recent = self.buffer[idx]
+        usable = count - count % points
+        cols = recent[count - usable:].reshape(points, -1)
+        scale = 1.0 / 32768.0
+        return cols.min(axis=1) * scale, cols.max(axis=1) * scale
+
+    def to_clip(self):
+        """녹음 끝난 샘플을 다듬어서(process_recording) 돌려준다. 쓸 만한 소리가 없으면 빈 배열."""
+        data = self.samples()
+        if len(data) == 0:
+            return data
+        return process_recording(data, self.samplerate)
+
+
+def process_recording(samples, samplerate):
+    """녹음된 int16 모노 샘플 후처리 (전부 numpy 벡터 연산).
+    10ms 단위 RMS 로 앞뒤 무음을 자르고, 목표 RMS 로 맞추되 피크가 RECORD_PEAK_DB 를 넘지 않게
+    게인을 정한 다음, 양 끝에 짧은 페이드를 넣는다."""
+    data = np.asarray(samples).reshape(-1).astype(np.float32) * (1.0 / 32768.0)
+    n = len(data)
+    frame = max(1, samplerate // 100)
+    nframes = n // frame
+    if nframes == 0:
+        return np.zeros(0, dtype=np.int16)
+
+    frames = data[:nframes * frame].reshape(nframes, frame)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    loudest = float(rms.max())
+    if loudest < 1e-4:
+        print("[WARN] 녹음된 소리가 거의 없습니다.")
+        return np.zeros(0, dtype=np.int16)
+
+    threshold = loudest * 10 ** (RECORD_TRIM_DB / 20)
+    voiced = np.flatnonzero(rms >= threshold)
+    pad = 3
+    start = max(0, voiced[0] - pad) * frame
+    end = min(n, (voiced[-1] + 1 + pad) * frame)
+    clip = data[start:end]
+
+    clip_rms = float(np.sqrt(np.mean(clip * clip)))
+    peak = float(np.abs(clip).max())
+    gain = 10 ** (RECORD_TARGET_RMS_DB / 20) / max(clip_rms, 1e-9)
+    gain = min(gain, 10 ** (RECORD_PEAK_DB / 20) / max(peak, 1e-9), 10 ** (RECORD_MAX_GAIN_DB / 20))
+    clip = clip * np.float32(gain)
+
+    fade = min(len(clip) // 2, samplerate * RECORD_FADE_MS // 1000)
+    if fade > 0:
+        ramp = np.linspace(0.0, 1.0, fade, endpoint=False, dtype=np.float32)
+        clip[:fade] *= ramp
+        clip[len(clip) - fade:] *= ramp[::-1]
+
+    out = np.round(np.clip(clip, -1.0, 1.0) * 32767).astype(np.int16)
+
+    # mixer 에 올라가는 크기 기준으로 얼마나 줄었는지 (Sound 는 mixer 포맷으로 변환돼서 들어간다)
+    mix = pygame.mixer.get_init()
+    mix_freq, mix_size, mix_channels = mix if mix else (samplerate, -16, 2)
+    bytes_per_sec = mix_freq * mix_channels * (abs(mix_size) // 8)
+    saved_sec = (n - len(out)) / samplerate
+    print(
+        f"[INFO] 녹음 정리: {n / samplerate:.2f}s -> {len(out) / samplerate:.2f}s "
+        f"({saved_sec:.2f}s 잘라냄, 약 {saved_sec * bytes_per_sec / 1024:.0f}KB 절약), "
+        f"게인 {20 * math.log10(gain):+.1f}dB"
     )
-    sd.wait()
-    sf.write(filename, recording, samplerate)
+    return out
+
+
+def pcm_to_sound(samples, samplerate):
+    """int16 모노/스테레오 numpy 배열 -> 지금 mixer 포맷(주파수, 채널, 비트)에 맞춘 Sound.
+    WAV 로 저장했다가 다시 읽는 과정 없이 pygame.sndarray 로 바로 만든다."""
+    mix_freq, mix_size, mix_channels = pygame.mixer.get_init()
+    data = np.asarray(samples)
+    if data.ndim == 1:
+        data = data[:, None]
+    data = data.astype(np.float32) * (1.0 / 32768.0)
+
+    if samplerate != mix_freq and len(data) > 1:
+        # 선형 보간 리샘플. 목소리 녹음 용도로는 충분하다
+        out_len = max(1, int(round(len(data) * mix_freq / samplerate)))
+        src_t = np.arange(len(data), dtype=np.float64)
+        dst_t = np.linspace(0.0, len(data) - 1, out_len)
+        data = np.stack([np.interp(dst_t, src_t, data[:, ch]) for ch in range(data.shape[1])], axis=1)
+
+    if data.shape[1] != mix_channels:
+        if data.shape[1] == 1:
+            data = np.repeat(data, mix_channels, axis=1)
+        else:
+            data = data.mean(axis=1, keepdims=True)
+            data = np.repeat(data, mix_channels, axis=1)
+
+    data = np.clip(data, -1.0, 1.0)
+    if mix_size == 32:
+        arr = data.astype(np.float32)
+    elif mix_size == -32:
+        arr = (data * 2147483647).astype(np.int32)
+    elif abs(mix_size) == 8:
+        if mix_size < 0:
+            arr = (data * 127).astype(np.int8)
+        else:
+            arr = (data * 127 + 128).astype(np.uint8)
+    elif mix_size == 16:
+        arr = (data * 32767 + 32768).astype(np.uint16)
+    else:
+        arr = (data * 32767).astype(np.int16)
+    if mix_channels == 1:
+        arr = arr[:, 0]
+    return pygame.sndarray.make_sound(np.ascontiguousarray(arr))
+
+
+class BackgroundFileWriter:
+    """파일 저장을 백그라운드 스레드 하나에서 처리. 게임(UI) 스레드는 큐에 넣기만 한다.
+    임시 파일에 쓰고 os.replace 로 바꿔치기 하니까 쓰다 만 파일이 남지 않는다."""
+    def __init__(self, name="file-writer"):
+        self.name = name
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _ensure_thread(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self.thread.start()
+
+    def submit_job(self, path, write, on_done=None):
+        """write(임시 경로) 가 파일을 다 쓰면 path 로 바꿔치기한다.
+        on_done 은 저장이 성공하면 writer 스레드에서 불린다."""
+        self.jobs.put((path, write, on_done))
+        self._ensure_thread()
+
+    def _run(self):
+        while True:
+            path, write, on_done = self.jobs.get()
+            try:
+                root, ext = os.path.splitext(path)
+                tmp_path = f"{root}.tmp{ext}"
+                write(tmp_path)
+                os.replace(tmp_path, path)
+                if on_done is not None:
+                    on_done()
+            except Exception as e:
+                print(f"[WARN] 파일 저장 실패 ({path}): {e}")
+            finally:
+                self.jobs.task_done()
+
+    def flush(self, timeout=5.0):
+        """남은 저장 작업이 끝날 때까지 (최대 timeout 초) 기다린다."""
+        deadline = time.time() + timeout
+        while self.jobs.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+
+class SoundFileWriter(BackgroundFileWriter):
+    """녹음 파일(WAV/FLAC/OGG) 저장용."""
+    def __init__(self):
+        super().__init__("sound-writer")
+
+    def submit(self, path, samples, samplerate, fmt=None, subtype=None, on_done=None):
+        samples = np.array(samples, copy=True)
+        self.submit_job(
+            path,
+            lambda tmp_path: load_soundfile().write(tmp_path, samples, samplerate, format=fmt, subtype=subtype),
+            on_done,
+        )
+
+
+SOUND_WRITER = SoundFileWriter()
+atexit.register(SOUND_WRITER.flush)
+TRACE_WRITER = BackgroundFileWriter("trace-writer")
+atexit.register(TRACE_WRITER.flush, 30.0)
+# atexit 는 거꾸로 불리니까 트레이스 내보내기가 위의 flush 보다 먼저 돈다
+atexit.register(PROFILER.export_trace)
+
+
+class SpellSoundLibrary:
+    """녹음한 주문 소리 보관함. FLAC(또는 Ogg)으로 압축해서 저장하고, index.json 에
+    spell_id -> 파일, 길이, 음량(RMS/피크 dB) 을 적어둔다.
+    시작할 때 start_loading() 으로 스레드 풀에서 디코딩을 걸어두고, 플레이어가 만들어지면
+    load_sounds() 로 Sound 를 만든다 (Sound 생성은 메인 스레드에서)."""
+    def __init__(self, directory=SPELL_SOUND_DIR, fmt=SPELL_SOUND_FORMAT):
+        self.directory = directory
+        self.format = fmt
+        self.ext = ".ogg" if fmt == "OGG" else ".flac"
+        self.index_path = os.path.join(directory, "index.json")
+        self.lock = threading.Lock()
+        self.index = self._read_index()
+        self.executor = None
+        self.futures = {}
+        self.loaded = {}
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"[WARN] 주문 소리 목록(index.json) 읽기 실패, 새로 만듭니다: {e}")
+            return {}
+
+    def _write_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def path_for(self, spell_id):
+        return os.path.join(self.directory, f"1331_황정빈{spell_id}{self.ext}")
+
+    def legacy_path(self, spell_id):
+        # 예전 버전이 쓰던 무압축 WAV
+        return os.path.join(self.directory, f"1331_황정빈{spell_id}.wav")
+
+    def save(self, spell_id, clip, samplerate, on_done=None):
+        """파일 쓰기와 index 갱신은 SOUND_WRITER 스레드에서. on_done 은 둘 다 끝난 뒤 불린다."""
+        data = np.asarray(clip).astype(np.float32) * (1.0 / 32768.0)
+        rms = float(np.sqrt(np.mean(data * data))) if len(data) else 0.0
+        peak = float(np.abs(data).max()) if len(data) else 0.0
+        path = self.path_for(spell_id)
+        entry = {
+            "file": os.path.basename(path),
+            "duration": round(len(data) / samplerate, 3),
+            "samplerate": samplerate,
+            "rms_db": round(20 * math.log10(max(rms, 1e-9)), 1),
+            "peak_db": round(20 * math.log10(max(peak, 1e-9)), 1),
+        }
+
+        def update_index():
+            with self.lock:
+                self.index[spell_id] = entry
+                self._write_index()
+            if on_done is not None:
+                on_done()
+
+        subtype = "VORBIS" if self.format == "OGG" else "PCM_16"
+        SOUND_WRITER.submit(path, clip, samplerate, fmt=self.format, subtype=subtype, on_done=update_index)
+
+    def start_loading(self):
+        if self.executor is not None:
+            return
+        paths = {}
+        for spell_id, entry in self.index.items():
+            paths[spell_id] = os.path.join(self.directory, entry["file"])
+        for spell_id in SPELL_DISPLAY_NAMES:
+            if spell_id not in paths and os.path.exists(self.legacy_path(spell_id)):
+                paths[spell_id] = self.legacy_path(spell_id)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=SPELL_SOUND_LOAD_WORKERS, thread_name_prefix="spell-sound"
+        )
+        self.futures = {spell_id: self.executor.submit(self._decode, path)
+                        for spell_id, path in paths.items()}
+
+    @staticmethod
+    def _decode(path):
+        return load_soundfile().read(path, dtype="int16")
+
+    def load_sounds(self):
+        """디코딩이 끝나길 기다렸다가 {spell_id: Sound}. 파일은 읽기만 한다."""
+        self.start_loading()
+        sounds = dict(self.loaded)
+        legacy = []
+        for spell_id, future in self.futures.items():
+            try:
+                data, samplerate = future.result()
+                sounds[spell_id] = pcm_to_sound(data, samplerate)
+            except Exception as e:
+                print(f"[WARN] 주문 소리 불러오기 실패 ({spell_id}): {e}")
+                continue
+            if spell_id not in self.index:
+                legacy.append(spell_id)
+        if self.futures and sounds:
+            print(f"[INFO] 주문 소리 {len(sounds)}개 불러옴: {', '.join(sounds)}")
+        if legacy:
+            print(f"[INFO] 예전 WAV 소리 {len(legacy)}개는 --migrate-sounds 로 압축할 수 있습니다: {', '.join(legacy)}")
+        self.futures = {}
+        self.executor.shutdown(wait=False)
+        self.loaded = sounds
+        return dict(sounds)
+
+    def migrate_legacy(self):
+        """--migrate-sounds: index 에 없는 예전 WAV 를 압축 포맷으로 다시 저장하고,
+        새 파일과 index 가 다 써진 뒤에야 WAV 를 지운다. 저장이 실패하면 WAV 는 그대로 남는다."""
+        count = 0
+        for spell_id in SPELL_DISPLAY_NAMES:
+            wav_path = self.legacy_path(spell_id)
+            if spell_id in self.index or not os.path.exists(wav_path):
+                continue
+            try:
+                data, samplerate = self._decode(wav_path)
+            except Exception as e:
+                print(f"[WARN] 예전 주문 소리 읽기 실패 ({wav_path}): {e}")
+                continue
+            if data.ndim > 1:
+                data = data.mean(axis=1).astype(np.int16)
+
+            def remove_wav(wav_path=wav_path):
+                os.remove(wav_path)
+                print(f"[INFO] 변환 완료, 원본 삭제: {wav_path}")
+
+            self.save(spell_id, data, samplerate, on_done=remove_wav)
+            count += 1
+        print(f"[INFO] 예전 WAV 주문 소리 {count}개 변환 중...")
+        return count
+
+
+SPELL_LIBRARY = SpellSoundLibrary()
+
+
+def draw_capture_meter(surface, rect, capture):
+    """녹음 중 입력 레벨 막대 + 최근 1초 파형."""
+    rect = pygame.Rect(rect)
+    pygame.draw.rect(surface, BLACK, rect)
+    meter_w = 14
+    level_h = int(min(1.0, capture.level * 4.0) * rect.height)
+    if level_h > 0:
+        color = RED if capture.peak > 0.95 else GREEN
+        pygame.draw.rect(surface, color, (rect.x, rect.bottom - level_h, meter_w, level_h))
+    wave_rect = pygame.Rect(rect.x + meter_w + 6, rect.y, rect.width - meter_w - 6, rect.height)
+    points = wave_rect.width // 2
+    lows, highs = capture.waveform(points)
+    mid = wave_rect.centery
+    half = wave_rect.height / 2
+    xs = wave_rect.x + np.arange(points) * 2
+    tops = (mid - highs * half).astype(int)
+    bottoms = (mid - lows * half).astype(int)
+    for x, top, bottom in zip(xs.tolist(), tops.tolist(), bottoms.tolist()):
+        pygame.draw.line(surface, CYAN, (x, top), (x, max(top, bottom)))
+    pygame.draw.rect(surface, WHITE, rect, 1)
 
 
 def use_item(player, item_name):
@@ -2658,41 +5123,26 @@ def draw_skill_menu(surface, player, target_set, selected_slot):
     menu_w, menu_h = 800, 450
     menu_x = (WIDTH - menu_w) // 2
     menu_y = (HEIGHT - menu_h) // 2
-    menu_surf = pygame.Surface((menu_w, menu_h))
-    menu_surf.set_alpha(220)
-    menu_surf.fill(DARK_GRAY)
-    pygame.draw.rect(menu_surf, WHITE, (0, 0, menu_w, menu_h), 3)
-
-    title_font = get_korean_font(36)
-    item_font = get_korean_font(24)
-    small_font = get_korean_font(18)
 
-    title = "마법 선택 (M: 닫기 / Enter: 선택)"
-    title_surf = title_font.render(title, True, WHITE)
-    menu_surf.blit(title_surf, title_surf.get_rect(center=(menu_w // 2, 40)))
-
-    hint = small_font.render("↑/↓ , 1~4로, M: 무기 선택 창으로", True, LIGHT_GRAY)
-    menu_surf.blit(hint, (20, 80))
+    labels = [
+        ("마법 선택 (M: 닫기 / Enter: 선택)", 36, WHITE, (menu_w // 2, 40), True),
+        ("↑/↓ , 1~4로, M: 무기 선택 창으로", 18, LIGHT_GRAY, (20, 80), False),
+    ]
 
     if player.equipped_spells and 0 <= selected_slot < len(player.equipped_spells):
         sel_id = player.equipped_spells[selected_slot]
         sel_name = SPELL_DISPLAY_NAMES.get(sel_id, sel_id)
-        sel_text = small_font.render(f"현재 선택된 마법: {selected_slot+1}번 - {sel_name}", True, YELLOW)
+        labels.append((f"현재 선택된 마법: {selected_slot+1}번 - {sel_name}", 18, YELLOW, (20, 110), False))
     else:
-        sel_text = small_font.render("현재 선택된 마법: 없음", True, LIGHT_GRAY)
-    menu_surf.blit(sel_text, (20, 110))
+        labels.append(("현재 선택된 마법: 없음", 18, LIGHT_GRAY, (20, 110), False))
 
-    mp_text = f"MP: {int(player.mp)}/{player.max_mp}"
-    mp_surf = small_font.render(mp_text, True, GREEN)
-    menu_surf.blit(mp_surf, (20, 135))
+    labels.append((f"MP: {int(player.mp)}/{player.max_mp}", 18, GREEN, (20, 135), False))
 
     target_text = "타겟: 설정됨 (마우스로 찍음)" if target_set else "타겟: 미설정 (마우스로 찍기)"
     target_color = CYAN if target_set else LIGHT_GRAY
-    target_surf = small_font.render(target_text, True, target_color)
-    menu_surf.blit(target_surf, (20, 160))
+    labels.append((target_text, 18, target_color, (20, 160), False))
 
-    spell_title = item_font.render("마법 슬롯 (1~4로 선택, Enter로 사용)", True, WHITE)
-    menu_surf.blit(spell_title, (40, 190))
+    labels.append(("마법 슬롯 (1~4로 선택, Enter로 사용)", 24, WHITE, (40, 190), False))
 
     for idx in range(MAX_SPELL_SLOTS):
         y = 230 + idx * 50
@@ -2707,45 +5157,26 @@ def draw_skill_menu(surface, player, target_set, selected_slot):
             text = f"{slot_label}{name} ({rank}랭크)"
         else:
             text = f"{slot_label}- 비어 있음 -"
-        text_surf = item_font.render(text, True, color)
-        menu_surf.blit(text_surf, (40, y))
+        labels.append((text, 24, color, (40, y), False))
 
-    weapon_title = item_font.render("현재 무기", True, WHITE)
-    menu_surf.blit(weapon_title, (menu_w // 2 + 40, 230))
-    text = f"{player.weapon}"
-    text_surf = item_font.render(text, True, WHITE)
-    menu_surf.blit(text_surf, (menu_w // 2 + 40, 270))
-    small = small_font.render("무기 선택: M (무기 창 열기)", True, LIGHT_GRAY)
-    menu_surf.blit(small, (menu_w // 2 + 40, 305))
+    labels.append(("현재 무기", 24, WHITE, (menu_w // 2 + 40, 230), False))
+    labels.append((f"{player.weapon}", 24, WHITE, (menu_w // 2 + 40, 270), False))
+    labels.append(("무기 선택: M (무기 창 열기)", 18, LIGHT_GRAY, (menu_w // 2 + 40, 305), False))
 
-    surface.blit(menu_surf, (menu_x, menu_y))
+    menu_panel((menu_w, menu_h)).draw(surface, (menu_x, menu_y), tuple(labels), alpha=220)
 
 
 def draw_weapon_menu(surface, player, available_weapons, selected_index):
     menu_w, menu_h = 800, 450
     menu_x = (WIDTH - menu_w) // 2
     menu_y = (HEIGHT - menu_h) // 2
-    menu_surf = pygame.Surface((menu_w, menu_h))
-    menu_surf.set_alpha(220)
-    menu_surf.fill(DARK_GRAY)
-    pygame.draw.rect(menu_surf, WHITE, (0, 0, menu_w, menu_h), 3)
-
-    title_font = get_korean_font(36)
-    item_font = get_korean_font(24)
-    small_font = get_korean_font(18)
-
-    title = "무기 선택 (N: 닫기 / Enter: 장착)"
-    title_surf = title_font.render(title, True, WHITE)
-    menu_surf.blit(title_surf, title_surf.get_rect(center=(menu_w // 2, 40)))
-
-    hint = small_font.render("↑/↓,  1~9로 선택 후 Enter로 장착, N: 마법 선택 창으로", True, LIGHT_GRAY)
-    menu_surf.blit(hint, (20, 80))
 
-    current_text = small_font.render(f"현재 무기: {player.weapon}", True, YELLOW)
-    menu_surf.blit(current_text, (20, 110))
-
-    list_title = item_font.render("보유 무기 목록", True, WHITE)
-    menu_surf.blit(list_title, (40, 150))
+    labels = [
+        ("무기 선택 (N: 닫기 / Enter: 장착)", 36, WHITE, (menu_w // 2, 40), True),
+        ("↑/↓,  1~9로 선택 후 Enter로 장착, N: 마법 선택 창으로", 18, LIGHT_GRAY, (20, 80), False),
+        (f"현재 무기: {player.weapon}", 18, YELLOW, (20, 110), False),
+        ("보유 무기 목록", 24, WHITE, (40, 150), False),
+    ]
 
     for idx, weapon_name in enumerate(available_weapons):
         y = 190 + idx * 40
@@ -2753,34 +5184,22 @@ def draw_weapon_menu(surface, player, available_weapons, selected_index):
         color = YELLOW if is_sel else WHITE
         prefix = "▶ " if is_sel else "  "
         text = f"{prefix}{idx+1}. {weapon_name} x{player.inventory.get(weapon_name, 0) if weapon_name != '맨손' else '-'}"
-        text_surf = item_font.render(text, True, color)
-        menu_surf.blit(text_surf, (40, y))
+        labels.append((text, 24, color, (40, y), False))
 
-    surface.blit(menu_surf, (menu_x, menu_y))
+    menu_panel((menu_w, menu_h)).draw(surface, (menu_x, menu_y), tuple(labels), alpha=220)
 
 
 def show_fireball_intro_and_record(player):
-    if "fireball" not in player.known_spells:
+    if "fireball" not in player.known_spells or SCRIPTED_INPUT:
         return
     display_name = SPELL_DISPLAY_NAMES.get("fireball", "파이어볼")
-    overlay = pygame.Surface((WIDTH, HEIGHT))
-    overlay.set_alpha(220)
-    overlay.fill(BLACK)
-
-    title_font = get_korean_font(40)
-    text_font = get_korean_font(24)
-    small_font = get_korean_font(18)
-
-    t1 = title_font.render("당신의 안에서 불의 소리가 들립니다....", True, ORANGE)
-    t2 = text_font.render("'파이어볼'을 사용할 수 있게 되었습니다.", True, WHITE)
-    t3 = text_font.render("지금부터 마법을 사용할 때 나올 소리를 직접 녹음할 수 있습니다.", True, WHITE)
-    t4 = small_font.render("아무 키나 누르세요.", True, LIGHT_GRAY)
-
-    overlay.blit(t1, t1.get_rect(center=(WIDTH//2, HEIGHT//2 - 80)))
-    overlay.blit(t2, t2.get_rect(center=(WIDTH//2, HEIGHT//2 - 30)))
-    overlay.blit(t3, t3.get_rect(center=(WIDTH//2, HEIGHT//2 + 10)))
-    overlay.blit(t4, t4.get_rect(center=(WIDTH//2, HEIGHT//2 + 70)))
-    screen.blit(overlay, (0, 0))
+    labels = (
+        ("당신의 안에서 불의 소리가 들립니다....", 40, ORANGE, (WIDTH//2, HEIGHT//2 - 80), True),
+        ("'파이어볼'을 사용할 수 있게 되었습니다.", 24, WHITE, (WIDTH//2, HEIGHT//2 - 30), True),
+        ("지금부터 마법을 사용할 때 나올 소리를 직접 녹음할 수 있습니다.", 24, WHITE, (WIDTH//2, HEIGHT//2 + 10), True),
+        ("아무 키나 누르세요.", 18, LIGHT_GRAY, (WIDTH//2, HEIGHT//2 + 70), True),
+    )
+    menu_overlay().draw(screen, (0, 0), labels, fill=BLACK, alpha=220, border=0)
     pygame.display.flip()
 
     waiting = True
@@ -2801,65 +5220,58 @@ def show_fireball_intro_and_record(player):
 
 
 def open_spell_sound_popup(spell_id, display_name, initial_sound=None, mode="new"):
+    if SCRIPTED_INPUT:
+        return initial_sound
+    preload_audio_libs()
     popup_w, popup_h = 700, 380
     popup_x = (WIDTH - popup_w) // 2
     popup_y = (HEIGHT - popup_h) // 2
 
-    title_font = get_korean_font(32)
-    text_font = get_korean_font(22)
-    small_font = get_korean_font(18)
-
     current_sound = initial_sound
     has_recorded = False
     is_recording = False
-    recorded_chunks = []
-    record_stream = None
     record_start_time = 0.0
     max_duration = 3.0
-    samplerate = 44100
-    frames_per_chunk = int(samplerate * 0.05)
+    capture = AudioCapture(samplerate=44100, max_duration=max_duration)
 
     def start_recording():
-        nonlocal is_recording, recorded_chunks, record_stream, record_start_time
+        nonlocal is_recording, record_start_time
         try:
-            recorded_chunks = []
-            record_stream = sd.InputStream(samplerate=samplerate, channels=1, dtype='int16')
-            record_stream.start()
+            capture.start()
             record_start_time = time.time()
             is_recording = True
         except Exception as e:
             print(f"녹음 시작 실패")
+            capture.stop()
             is_recording = False
-            record_stream = None
 
     def stop_recording():
-        nonlocal is_recording, record_stream, recorded_chunks, current_sound, has_recorded
+        nonlocal is_recording, current_sound, has_recorded
         if not is_recording:
             return
-        try:
-            if record_stream is not None:
-                record_stream.stop()
-                record_stream.close()
-        except Exception as e:
-            print(f"녹음 종료 중 오류: {e}")
-        record_stream = None
+        capture.stop()
         is_recording = False
-        if not recorded_chunks:
+        if capture.total == 0:
+            return
+        clip = capture.to_clip()
+        if len(clip) == 0:
             return
-        audio = np.concatenate(recorded_chunks, axis=0)
-        filename = os.path.join(SPELL_SOUND_DIR, f"1331_황정빈{spell_id}.wav")
         try:
-            sf.write(filename, audio, samplerate)
-            current_sound = pygame.mixer.Sound(filename)
+            current_sound = pcm_to_sound(clip, capture.samplerate)
             has_recorded = True
-
         except Exception as e:
-            print(f"녹음 파일 저장, 불러오기 실패")
+            print(f"녹음 불러오기 실패")
+            return
+        # 디스크 저장은 백그라운드에서. 팝업은 바로 다음 프레임을 그린다
+        SPELL_LIBRARY.save(spell_id, clip, capture.samplerate)
 
     record_btn = Button(popup_x + 40, popup_y + 230, 150, 60, "녹음", BLUE, (0, 150, 255))
     play_btn = Button(popup_x + 220, popup_y + 230, 150, 60, "소리 듣기", GREEN, (0, 180, 0))
     ok_btn = Button(popup_x + 400, popup_y + 230, 120, 60, "확인", ORANGE, (255, 200, 0))
     cancel_btn = Button(popup_x + 540, popup_y + 230, 120, 60, "취소", DARK_RED, (200, 0, 0))
+    buttons = (record_btn, play_btn, ok_btn, cancel_btn)
+    popup = menu_panel((popup_w, popup_h))
+    popup.invalidate()
 
     running = True
     while running:
@@ -2870,6 +5282,8 @@ def open_spell_sound_popup(spell_id, display_name, initial_sound=None, mode="new
                     stop_recording()
                 pygame.quit()
                 exit()
+            if event.type == pygame.WINDOWEXPOSED:
+                popup.invalidate()
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 if record_btn.rect.collidepoint(event.pos):
                     if not is_recording:
@@ -2878,7 +5292,8 @@ def open_spell_sound_popup(spell_id, display_name, initial_sound=None, mode="new
                         stop_recording()
                 elif play_btn.rect.collidepoint(event.pos):
                     if current_sound is not None:
-                        current_sound.play()
+                        SOUNDS.stop_group("ui")
+                        SOUNDS.play(current_sound, "ui", priority=3)
                 elif ok_btn.rect.collidepoint(event.pos):
                     if is_recording:
                         stop_recording()
@@ -2888,17 +5303,9 @@ def open_spell_sound_popup(spell_id, display_name, initial_sound=None, mode="new
                         stop_recording()
                     return initial_sound if mode == "edit" else None
 
-        if is_recording and record_stream is not None:
-            try:
-                frames, overflowed = record_stream.read(frames_per_chunk)
-                recorded_chunks.append(frames.copy())
-            except Exception as e:
-                print(f"녹음 읽기 오류: {e}")
-                stop_recording()
-            else:
-                elapsed = time.time() - record_start_time
-                if elapsed >= max_duration:
-                    stop_recording()
+        # 샘플은 오디오 스레드가 링 버퍼에 채우고 있으니 시간만 본다
+        if is_recording and time.time() - record_start_time >= max_duration:
+            stop_recording()
 
         record_btn.check_hover(mouse_pos)
         play_btn.check_hover(mouse_pos)
@@ -2906,23 +5313,10 @@ def open_spell_sound_popup(spell_id, display_name, initial_sound=None, mode="new
         cancel_btn.check_hover(mouse_pos)
         record_btn.text = "녹음 중지" if is_recording else "녹음"
 
-        popup_surf = pygame.Surface((popup_w, popup_h))
-        popup_surf.fill(DARK_GRAY)
-        pygame.draw.rect(popup_surf, WHITE, (0, 0, popup_w, popup_h), 3)
-
         if mode == "new":
             title_text = f"새 마법 '{display_name}' 주문 녹음"
         else:
             title_text = f"마법 '{display_name}' 주문 소리 편집"
-        title_surf = title_font.render(title_text, True, WHITE)
-        popup_surf.blit(title_surf, title_surf.get_rect(center=(popup_w//2, 50)))
-
-        line1 = text_font.render("녹음: 최대 3초 동안 말할 수 있고, 다시 누르면 중지됩니다.", True, WHITE)
-        line2 = text_font.render("소리 듣기: 현재 저장된 주문 소리를 들어볼 수 있습니다.", True, WHITE)
-        line3 = small_font.render("마음에 들지 않으면 재녹음하세요.", True, LIGHT_GRAY)
-        popup_surf.blit(line1, (40, 110))
-        popup_surf.blit(line2, (40, 140))
-        popup_surf.blit(line3, (40, 170))
 
         if is_recording:
             status_text = "상태: 녹음 중..."
@@ -2934,15 +5328,25 @@ def open_spell_sound_popup(spell_id, display_name, initial_sound=None, mode="new
             else:
                 status_text = "상태: 소리가 등록되어 있습니다."
                 status_color = CYAN if has_recorded else GREEN
-        status_surf = text_font.render(status_text, True, status_color)
-        popup_surf.blit(status_surf, (40, 200))
-
-        screen.blit(popup_surf, (popup_x, popup_y))
-        record_btn.draw(screen)
-        play_btn.draw(screen)
-        ok_btn.draw(screen)
-        cancel_btn.draw(screen)
-        pygame.display.flip()
+
+        labels = (
+            (title_text, 32, WHITE, (popup_w//2, 50), True),
+            ("녹음: 최대 3초 동안 말할 수 있고, 다시 누르면 중지됩니다.", 22, WHITE, (40, 110), False),
+            ("소리 듣기: 현재 저장된 주문 소리를 들어볼 수 있습니다.", 22, WHITE, (40, 140), False),
+            ("마음에 들지 않으면 재녹음하세요.", 18, LIGHT_GRAY, (40, 170), False),
+            (status_text, 22, status_color, (40, 200), False),
+        )
+        hover_key = tuple(btn.is_hovered for btn in buttons) + (record_btn.text,)
+        # 글자/버튼 상태가 그대로면 다시 그리지도 flip 하지도 않는다
+        changed = popup.update(labels, extra_key=hover_key)
+        # 녹음 중에는 레벨 미터/파형 때문에 매 프레임 다시 그린다
+        if changed or is_recording:
+            screen.blit(popup.surface, (popup_x, popup_y))
+            if is_recording:
+                draw_capture_meter(screen, (popup_x + 40, popup_y + 305, popup_w - 80, 55), capture)
+            for btn in buttons:
+                btn.draw(screen)
+            pygame.display.flip()
         clock.tick(60)
 
     if is_recording:
@@ -2951,6 +5355,7 @@ def open_spell_sound_popup(spell_id, display_name, initial_sound=None, mode="new
 
 
 def record_spell_sound_ui(spell_id):
+    preload_audio_libs()
     duration = 3
     message_font = get_korean_font(32)
     small_font = get_korean_font(20)
@@ -2969,8 +5374,30 @@ def record_spell_sound_ui(spell_id):
     pygame.display.flip()
     pygame.time.wait(1000)
 
-    filename = os.path.join(SPELL_SOUND_DIR, f"1331_황정빈{spell_id}.wav")
-    record_audio_to_file(filename, duration=duration, samplerate=44100)
+    capture = AudioCapture(samplerate=44100, max_duration=duration)
+    try:
+        capture.start()
+    except Exception as e:
+        print(f"녹음 시작 실패: {e}")
+        return None
+    meter_rect = pygame.Rect(WIDTH//2 - 300, HEIGHT//2 + 100, 600, 80)
+    record_start_time = time.time()
+    while time.time() - record_start_time < duration:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                capture.stop()
+                pygame.quit()
+                exit()
+        screen.blit(overlay, (0, 0))
+        draw_capture_meter(screen, meter_rect, capture)
+        pygame.display.flip()
+        clock.tick(60)
+    capture.stop()
+    clip = capture.to_clip()
+    sound = None
+    if len(clip):
+        sound = pcm_to_sound(clip, capture.samplerate)
+        SPELL_LIBRARY.save(spell_id, clip, capture.samplerate)
 
     overlay.fill(BLACK)
     done_text = message_font.render("녹음 완료", True, GREEN)
@@ -2981,42 +5408,42 @@ def record_spell_sound_ui(spell_id):
     pygame.display.flip()
     pygame.time.wait(800)
 
-    try:
-        sound = pygame.mixer.Sound(filename)
-        return sound
-    except Exception as e:
-        print(f"녹음 사운드 로드 실패: {e}")
-        return None
+    return sound
 
 #GPT 작성
 def open_sound_edit_menu(player):
+    if SCRIPTED_INPUT:
+        return False
     if not player.known_spells:
-        overlay = pygame.Surface((WIDTH, HEIGHT))
-        overlay.set_alpha(220)
-        overlay.fill(BLACK)
-        font = get_korean_font(32)
-        small = get_korean_font(20)
-        t1 = font.render("배운 마법이 없습니다.", True, WHITE)
-        t2 = small.render("소리 교환권이 사용되지 않았습니다.", True, LIGHT_GRAY)
-        overlay.blit(t1, t1.get_rect(center=(WIDTH//2, HEIGHT//2 - 20)))
-        overlay.blit(t2, t2.get_rect(center=(WIDTH//2, HEIGHT//2 + 20)))
-        screen.blit(overlay, (0, 0))
-        pygame.display.flip()
-        pygame.time.wait(1000)
+        show_menu_notice("배운 마법이 없습니다.", "소리 교환권이 사용되지 않았습니다.")
         return False
 
     spell_ids = list(player.known_spells.keys())
     selected = 0
     running = True
-    title_font = get_korean_font(34)
-    item_font = get_korean_font(24)
-    small_font = get_korean_font(18)
+    background = screen.copy()
+    overlay = menu_overlay()
+    overlay.invalidate()
+
+    def edit_selected():
+        spell_id = spell_ids[selected]
+        display_name = SPELL_DISPLAY_NAMES.get(spell_id, spell_id)
+        existing_sound = player.spell_sounds.get(spell_id)
+        sound = open_spell_sound_popup(spell_id, display_name, initial_sound=existing_sound, mode="edit")
+        # 팝업이 화면을 덮어썼으니 다음 프레임에 다시 그린다
+        overlay.invalidate()
+        if sound is not None:
+            player.spell_sounds[spell_id] = sound
+            return True
+        return False
 
     while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 exit()
+            if event.type == pygame.WINDOWEXPOSED:
+                overlay.invalidate()
             if event.type == pygame.KEYDOWN:
                 if event.key in (pygame.K_UP, pygame.K_w):
                     selected = (selected - 1) % len(spell_ids)
@@ -3025,34 +5452,18 @@ def open_sound_edit_menu(player):
                 elif event.key == pygame.K_ESCAPE:
                     return False
                 elif event.key in (pygame.K_RETURN, pygame.K_SPACE):
-                    spell_id = spell_ids[selected]
-                    display_name = SPELL_DISPLAY_NAMES.get(spell_id, spell_id)
-                    existing_sound = player.spell_sounds.get(spell_id)
-                    sound = open_spell_sound_popup(spell_id, display_name, initial_sound=existing_sound, mode="edit")
-                    if sound is not None:
-                        player.spell_sounds[spell_id] = sound
+                    if edit_selected():
                         return True
             elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                spell_id = spell_ids[selected]
-                display_name = SPELL_DISPLAY_NAMES.get(spell_id, spell_id)
-                existing_sound = player.spell_sounds.get(spell_id)
-                sound = open_spell_sound_popup(spell_id, display_name, initial_sound=existing_sound, mode="edit")
-                if sound is not None:
-                    player.spell_sounds[spell_id] = sound
+                if edit_selected():
                     return True
 
-        overlay = pygame.Surface((WIDTH, HEIGHT))
-        overlay.set_alpha(230)
-        overlay.fill(DARK_GRAY)
-        title = title_font.render("소리 교환권 - 마법 선택", True, WHITE)
-        overlay.blit(title, title.get_rect(center=(WIDTH//2, 120)))
-
-        info1 = small_font.render("↑/↓ : 마법 선택", True, WHITE)
-        info2 = small_font.render("Enter : 선택한 마법의 주문 소리 편집", True, YELLOW)
-        info3 = small_font.render("ESC : 취소 (교환권 유지)", True, LIGHT_GRAY)
-        overlay.blit(info1, (WIDTH//2 - 220, 170))
-        overlay.blit(info2, (WIDTH//2 - 220, 200))
-        overlay.blit(info3, (WIDTH//2 - 220, 230))
+        labels = [
+            ("소리 교환권 - 마법 선택", 34, WHITE, (WIDTH//2, 120), True),
+            ("↑/↓ : 마법 선택", 18, WHITE, (WIDTH//2 - 220, 170), False),
+            ("Enter : 선택한 마법의 주문 소리 편집", 18, YELLOW, (WIDTH//2 - 220, 200), False),
+            ("ESC : 취소 (교환권 유지)", 18, LIGHT_GRAY, (WIDTH//2 - 220, 230), False),
+        ]
 
         start_y = 280
         line_h = 35
@@ -3062,11 +5473,12 @@ def open_sound_edit_menu(player):
             prefix = "▶ " if idx == selected else "  "
             color = YELLOW if idx == selected else WHITE
             text = f"{prefix}{name} ({rank}랭크)"
-            surf = item_font.render(text, True, color)
-            overlay.blit(surf, (WIDTH//2 - 200, start_y + idx * line_h))
+            labels.append((text, 24, color, (WIDTH//2 - 200, start_y + idx * line_h), False))
 
-        screen.blit(overlay, (0, 0))
-        pygame.display.flip()
+        if overlay.update(tuple(labels), alpha=230, border=0):
+            screen.blit(background, (0, 0))
+            screen.blit(overlay.surface, (0, 0))
+            pygame.display.flip()
         clock.tick(60)
 
 
@@ -3082,6 +5494,7 @@ ITEM_USE_FUNCTIONS["소리 교환권"] = use_sound_ticket
 
 
 def map_transition_effect(text="맵 이동 중..."):
+    """전환 화면을 2초 보여준다. 그동안 창을 닫으면 False (main 루프가 정상적으로 끝나게)."""
     bg = None
     start_path = os.path.join("img", "start.png")
     if os.path.exists(start_path):
@@ -3100,8 +5513,7 @@ def map_transition_effect(text="맵 이동 중..."):
     while pygame.time.get_ticks() - start_time < duration:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
+                return False
         if bg:
             screen.blit(bg, (0, 0))
         else:
@@ -3109,12 +5521,282 @@ def map_transition_effect(text="맵 이동 중..."):
         screen.blit(text_surf, text_rect)
         pygame.display.flip()
         clock.tick(60)
+    return True
+
+
+
+BENCHMARK_SCENARIOS = ("slimes", "spells", "storm")
+
+
+class BenchmarkRun:
+    """--benchmark 시나리오 하나. main() 루프에 끼어서 입력 이벤트를 대신 넣고 프레임 시간을 잰다.
+    벤치마크 중에는 프레임마다 시뮬레이션을 정확히 한 스텝만 돌려서 기계가 달라도 같은 일을 하게 한다."""
+    WARMUP_FRAMES = 30
+
+    def __init__(self, scenario, frames=600, slimes=300, seed=1234):
+        if scenario not in BENCHMARK_SCENARIOS and scenario != "replay":
+            raise ValueError(f"알 수 없는 시나리오: {scenario} ({', '.join(BENCHMARK_SCENARIOS)})")
+        self.scenario = scenario
+        self.frames = frames
+        self.slimes = slimes
+        self.seed = seed
+        self.gender = "male"
+        self.frame = 0
+        self.times = []
+        self.frame_start = 0.0
+        self.enemies = 0
+
+    def setup(self, player, game_map, spawn_slime):
+        random.seed(self.seed)
+        PARTICLES.seed(self.seed)
+        player.max_hp = player.hp = 10 ** 9
+        player.max_mp = player.mp = 10 ** 9
+        if self.scenario == "storm":
+            spells = ["meteor", "thunder", "iceberg", "backflow"]
+            rank = "S"
+        else:
+            spells = ["fireball", "ice_lans", "lightning_bolt", "water_blast"]
+            rank = "C"
+        for spell_id in spells:
+            player.known_spells[spell_id] = rank
+        player.equipped_spells[:] = spells
+
+        rng = random.Random(self.seed)
+        placed = 0
+        attempts = 0
+        while placed < self.slimes and attempts < self.slimes * 50:
+            attempts += 1
+            x = player.x + rng.uniform(-900, 900)
+            y = player.y + rng.uniform(-700, 700)
+            if not game_map.tiled_map.rect_blocked(pygame.Rect(x, y, 60, 60)):
+                game_map.add_enemy(spawn_slime(int(x), int(y), rng.randint(1, 5)))
+                placed += 1
+        if self.scenario == "storm":
+            # 마법을 배울 때 하는 이펙트 굽기를 미리 해둔다 (측정에서 빼려고)
+            prebake_spell_effects(spells)
+
+    def _post_key(self, key):
+        pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode="", scancode=0))
+
+    def begin_frame(self):
+        self.frame += 1
+        self.frame_start = time.perf_counter()
+        if self.scenario == "replay":
+            return
+        if self.frame == 1:
+            self._post_key(pygame.K_v)  # 자동 조준
+        if self.scenario == "spells":
+            every = 4
+        elif self.scenario == "storm":
+            every = 20
+        else:
+            return
+        if self.frame % every == 0:
+            self._post_key(pygame.K_1 + (self.frame // every) % 4)
+            self._post_key(pygame.K_SPACE)
+
+    def end_frame(self, game_map):
+        self.times.append(time.perf_counter() - self.frame_start)
+        if game_map:
+            self.enemies = len(game_map.enemies)
+        return self.frame < self.frames
+
+    def report(self):
+        times = sorted(t * 1000.0 for t in self.times[self.WARMUP_FRAMES:]) or [0.0]
+
+        def pct(p):
+            return round(times[min(len(times) - 1, int(len(times) * p / 100))], 3)
+
+        mean = sum(times) / len(times)
+        return {
+            "scenario": self.scenario,
+            "frames": len(times),
+            "warmup_frames": self.WARMUP_FRAMES,
+            "enemies": self.enemies,
+            "mean_ms": round(mean, 3),
+            "p50_ms": pct(50),
+            "p90_ms": pct(90),
+            "p95_ms": pct(95),
+            "p99_ms": pct(99),
+            "max_ms": round(times[-1], 3),
+            "fps": round(1000.0 / mean, 1) if mean > 0 else None,
+        }
 
 
+# 리플레이 파일에 남기는 키 (Player.move 가 keys[...] 로 읽는 것들)
+REPLAY_KEYS = (pygame.K_w, pygame.K_a, pygame.K_s, pygame.K_d, pygame.K_LCTRL, pygame.K_RCTRL)
+REPLAY_VERSION = 1
+
+
+class InputRecorder:
+    """--record 파일: 시드, 시작 맵, 프레임별 프레임 시간(ms)/입력 이벤트/누르고 있는 키를 모아서
+    끝날 때 gzip JSON 으로 저장한다. 키는 바뀐 프레임만, 이벤트는 있는 프레임만 적는다."""
+    def __init__(self, path, seed=None):
+        self.path = path
+        self.seed = seed if seed is not None else random.randrange(2 ** 31)
+        self.gender = None
+        self.start_map = None
+        self.frame_ms = []
+        self.events = []
+        self.keys = []
+        self.last_keys = None
+
+    def add(self, frame_ms, events, keys):
+        frame = len(self.frame_ms)
+        self.frame_ms.append(int(frame_ms))
+        for event in events:
+            if event.type == pygame.QUIT:
+                self.events.append([frame, "q"])
+            elif event.type == pygame.KEYDOWN:
+                self.events.append([frame, "k", event.key])
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                self.events.append([frame, "md", event.button, event.pos[0], event.pos[1]])
+            elif event.type == pygame.MOUSEBUTTONUP:
+                self.events.append([frame, "mu", event.button, event.pos[0], event.pos[1]])
+            elif event.type == pygame.MOUSEMOTION:
+                self.events.append([frame, "mm", event.pos[0], event.pos[1]])
+        pressed = [k for k in REPLAY_KEYS if keys[k]]
+        if pressed != self.last_keys:
+            self.keys.append([frame, pressed])
+            self.last_keys = pressed
+
+    def save(self):
+        data = {
+            "version": REPLAY_VERSION,
+            "seed": self.seed,
+            "gender": self.gender,
+            "start_map": self.start_map,
+            "frame_ms": self.frame_ms,
+            "events": self.events,
+            "keys": self.keys,
+        }
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        print(f"[INFO] 입력 {len(self.frame_ms)}프레임 녹화 -> {self.path} ({os.path.getsize(self.path) / 1024:.1f}KB)")
+
+
+class ReplayKeys:
+    """pygame.key.get_pressed() 대신 쓰는 눌린 키 목록."""
+    def __init__(self, pressed):
+        self.pressed = frozenset(pressed)
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+
+class InputReplay:
+    """--replay 파일을 읽어서 프레임마다 (프레임 ms, 이벤트 목록, 눌린 키) 를 돌려준다."""
+    def __init__(self, path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != REPLAY_VERSION:
+            raise ValueError(f"리플레이 버전이 다릅니다: {data.get('version')}")
+        self.path = path
+        self.seed = data["seed"]
+        self.gender = data["gender"]
+        self.start_map = data["start_map"]
+        self.frame_ms = data["frame_ms"]
+        self.events = data["events"]
+        self.keys = data["keys"]
+        self.frame = 0
+        self.event_pos = 0
+        self.key_pos = 0
+        self.pressed = ReplayKeys(())
+
+    def __len__(self):
+        return len(self.frame_ms)
+
+    def next_frame(self):
+        frame = self.frame
+        if frame >= len(self.frame_ms):
+            return None
+        events = []
+        while self.event_pos < len(self.events) and self.events[self.event_pos][0] == frame:
+            rec = self.events[self.event_pos]
+            kind = rec[1]
+            if kind == "q":
+                events.append(pygame.event.Event(pygame.QUIT))
+            elif kind == "k":
+                events.append(pygame.event.Event(pygame.KEYDOWN, key=rec[2], mod=0, unicode="", scancode=0))
+            elif kind == "md":
+                events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=rec[2], pos=(rec[3], rec[4])))
+            elif kind == "mu":
+                events.append(pygame.event.Event(pygame.MOUSEBUTTONUP, button=rec[2], pos=(rec[3], rec[4])))
+            elif kind == "mm":
+                events.append(pygame.event.Event(pygame.MOUSEMOTION, pos=(rec[2], rec[3]), rel=(0, 0), buttons=(0, 0, 0)))
+            self.event_pos += 1
+        if self.key_pos < len(self.keys) and self.keys[self.key_pos][0] == frame:
+            self.pressed = ReplayKeys(self.keys[self.key_pos][1])
+            self.key_pos += 1
+        self.frame += 1
+        return self.frame_ms[frame], events, self.pressed
+
+
+def argv_value(name, default):
+    if name in sys.argv:
+        idx = sys.argv.index(name)
+        if idx + 1 < len(sys.argv) and not sys.argv[idx + 1].startswith("--"):
+            return sys.argv[idx + 1]
+    return default
+
+
+def run_benchmark(replay_path=None):
+    """python main.py --benchmark [--scenario slimes|spells|storm|all] [--frames 600] [--slimes 300]
+    [--enemy-backend objects|arrays] [--out 파일]
+    --replay 파일을 같이 주면 시나리오 대신 녹화된 입력을 그대로 돌린다."""
+    results = []
+    if replay_path:
+        replay = InputReplay(replay_path)
+        bench = BenchmarkRun("replay", frames=len(replay))
+        main(bench=bench, replay=replay)
+        results.append(bench.report())
+    else:
+        scenario = argv_value("--scenario", "all")
+        scenarios = BENCHMARK_SCENARIOS if scenario == "all" else (scenario,)
+        frames = int(argv_value("--frames", 600))
+        slimes = int(argv_value("--slimes", 300))
+        for name in scenarios:
+            bench = BenchmarkRun(name, frames=frames, slimes=slimes)
+            main(bench=bench)
+            results.append(bench.report())
+    report = {
+        "driver": pygame.display.get_driver(),
+        "enemy_backend": ENEMY_BACKEND,
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    out_path = argv_value("--out", None)
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    pygame.quit()
+
 
-def main():
-    global VOLUME, weapon_menu_requested
-    gender = main_menu()
+def main(bench=None, replay=None, recorder=None):
+    global VOLUME, weapon_menu_requested, SIM_TIME_MS, SCRIPTED_INPUT
+    SCRIPTED_INPUT = bool(bench or replay or recorder)
+    # 측정용 실행(벤치마크/리플레이)은 spell_sounds/ 를 아예 건드리지 않는다
+    use_spell_library = not (bench or replay)
+    # 메뉴 화면에 있는 동안 저장된 주문 소리를 백그라운드로 디코딩해 둔다
+    if use_spell_library:
+        SPELL_LIBRARY.start_loading()
+    if replay:
+        gender = replay.gender
+    elif bench:
+        gender = bench.gender
+    else:
+        gender = main_menu()
+    # 스플래시를 안 거쳤으면(벤치마크/리플레이) 시작 이미지를 여기서 한 번에 불러온다
+    for task in startup_asset_tasks():
+        task()
+
+    # 녹화/리플레이는 같은 시드에서 시작해야 같은 판이 나온다
+    seed = replay.seed if replay else (recorder.seed if recorder else None)
+    if seed is not None:
+        random.seed(seed)
+        PARTICLES.seed(seed)
+    SIM_TIME_MS = 0.0
 
     game_maps = {}
     show_inventory = False
@@ -3145,31 +5827,44 @@ def main():
 
     if os.path.exists("house.tmx") and os.path.exists("map.tmx"):
         try:
-            tmx_house = TiledMap("house.tmx")
-            tmx_map = TiledMap("map.tmx")
+            tmx_house = ASSETS.tiled_map("house.tmx")
+            tmx_map = ASSETS.tiled_map("map.tmx")
             game_maps["house"] = GameMap("house", tmx_house)
             game_maps["map"] = GameMap("map", tmx_map)
         except Exception as e:
             game_maps = None
     elif os.path.exists("map.tmx"):
         try:
-            tmx_map = TiledMap("map.tmx")
+            tmx_map = ASSETS.tiled_map("map.tmx")
             game_maps["map"] = GameMap("map", tmx_map)
         except Exception as e:
             game_maps = None
     else:
         game_maps = None
 
-    if game_maps and "house" in game_maps:
+    if replay and game_maps and replay.start_map in game_maps:
+        current_map_name = replay.start_map
+    elif bench and game_maps and "map" in game_maps:
+        current_map_name = "map"
+    elif game_maps and "house" in game_maps:
         current_map_name = "house"
     elif game_maps:
         current_map_name = "map"
     else:
         current_map_name = None
 
+    if recorder:
+        recorder.gender = gender
+        recorder.start_map = current_map_name
+        # 팝업 창들은 창을 닫으면 바로 exit() 하니까, 그때도 녹화는 저장되게
+        atexit.register(recorder.save)
+
     current_map = game_maps[current_map_name] if current_map_name else None
     spawn_x, spawn_y = current_map.tiled_map.find_player_spawn() if current_map else (WIDTH // 2, HEIGHT // 2)
     player = Player(spawn_x, spawn_y, gender)
+    prebake_spell_effects(player.known_spells)
+    if use_spell_library:
+        player.spell_sounds.update(SPELL_LIBRARY.load_sounds())
     camera = Camera(WIDTH, HEIGHT)
 
     def update_camera_offset():
@@ -3189,8 +5884,7 @@ def main():
         size = PLAYER_SIZE
         if os.path.exists(fname):
             try:
-                img = pygame.image.load(fname).convert_alpha()
-                return pygame.transform.scale(img, (size, size))
+                return ASSETS.image(fname, (size, size))
             except Exception as e:
                 print(f"{fname} 로드 실패")
         surf = pygame.Surface((size, size), pygame.SRCALPHA)
@@ -3239,10 +5933,12 @@ def main():
             enemy_spawns = cmap.tiled_map.find_enemy_spawns()
             for ex, ey, etype, level in enemy_spawns:
                 if etype in enemy_factory:
-                    cmap.enemies.append(enemy_factory[etype](ex, ey, level))
+                    cmap.add_enemy(enemy_factory[etype](ex, ey, level))
             cmap.enemies_spawned = True
 
     spawn_enemies_on_map(current_map)
+    if bench and current_map and not replay:
+        bench.setup(player, current_map, enemy_factory["slime"])
     fireball_intro_done = False
     running = True
 
@@ -3251,17 +5947,23 @@ def main():
 
     setup_quest_npcs_for_all_maps()
 
-    def draw_quest_status(surface):
-        status_font = get_korean_font(22)
-        small_font = get_korean_font(18)
-        padding = 16
+    def build_quest_panel(title, desc, color):
         panel_w = 320
         panel_h = 72
-        x = WIDTH - panel_w - padding
-        y = padding
         panel = pygame.Surface((panel_w, panel_h), pygame.SRCALPHA)
         panel.fill((0, 0, 0, 140))
         pygame.draw.rect(panel, WHITE, (0, 0, panel_w, panel_h), 2)
+        t1 = render_text(title, 22, color)
+        t2 = render_text(desc, 18, WHITE)
+        panel.blit(t1, (12, 10))
+        panel.blit(t2, (12, 40))
+        return panel
+
+    def draw_quest_status(surface):
+        padding = 16
+        panel_w = 320
+        x = WIDTH - panel_w - padding
+        y = padding
 
         if quest_final_complete:
             title = "퀘스트 완료"
@@ -3276,608 +5978,704 @@ def main():
             desc = "NPC에게서 퀘스트를 받으세요 (!)"
             color = ORANGE
 
-        t1 = status_font.render(title, True, color)
-        t2 = small_font.render(desc, True, WHITE)
-        panel.blit(t1, (12, 10))
-        panel.blit(t2, (12, 40))
-        surface.blit(panel, (x, y))
+        # 패널은 퀘스트 문구가 바뀔 때만 새로 만든다
+        _HUD.blit(surface, "quest", (title, desc), (x, y),
+                  lambda: build_quest_panel(title, desc, color))
 
-    while running:
-        clock.tick(60)
+    sim_dt = 1000.0 / SIM_HZ
+    sim_accumulator = 0.0
+    sim_interp = SimInterpolator()
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
+    def interp_objects():
+        objs = [player, camera]
+        if current_map:
+            objs.extend(current_map.enemies)
+        objs.extend(player_spells)
+        objs.extend(enemy_projectiles)
+        objs.extend(xp_orbs)
+        return objs
 
-            if event.type == pygame.KEYDOWN:
-                if show_swap_menu:
-                    if event.key == pygame.K_ESCAPE:
-                        show_swap_menu = False
-                    elif swap_phase == 0:
-                        if pygame.K_1 <= event.key <= pygame.K_4:
-                            idx = event.key - pygame.K_1
-                            if 0 <= idx < MAX_SPELL_SLOTS:
-                                swap_selected_slot = idx
-                        if event.key in (pygame.K_UP, pygame.K_w):
-                            swap_selected_slot = (swap_selected_slot - 1) % MAX_SPELL_SLOTS
-                        elif event.key in (pygame.K_DOWN, pygame.K_s):
-                            swap_selected_slot = (swap_selected_slot + 1) % MAX_SPELL_SLOTS
-                        if event.key in (pygame.K_RETURN, pygame.K_SPACE):
-                            swap_phase = 1
-                    else:
-                        if event.key in (pygame.K_UP, pygame.K_w):
-                            if swap_unequipped_spells:
-                                swap_selected_index = (swap_selected_index - 1) % len(swap_unequipped_spells)
-                        elif event.key in (pygame.K_DOWN, pygame.K_s):
-                            if swap_unequipped_spells:
-                                swap_selected_index = (swap_selected_index + 1) % len(swap_unequipped_spells)
-                        if event.key in (pygame.K_RETURN, pygame.K_SPACE):
-                            if swap_unequipped_spells:
-                                new_spell = swap_unequipped_spells[swap_selected_index]
-                                if swap_selected_slot >= len(player.equipped_spells):
-                                    if len(player.equipped_spells) < MAX_SPELL_SLOTS:
-                                        player.equipped_spells.append(new_spell)
-                                else:
-                                    player.equipped_spells[swap_selected_slot] = new_spell
-                                selected_spell_slot = swap_selected_slot
+    first_game_frame = True
+    while running:
+        # 렌더 프레임 시간만큼 누적해 두고 SIM_HZ 고정 스텝으로 소모한다
+        if bench is not None:
+            bench.begin_frame()
+        if replay is not None:
+            frame = replay.next_frame()
+            if frame is None:
+                break
+            frame_ms, frame_events, keys = frame
+            pygame.event.pump()
+            if bench is None:
+                clock.tick(RENDER_FPS)
+        else:
+            if bench is not None:
+                frame_ms = sim_dt
+            else:
+                frame_ms = clock.tick(RENDER_FPS)
+            frame_events = pygame.event.get()
+            keys = pygame.key.get_pressed()
+        if recorder is not None:
+            recorder.add(frame_ms, frame_events, keys)
+        sim_accumulator += min(frame_ms, MAX_FRAME_MS)
+        # 입력 대기(clock.tick) 뒤부터 재야 프레임 시간이 실제 일한 시간이 된다
+        PROFILER.begin_frame()
+
+        with PROFILER.section("events"):
+            for event in frame_events:
+                if event.type == pygame.QUIT:
+                    running = False
+
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_F3:
+                        PROFILER.toggle()
+                        continue
+                    if event.key == pygame.K_F4:
+                        # 처음 누르면 트레이스 기록 시작, 그다음부터는 누를 때마다 파일로 저장
+                        if PROFILER.trace is None:
+                            PROFILER.start_trace()
+                        else:
+                            PROFILER.export_trace()
+                        continue
+                    if show_swap_menu:
+                        if event.key == pygame.K_ESCAPE:
                             show_swap_menu = False
-                    continue
+                        elif swap_phase == 0:
+                            if pygame.K_1 <= event.key <= pygame.K_4:
+                                idx = event.key - pygame.K_1
+                                if 0 <= idx < MAX_SPELL_SLOTS:
+                                    swap_selected_slot = idx
+                            if event.key in (pygame.K_UP, pygame.K_w):
+                                swap_selected_slot = (swap_selected_slot - 1) % MAX_SPELL_SLOTS
+                            elif event.key in (pygame.K_DOWN, pygame.K_s):
+                                swap_selected_slot = (swap_selected_slot + 1) % MAX_SPELL_SLOTS
+                            if event.key in (pygame.K_RETURN, pygame.K_SPACE):
+                                swap_phase = 1
+                        else:
+                            if event.key in (pygame.K_UP, pygame.K_w):
+                                if swap_unequipped_spells:
+                                    swap_selected_index = (swap_selected_index - 1) % len(swap_unequipped_spells)
+                            elif event.key in (pygame.K_DOWN, pygame.K_s):
+                                if swap_unequipped_spells:
+                                    swap_selected_index = (swap_selected_index + 1) % len(swap_unequipped_spells)
+                            if event.key in (pygame.K_RETURN, pygame.K_SPACE):
+                                if swap_unequipped_spells:
+                                    new_spell = swap_unequipped_spells[swap_selected_index]
+                                    if swap_selected_slot >= len(player.equipped_spells):
+                                        if len(player.equipped_spells) < MAX_SPELL_SLOTS:
+                                            player.equipped_spells.append(new_spell)
+                                    else:
+                                        player.equipped_spells[swap_selected_slot] = new_spell
+                                    selected_spell_slot = swap_selected_slot
+                                show_swap_menu = False
+                        continue
 
-                if event.key == pygame.K_i:
-                    show_inventory = not show_inventory
-                    if show_inventory:
+                    if event.key == pygame.K_i:
+                        show_inventory = not show_inventory
+                        if show_inventory:
+                            show_skill_menu = False
+                            show_setting = False
+                            show_weapon_menu = False
+                    elif event.key == pygame.K_e:
+                        show_skill_menu = not show_skill_menu
+                        if show_skill_menu:
+                            show_inventory = False
+                            show_setting = False
+                            show_weapon_menu = False
+                    elif event.key == pygame.K_n and show_skill_menu == True:
+                        show_weapon_menu = True
                         show_skill_menu = False
+                        show_inventory = False
                         show_setting = False
+                        available_weapons = collect_available_weapons()
+                        if player.weapon in available_weapons:
+                            selected_weapon_index = available_weapons.index(player.weapon)
+                        else:
+                            selected_weapon_index = 0
+                        selected_spell_slot = min(selected_spell_slot, len(player.equipped_spells) - 1) if player.equipped_spells else 0
+
+                    elif event.key == pygame.K_m and show_skill_menu == True:
+                        spells = list(player.known_spells.keys())
+                        equipped_set = set(player.equipped_spells[:MAX_SPELL_SLOTS])
+                        swap_unequipped_spells = [sid for sid in spells if sid not in equipped_set]
+
+                        if not swap_unequipped_spells:
+                            show_menu_notice("장착되지 않은 마법이 없습니다.", "새로 끼울 마법이 없습니다.")
+                        else:
+                            show_swap_menu = True
+                            swap_phase = 0
+                            swap_selected_slot = selected_spell_slot
+                            swap_selected_index = 0
+                        show_skill_menu = False
                         show_weapon_menu = False
-                elif event.key == pygame.K_e:
-                    show_skill_menu = not show_skill_menu
-                    if show_skill_menu:
                         show_inventory = False
                         show_setting = False
-                        show_weapon_menu = False
-                elif event.key == pygame.K_n and show_skill_menu == True:
-                    show_weapon_menu = True
-                    show_skill_menu = False
-                    show_inventory = False
-                    show_setting = False
-                    available_weapons = collect_available_weapons()
-                    if player.weapon in available_weapons:
-                        selected_weapon_index = available_weapons.index(player.weapon)
-                    else:
-                        selected_weapon_index = 0
-                    selected_spell_slot = min(selected_spell_slot, len(player.equipped_spells) - 1) if player.equipped_spells else 0
-
-                elif event.key == pygame.K_m and show_skill_menu == True:
-                    spells = list(player.known_spells.keys())
-                    equipped_set = set(player.equipped_spells[:MAX_SPELL_SLOTS])
-                    swap_unequipped_spells = [sid for sid in spells if sid not in equipped_set]
-
-                    if not swap_unequipped_spells:
-                        overlay = pygame.Surface((WIDTH, HEIGHT))
-                        overlay.set_alpha(220)
-                        overlay.fill(BLACK)
-                        font = get_korean_font(32)
-                        small = get_korean_font(20)
-                        t1 = font.render("장착되지 않은 마법이 없습니다.", True, WHITE)
-                        t2 = small.render("새로 끼울 마법이 없습니다.", True, LIGHT_GRAY)
-                        overlay.blit(t1, t1.get_rect(center=(WIDTH//2, HEIGHT//2 - 20)))
-                        overlay.blit(t2, t2.get_rect(center=(WIDTH//2, HEIGHT//2 + 20)))
-                        screen.blit(overlay, (0, 0))
-                        pygame.display.flip()
-                        pygame.time.wait(1000)
-                    else:
-                        show_swap_menu = True
-                        swap_phase = 0
-                        swap_selected_slot = selected_spell_slot
-                        swap_selected_index = 0
-                    show_skill_menu = False
-                    show_weapon_menu = False
-                    show_inventory = False
-                    show_setting = False
 
-                elif event.key == pygame.K_n and show_weapon_menu:
-                    show_weapon_menu = False
-                    show_skill_menu = True
+                    elif event.key == pygame.K_n and show_weapon_menu:
+                        show_weapon_menu = False
+                        show_skill_menu = True
 
-                elif event.key == pygame.K_m and show_swap_menu:
-                    show_swap_menu = False
-                    show_skill_menu = True
+                    elif event.key == pygame.K_m and show_swap_menu:
+                        show_swap_menu = False
+                        show_skill_menu = True
 
                 
                     
-                elif event.key == pygame.K_ESCAPE and (show_inventory or show_skill_menu or show_setting or show_weapon_menu):
-                    show_inventory = False
-                    show_skill_menu = False
-                    show_setting = False
-                    show_weapon_menu = False
-                elif event.key == pygame.K_ESCAPE:
-                    show_setting = not show_setting
+                    elif event.key == pygame.K_ESCAPE and (show_inventory or show_skill_menu or show_setting or show_weapon_menu):
+                        show_inventory = False
+                        show_skill_menu = False
+                        show_setting = False
+                        show_weapon_menu = False
+                    elif event.key == pygame.K_ESCAPE:
+                        show_setting = not show_setting
+
+                    if event.key == pygame.K_v:
+                        auto_targeting = not auto_targeting
+                        if not auto_targeting:
+                            target_position = None
+
+                    if event.key == pygame.K_f and current_map:
+                        interacted = False
+                        for npc in current_map.quest_npcs:
+                            dummy_ent = type("E", (), {"x": npc["x"], "y": npc["y"], "width": PLAYER_SIZE, "height": PLAYER_SIZE})()
+                            if distance_between(dummy_ent, player) <= quest_npc_interact_range:
+                                interacted = True
+                                if quest_final_complete:
+                                    print("[퀘스트 끗")
+                                elif quest_active:
+                                    print(f"퀘스트 진행중")
+                                else:
+                                    quest_active = True
+                                    quest_kill_count = 0
+                                    quest_kill_target = next_quest_target(quest_kill_target)
+                                    print(f"[퀘스트 수락] 슬라임 {quest_kill_target}마리 처치")
+                                break
+                        if not interacted and current_map.quest_npcs:
+                            print("너무 멀리잇슨")
 
-                if event.key == pygame.K_v:
-                    auto_targeting = not auto_targeting
-                    if not auto_targeting:
-                        target_position = None
+                    if show_inventory:
+                        if pygame.K_1 <= event.key <= pygame.K_9:
+                            index = event.key - pygame.K_1
+                            items = list(player.inventory.keys())
+                            if 0 <= index < len(items):
+                                item_name = items[index]
+                                use_item(player, item_name)
+                            continue
 
-                if event.key == pygame.K_f and current_map:
-                    interacted = False
-                    for npc in current_map.quest_npcs:
-                        dummy_ent = type("E", (), {"x": npc["x"], "y": npc["y"], "width": PLAYER_SIZE, "height": PLAYER_SIZE})()
-                        if distance_between(dummy_ent, player) <= quest_npc_interact_range:
-                            interacted = True
-                            if quest_final_complete:
-                                print("[퀘스트 끗")
-                            elif quest_active:
-                                print(f"퀘스트 진행중")
-                            else:
-                                quest_active = True
-                                quest_kill_count = 0
-                                quest_kill_target = next_quest_target(quest_kill_target)
-                                print(f"[퀘스트 수락] 슬라임 {quest_kill_target}마리 처치")
-                            break
-                    if not interacted and current_map.quest_npcs:
-                        print("너무 멀리잇슨")
+                    if show_skill_menu:
+                        if pygame.K_1 <= event.key <= pygame.K_4:
+                            index = event.key - pygame.K_1
+                            if 0 <= index < len(player.equipped_spells):
+                                selected_spell_slot = index
+                            continue
 
-                if show_inventory:
-                    if pygame.K_1 <= event.key <= pygame.K_9:
-                        index = event.key - pygame.K_1
-                        items = list(player.inventory.keys())
-                        if 0 <= index < len(items):
-                            item_name = items[index]
-                            use_item(player, item_name)
-                        continue
+                        if event.key in (pygame.K_UP, pygame.K_w):
+                            if player.equipped_spells:
+                                selected_spell_slot = (selected_spell_slot - 1) % len(player.equipped_spells)
+                            continue
+
+                        if event.key in (pygame.K_DOWN, pygame.K_s):
+                            if player.equipped_spells:
+                                selected_spell_slot = (selected_spell_slot + 1) % len(player.equipped_spells)
+                            continue
+
+                    if show_weapon_menu:
+                        available_weapons = collect_available_weapons()
+                        if not available_weapons:
+                            available_weapons = ["맨손"]
+
+                        if pygame.K_1 <= event.key <= pygame.K_9:
+                            idx = event.key - pygame.K_1
+                            if idx < len(available_weapons):
+                                selected_weapon_index = idx
+                            continue
+
+                        if event.key in (pygame.K_UP, pygame.K_w):
+                            selected_weapon_index = (selected_weapon_index - 1) % len(available_weapons)
+                            continue
+                        if event.key in (pygame.K_DOWN, pygame.K_s):
+                            selected_weapon_index = (selected_weapon_index + 1) % len(available_weapons)
+                            continue
+
+                        if event.key in (pygame.K_RETURN, pygame.K_SPACE):
+                            if available_weapons:
+                                player.weapon = available_weapons[selected_weapon_index]
+                            show_weapon_menu = False
+                            continue
 
-                if show_skill_menu:
                     if pygame.K_1 <= event.key <= pygame.K_4:
                         index = event.key - pygame.K_1
                         if 0 <= index < len(player.equipped_spells):
                             selected_spell_slot = index
-                        continue
+                            sel_spell = player.equipped_spells[index]
 
-                    if event.key in (pygame.K_UP, pygame.K_w):
+                    if event.key == pygame.K_SPACE and target_position:
                         if player.equipped_spells:
-                            selected_spell_slot = (selected_spell_slot - 1) % len(player.equipped_spells)
-                        continue
-
-                    if event.key in (pygame.K_DOWN, pygame.K_s):
+                            if 0 <= selected_spell_slot < len(player.equipped_spells):
+                                slot_index = selected_spell_slot
+                            else:
+                                slot_index = 0
+                            spell_id = player.equipped_spells[slot_index]
+                            spell = player.cast_spell(target_position, spell_type=spell_id, current_map=current_map)
+                            if spell:
+                                player_spells.append(spell)
+
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    if event.button == 1 and target_position and not show_inventory and not show_skill_menu and not show_swap_menu:
                         if player.equipped_spells:
-                            selected_spell_slot = (selected_spell_slot + 1) % len(player.equipped_spells)
-                        continue
+                            if 0 <= selected_spell_slot < len(player.equipped_spells):
+                                slot_index = selected_spell_slot
+                            else:
+                                slot_index = 0
+                            spell_id = player.equipped_spells[slot_index]
+                            spell = player.cast_spell(target_position, spell_type=spell_id, current_map=current_map)
+                            if spell:
+                                player_spells.append(spell)
+
+                    if show_setting and event.button == 1:
+                        if volume_slider_rect and volume_slider_rect.collidepoint(event.pos):
+                            dragging_volume = True
+                            rel = (event.pos[0] - volume_slider_rect.x) / volume_slider_rect.width
+                            volume = max(0.0, min(1.0, rel))
+                            VOLUME = volume
+                            SOUNDS.set_master_volume(volume)
+
+                    if event.button == 3 and not show_inventory:
+                        mx, my = event.pos
+                        target_position = (mx + camera.x, my + camera.y)
+
+                elif event.type == pygame.MOUSEBUTTONUP:
+                    if show_setting and event.button == 1:
+                        dragging_volume = False
+
+                elif event.type == pygame.MOUSEMOTION:
+                    if show_setting and dragging_volume and volume_slider_rect:
+                        rel = (event.pos[0] - volume_slider_rect.x) / volume_slider_rect.width
+                        volume = max(0.0, min(1.0, rel))
+                        VOLUME = volume
+                        SOUNDS.set_master_volume(volume)
 
-                if show_weapon_menu:
-                    available_weapons = collect_available_weapons()
-                    if not available_weapons:
-                        available_weapons = ["맨손"]
+        sim_steps = 0
+        while running and sim_accumulator >= sim_dt:
+            if sim_steps >= MAX_CATCHUP_STEPS:
+                # 너무 밀리면 따라잡기를 포기하고 남은 시간은 버린다 (느려지되 멈추진 않게)
+                sim_accumulator %= sim_dt
+                break
+            sim_interp.capture(interp_objects())
+            sim_accumulator -= sim_dt
+            sim_steps += 1
+            SIM_TIME_MS += sim_dt
+
+            with PROFILER.section("player"):
+                player.move(keys, current_map.tiled_map if current_map else None)
+                player.regen_mp()
+                player.regen_hp()
+
+                camera.update(player)
+                if current_map:
+                    current_map.tiled_map.clamp_camera(camera)
+
+                if auto_targeting and current_map and current_map.enemies:
+                    closest_enemy = current_map.enemy_index.nearest(
+                        player.x + player.width / 2,
+                        player.y + player.height / 2,
+                        predicate=lambda e: not (isinstance(e, Slime) and e.dying) and (e.hp > 0 or e.is_dummy),
+                    )
+                    if closest_enemy:
+                        target_position = (
+                            closest_enemy.x + closest_enemy.width / 2,
+                            closest_enemy.y + closest_enemy.height / 2
+                        )
+                    else:
+                        target_position = None
 
-                    if pygame.K_1 <= event.key <= pygame.K_9:
-                        idx = event.key - pygame.K_1
-                        if idx < len(available_weapons):
-                            selected_weapon_index = idx
-                        continue
+                if current_map and game_maps:
+                    player_rect = pygame.Rect(player.x, player.y, player.width, player.height)
+                    for portal in current_map.portals:
+                        if player_rect.colliderect(portal["rect"]):
+                            target_name = portal["portal_type"]
+                            if not target_name:
+                                break
+                            if target_name not in game_maps:
+                                break
+
+                            target_map = game_maps[target_name]
+
+                            target_spawn = portal.get("target_spawn", "")
+                            sx, sy = target_map.tiled_map.find_named_spawn(target_spawn)
+
+                            player.x, player.y = sx, sy
+                            if not map_transition_effect(f"{target_name}(으)로 이동!"):
+                                running = False
+                                break
+                            current_map_name = target_name
+                            current_map = target_map
+                            update_camera_offset()
+                            player_spells.clear()
+                            enemy_projectiles.clear()
+                            PARTICLES.clear()
+                            sim_interp.reset()
+                            target_position = None
+                            item_drops.clear()
+                            spawn_enemies_on_map(current_map)
+                            if current_map_name == "map" and not fireball_intro_done:
+                                show_fireball_intro_and_record(player)
+                                fireball_intro_done = True
+                            break
+            with PROFILER.section("enemies"):
+                if current_map:
+                    current_map.update_enemies(player, camera, enemy_projectiles)
+                    for enemy in current_map.enemies[:]:
+                        if isinstance(enemy, Slime):
+                            if enemy.death_finished:
+                                drop_x = enemy.x + enemy.width/2
+                                drop_y = enemy.y + enemy.height/2
+                                level = getattr(enemy, "level", 1)
+
+                                xp_value = get_xp_reward(level)
+                                player.add_xp(xp_value)
+                                xp_orbs.append(XPOrb(drop_x, drop_y, value=xp_value))
+
+                                staff_candidates = []
+                                if 1 <= level <= 10:
+                                    staff_candidates.append("나무 지팡이")
+                                if 5 <= level <= 15:
+                                    staff_candidates.append("초급 지팡이")
+                                if 10 <= level <= 20:
+                                    staff_candidates.append("중급 지팡이")
+                                if 20 <= level <= 30:
+                                    staff_candidates.append("상급 지팡이")
+                                if 25 <= level <= 40:
+                                    staff_candidates.append("마나 지팡이")
+
+                                staff_dropped = False
+                                book_dropped = False
+                                for staff in staff_candidates:
+                                    if random.random() < 1:
+                                        item_drops.append(ItemDrop(drop_x, drop_y, staff))
+                                        staff_dropped = True
+
+                                if (not staff_dropped) and random.random() < 0.1:
+                                    if 1 <= level <= 30:
+                                        pool = SLIME_SPELLBOOK_DROPS_C
+                                    elif 70 <= level <= 100:
+                                        pool = SLIME_SPELLBOOK_DROPS_S
+                                    else:
+                                        pool = None
+                                    if pool:
+                                        book_dropped = True
+                                        names = [item[0] for item in pool]
+                                        weights = [item[1] for item in pool]
+                                        item_name = random.choices(names, weights=weights, k=1)[0]
+                                        item_drops.append(ItemDrop(drop_x, drop_y, item_name))
+
+                                if (not staff_dropped) and (not book_dropped) and random.random() < 0.05:
+                                    item_drops.append(ItemDrop(drop_x, drop_y, "소리 교환권"))
+
+                                if quest_active:
+                                    quest_kill_count += 1
+                                    if quest_kill_count >= quest_kill_target:
+                                        grant_quest_reward(player)
+                                        quest_active = False
+                                        if quest_kill_target >= 200:
+                                            quest_final_complete = True
+                                        else:
+                                            quest_kill_target = next_quest_target(quest_kill_target)
+                                        quest_kill_count = 0
+
+                                respawn_delay = 300
+                                etype = enemy.enemy_type
+                                if etype in enemy_factory:
+                                    current_map.respawn_queue.append({
+                                        "timer": respawn_delay,
+                                        "x": enemy.home_x,
+                                        "y": enemy.home_y,
+                                        "type": etype,
+                                        "level": getattr(enemy, "level", 1),
+                                    })
+                                current_map.remove_enemy(enemy)
+
+                        elif isinstance(enemy, Dummy):
+                            pass
 
-                    if event.key in (pygame.K_UP, pygame.K_w):
-                        selected_weapon_index = (selected_weapon_index - 1) % len(available_weapons)
-                        continue
-                    if event.key in (pygame.K_DOWN, pygame.K_s):
-                        selected_weapon_index = (selected_weapon_index + 1) % len(available_weapons)
+                        else:
+                            if enemy.hp <= 0:
+                                drop_x = enemy.x + enemy.width / 2
+                                drop_y = enemy.y + enemy.height / 2
+
+                                respawn_delay = 300
+                                etype = getattr(enemy, "enemy_type", None)
+                                if etype in enemy_factory:
+                                    current_map.respawn_queue.append({
+                                        "timer": respawn_delay,
+                                        "x": enemy.home_x,
+                                        "y": enemy.home_y,
+                                        "type": etype,
+                                    })
+                                current_map.remove_enemy(enemy)
+
+                    for entry in current_map.respawn_queue[:]:
+                        entry["timer"] -= 1
+                        if entry["timer"] <= 0:
+                            etype = entry["type"]
+                            ex, ey = entry["x"], entry["y"]
+                            level = entry.get("level", 1)
+                            if etype in enemy_factory:
+                                new_enemy = enemy_factory[etype](ex, ey, level)
+                                current_map.add_enemy(new_enemy)
+                            current_map.respawn_queue.remove(entry)
+
+                    for chain in current_map.lightning_chains[:]:
+                        chain.update(current_map.enemy_index, current_map.damage_texts)
+                        if not chain.active:
+                            current_map.lightning_chains.remove(chain)
+
+                    current_map.damage_texts.update()
+
+            with PROFILER.section("collisions"):
+                for spell in player_spells[:]:
+                    spell.update()
+                    if not spell.active:
+                        player_spells.remove(spell)
                         continue
 
-                    if event.key in (pygame.K_RETURN, pygame.K_SPACE):
-                        if available_weapons:
-                            player.weapon = available_weapons[selected_weapon_index]
-                        show_weapon_menu = False
-                        continue
+                    if current_map:
+                        enemy = current_map.enemy_index.hit_test(spell.x, spell.y, spell.radius)
+                        if enemy is not None:
+                            player_level = getattr(player, "level", 1)
+                            same_level_slime_hp = slime_max_hp_for_level(player_level)
 
-                if pygame.K_1 <= event.key <= pygame.K_4:
-                    index = event.key - pygame.K_1
-                    if 0 <= index < len(player.equipped_spells):
-                        selected_spell_slot = index
-                        sel_spell = player.equipped_spells[index]
+                            base_ratio = getattr(spell, "damage_ratio", 0.20)
+                            weapon_mult = player.get_weapon_multiplier()
+                            damage = max(1, int(same_level_slime_hp * base_ratio * weapon_mult))
 
-                if event.key == pygame.K_SPACE and target_position:
-                    if player.equipped_spells:
-                        if 0 <= selected_spell_slot < len(player.equipped_spells):
-                            slot_index = selected_spell_slot
-                        else:
-                            slot_index = 0
-                        spell_id = player.equipped_spells[slot_index]
-                        spell = player.cast_spell(target_position, spell_type=spell_id, current_map=current_map)
-                        if spell:
-                            player_spells.append(spell)
-
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if event.button == 1 and target_position and not show_inventory and not show_skill_menu and not show_swap_menu:
-                    if player.equipped_spells:
-                        if 0 <= selected_spell_slot < len(player.equipped_spells):
-                            slot_index = selected_spell_slot
-                        else:
-                            slot_index = 0
-                        spell_id = player.equipped_spells[slot_index]
-                        spell = player.cast_spell(target_position, spell_type=spell_id, current_map=current_map)
-                        if spell:
-                            player_spells.append(spell)
-
-                if show_setting and event.button == 1:
-                    if volume_slider_rect and volume_slider_rect.collidepoint(event.pos):
-                        dragging_volume = True
-                        rel = (event.pos[0] - volume_slider_rect.x) / volume_slider_rect.width
-                        volume = max(0.0, min(1.0, rel))
-                        VOLUME = volume
-                        pygame.mixer.music.set_volume(volume)
-                        for sound in player.spell_sounds.values():
-                            sound.set_volume(volume)
+                            enemy.hp -= damage
+                            current_map.damage_texts.add(enemy.x + enemy.width/2, enemy.y, damage)
 
-                if event.button == 3 and not show_inventory:
-                    mx, my = pygame.mouse.get_pos()
-                    target_position = (mx + camera.x, my + camera.y)
+                            if spell.spell_type == "fireball":
+                                enemy.apply_burn(duration=600, total_damage=50)
 
-            elif event.type == pygame.MOUSEBUTTONUP:
-                if show_setting and event.button == 1:
-                    dragging_volume = False
+                            elif spell.spell_type == "ice_lans":
+                                enemy.apply_ice_hit()
 
-            elif event.type == pygame.MOUSEMOTION:
-                if show_setting and dragging_volume and volume_slider_rect:
-                    rel = (event.pos[0] - volume_slider_rect.x) / volume_slider_rect.width
-                    volume = max(0.0, min(1.0, rel))
-                    VOLUME = volume
-                    pygame.mixer.music.set_volume(volume)
-                    for sound in player.spell_sounds.values():
-                        sound.set_volume(volume)
-
-        keys = pygame.key.get_pressed()
-        player.move(keys, current_map.tiled_map if current_map else None)
-        player.regen_mp()
-        player.regen_hp()
-
-        camera.update(player)
-        if current_map:
-            current_map.tiled_map.clamp_camera(camera)
-
-        if auto_targeting and current_map and current_map.enemies:
-            closest_enemy = None
-            closest_dist = float('inf')
-            px = player.x + player.width / 2
-            py = player.y + player.height / 2
-            for enemy in current_map.enemies:
-                if isinstance(enemy, Slime) and enemy.dying:
-                    continue
-                if enemy.hp <= 0 and not enemy.is_dummy:
-                    continue
-                ex = enemy.x + enemy.width / 2
-                ey = enemy.y + enemy.height / 2
-                dist = math.hypot(ex - px, ey - py)
-                if dist < closest_dist:
-                    closest_dist = dist
-                    closest_enemy = enemy
-            if closest_enemy:
-                target_position = (
-                    closest_enemy.x + closest_enemy.width / 2,
-                    closest_enemy.y + closest_enemy.height / 2
-                )
-            else:
-                target_position = None
-
-        if current_map and game_maps:
-            player_rect = pygame.Rect(player.x, player.y, player.width, player.height)
-            for portal in current_map.portals:
-                if player_rect.colliderect(portal["rect"]):
-                    target_name = portal["portal_type"]
-                    if not target_name:
-                        break
-                    if target_name not in game_maps:
-                        break
-
-                    target_map = game_maps[target_name]
-
-                    target_spawn = portal.get("target_spawn", "")
-                    sx, sy = target_map.tiled_map.find_named_spawn(target_spawn)
-
-                    player.x, player.y = sx, sy
-                    map_transition_effect(f"{target_name}(으)로 이동!")
-                    current_map_name = target_name
-                    current_map = target_map
-                    update_camera_offset()
-                    player_spells.clear()
-                    enemy_projectiles.clear()
-                    target_position = None
-                    item_drops.clear()
-                    spawn_enemies_on_map(current_map)
-                    if current_map_name == "map" and not fireball_intro_done:
-                        show_fireball_intro_and_record(player)
-                        fireball_intro_done = True
-                    break
-        if current_map:
-            for enemy in current_map.enemies[:]:
-                if is_on_screen(enemy, camera, margin=180):
-                    enemy.update(player, current_map.tiled_map, enemy_projectiles, current_map.damage_texts)
-
-                if isinstance(enemy, Slime):
-                    if enemy.death_finished:
-                        drop_x = enemy.x + enemy.width/2
-                        drop_y = enemy.y + enemy.height/2
-                        level = getattr(enemy, "level", 1)
-
-                        xp_value = get_xp_reward(level)
-                        player.add_xp(xp_value)
-                        xp_orbs.append(XPOrb(drop_x, drop_y, value=xp_value))
-
-                        staff_candidates = []
-                        if 1 <= level <= 10:
-                            staff_candidates.append("나무 지팡이")
-                        if 5 <= level <= 15:
-                            staff_candidates.append("초급 지팡이")
-                        if 10 <= level <= 20:
-                            staff_candidates.append("중급 지팡이")
-                        if 20 <= level <= 30:
-                            staff_candidates.append("상급 지팡이")
-                        if 25 <= level <= 40:
-                            staff_candidates.append("마나 지팡이")
-
-                        staff_dropped = False
-                        book_dropped = False
-                        for staff in staff_candidates:
-                            if random.random() < 1:
-                                item_drops.append(ItemDrop(drop_x, drop_y, staff))
-                                staff_dropped = True
-
-                        if (not staff_dropped) and random.random() < 0.1:
-                            if 1 <= level <= 30:
-                                pool = SLIME_SPELLBOOK_DROPS_C
-                            elif 70 <= level <= 100:
-                                pool = SLIME_SPELLBOOK_DROPS_S
-                            else:
-                                pool = None
-                            if pool:
-                                book_dropped = True
-                                names = [item[0] for item in pool]
-                                weights = [item[1] for item in pool]
-                                item_name = random.choices(names, weights=weights, k=1)[0]
-                                item_drops.append(ItemDrop(drop_x, drop_y, item_name))
-
-                        if (not staff_dropped) and (not book_dropped) and random.random() < 0.05:
-                            item_drops.append(ItemDrop(drop_x, drop_y, "소리 교환권"))
-
-                        if quest_active:
-                            quest_kill_count += 1
-                            if quest_kill_count >= quest_kill_target:
-                                grant_quest_reward(player)
-                                quest_active = False
-                                if quest_kill_target >= 200:
-                                    quest_final_complete = True
-                                else:
-                                    quest_kill_target = next_quest_target(quest_kill_target)
-                                quest_kill_count = 0
-
-                        respawn_delay = 300
-                        etype = enemy.enemy_type
-                        if etype in enemy_factory:
-                            current_map.respawn_queue.append({
-                                "timer": respawn_delay,
-                                "x": enemy.home_x,
-                                "y": enemy.home_y,
-                                "type": etype,
-                                "level": getattr(enemy, "level", 1),
-                            })
-                        current_map.enemies.remove(enemy)
-
-                elif isinstance(enemy, Dummy):
-                    pass
+                            elif spell.spell_type == "lightning_bolt":
+                                chain = LightningChain(
+                                    enemy.x + enemy.width/2,
+                                    enemy.y + enemy.height/2,
+                                    damage * 0.7,
+                                    [id(enemy)],
+                                )
+                                current_map.lightning_chains.append(chain)
 
-                else:
-                    if enemy.hp <= 0:
-                        drop_x = enemy.x + enemy.width / 2
-                        drop_y = enemy.y + enemy.height / 2
-
-                        respawn_delay = 300
-                        etype = getattr(enemy, "enemy_type", None)
-                        if etype in enemy_factory:
-                            current_map.respawn_queue.append({
-                                "timer": respawn_delay,
-                                "x": enemy.home_x,
-                                "y": enemy.home_y,
-                                "type": etype,
-                            })
-                        current_map.enemies.remove(enemy)
-
-            for entry in current_map.respawn_queue[:]:
-                entry["timer"] -= 1
-                if entry["timer"] <= 0:
-                    etype = entry["type"]
-                    ex, ey = entry["x"], entry["y"]
-                    level = entry.get("level", 1)
-                    if etype in enemy_factory:
-                        new_enemy = enemy_factory[etype](ex, ey, level)
-                        current_map.enemies.append(new_enemy)
-                    current_map.respawn_queue.remove(entry)
-
-            for chain in current_map.lightning_chains[:]:
-                chain.update(current_map.enemies, current_map.damage_texts)
-                if not chain.active:
-                    current_map.lightning_chains.remove(chain)
-
-            for dmg_text in current_map.damage_texts[:]:
-                dmg_text.update()
-                if not dmg_text.active:
-                    current_map.damage_texts.remove(dmg_text)
-
-        for spell in player_spells[:]:
-            spell.update()
-            if not spell.active:
-                player_spells.remove(spell)
-                continue
+                            elif spell.spell_type == "water_blast":
+                                enemy.apply_slow(duration=300)
 
-            if current_map:
-                for enemy in current_map.enemies:
-                    if math.hypot(
-                        spell.x - (enemy.x + enemy.width/2),
-                        spell.y - (enemy.y + enemy.height/2)
-                    ) < spell.radius + enemy.width/2:
+                            spell.active = False
 
-                        player_level = getattr(player, "level", 1)
-                        same_level_slime_hp = slime_max_hp_for_level(player_level)
 
-                        base_ratio = getattr(spell, "damage_ratio", 0.20)
-                        weapon_mult = player.get_weapon_multiplier()
-                        damage = max(1, int(same_level_slime_hp * base_ratio * weapon_mult))
+                for proj in enemy_projectiles[:]:
+                    proj.update()
+                    if not proj.active:
+                        enemy_projectiles.remove(proj)
+                        continue
+                    if pygame.Rect(player.x, player.y, player.width, player.height).colliderect(
+                        pygame.Rect(proj.x - proj.radius, proj.y - proj.radius, proj.radius * 2, proj.radius * 2)
+                    ):
+                        player.hp -= proj.damage
+                        proj.active = False
+
+                if weapon_menu_requested and not show_weapon_menu:
+                    weapon_menu_requested = False
+                    show_weapon_menu = True
+                    show_skill_menu = False
+                    show_inventory = False
+                    show_setting = False
+                    available_weapons = collect_available_weapons()
+                    if player.weapon in available_weapons:
+                        selected_weapon_index = available_weapons.index(player.weapon)
+                    else:
+                        selected_weapon_index = 0
 
-                        enemy.hp -= damage
-                        current_map.damage_texts.append(
-                            DamageText(enemy.x + enemy.width/2, enemy.y, damage)
-                        )
+                for drop in item_drops[:]:
+                    if pygame.Rect(player.x, player.y, player.width, player.height).colliderect(drop.get_rect()):
+                        player.inventory[drop.item_name] = player.inventory.get(drop.item_name, 0) + 1
+                        item_drops.remove(drop)
+
+                for orb in xp_orbs[:]:
+                    orb.update(player)
+                    px = player.x + player.width / 2
+                    py = player.y + player.height / 2
+                    if math.hypot(orb.x - px, orb.y - py) < orb.radius + player.width / 3:
+                        player.add_xp(orb.value)
+                        xp_orbs.remove(orb)
+
+                if player.hp <= 0:
+                    screen.fill(BLACK)
+                    text = get_korean_font(50).render("게임 오버!", True, RED)
+                    screen.blit(text, text.get_rect(center=(WIDTH // 2, HEIGHT // 2)))
+                    pygame.display.flip()
+                    pygame.time.wait(3000)
+                    running = False
+
+            with PROFILER.section("effects"):
+                PARTICLES.update()
+                if current_map:
+                    for eff in current_map.area_effects[:]:
+                        eff.update(current_map)
+                        if not eff.active:
+                            current_map.area_effects.remove(eff)
+
+        sim_interp.apply(sim_accumulator / sim_dt, interp_objects())
 
-                        if spell.spell_type == "fireball":
-                            enemy.apply_burn(duration=600, total_damage=50)
+        screen.fill(BLACK)
 
-                        elif spell.spell_type == "ice_lans":
-                            enemy.apply_ice_hit()
+        if current_map:
+            with PROFILER.section("map"):
+                current_map.tiled_map.draw(screen, camera)
+            with PROFILER.section("sprites"):
+                for npc in current_map.quest_npcs:
+                    if is_on_screen(type("E", (), {"x": npc["x"], "y": npc["y"], "width": PLAYER_SIZE, "height": PLAYER_SIZE})(), camera, margin=150):
+                        nx, ny = camera.apply_pos(npc["x"], npc["y"])
+                        screen.blit(npc["img"], (nx, ny))
+                        if quest_final_complete:
+                            text = "축하합니다 용사님!"
+                            color = YELLOW
+                        elif quest_active:
+                            text = f"{quest_kill_count}/{quest_kill_target}"
+                            color = CYAN
+                        else:
+                            text = "!"
+                            color = ORANGE
+                        txt = render_text(text, 18, color)
+                        txt_rect = txt.get_rect(midbottom=(nx + PLAYER_SIZE // 2, ny - 8))
+                        screen.blit(txt, txt_rect)
+            with PROFILER.section("area_draw"):
+                for eff in current_map.area_effects:
+                    eff.draw(screen, camera)
+
+        with PROFILER.section("sprites"):
+            if target_position:
+                draw_target_marker(screen, camera, *target_position)
+
+            player.draw(screen, camera)
+
+            drawn = 0
+            if current_map:
+                for enemy in current_map.enemies:
+                    if is_on_screen(enemy, camera, margin=120):
+                        enemy.draw(screen, camera)
+                        drawn += 1
+            PROFILER.count("blits", drawn + 1)
 
-                        elif spell.spell_type == "lightning_bolt":
-                            chain = LightningChain(
-                                enemy.x + enemy.width/2,
-                                enemy.y + enemy.height/2,
-                                damage * 0.7,
-                                [id(enemy)],
-                            )
-                            current_map.lightning_chains.append(chain)
+        if current_map:
+            with PROFILER.section("map"):
+                current_map.tiled_map.draw_foreground(screen, camera)
 
-                        elif spell.spell_type == "water_blast":
-                            enemy.apply_slow(duration=300)
+        with PROFILER.section("sprites"):
+            if current_map:
+                for chain in current_map.lightning_chains:
+                    chain.draw(screen, camera)
+                PARTICLES.draw(screen, camera)
+                current_map.damage_texts.draw(screen, camera)
 
-                        spell.active = False
-                        break
+            for drop in item_drops:
+                drop.draw(screen, camera)
 
+            for orb in xp_orbs:
+                orb.draw(screen, camera)
 
-        for proj in enemy_projectiles[:]:
-            proj.update()
-            if not proj.active:
-                enemy_projectiles.remove(proj)
-                continue
-            if pygame.Rect(player.x, player.y, player.width, player.height).colliderect(
-                pygame.Rect(proj.x - proj.radius, proj.y - proj.radius, proj.radius * 2, proj.radius * 2)
-            ):
-                player.hp -= proj.damage
-                proj.active = False
-
-        if weapon_menu_requested and not show_weapon_menu:
-            weapon_menu_requested = False
-            show_weapon_menu = True
-            show_skill_menu = False
-            show_inventory = False
-            show_setting = False
-            available_weapons = collect_available_weapons()
-            if player.weapon in available_weapons:
-                selected_weapon_index = available_weapons.index(player.weapon)
-            else:
-                selected_weapon_index = 0
-
-        for drop in item_drops[:]:
-            if pygame.Rect(player.x, player.y, player.width, player.height).colliderect(drop.get_rect()):
-                player.inventory[drop.item_name] = player.inventory.get(drop.item_name, 0) + 1
-                item_drops.remove(drop)
-
-        for orb in xp_orbs[:]:
-            orb.update(player)
-            px = player.x + player.width / 2
-            py = player.y + player.height / 2
-            if math.hypot(orb.x - px, orb.y - py) < orb.radius + player.width / 3:
-                player.add_xp(orb.value)
-                xp_orbs.remove(orb)
-
-        if player.hp <= 0:
-            screen.fill(BLACK)
-            text = get_korean_font(50).render("게임 오버!", True, RED)
-            screen.blit(text, text.get_rect(center=(WIDTH // 2, HEIGHT // 2)))
-            pygame.display.flip()
-            pygame.time.wait(3000)
-            running = False
+            for spell in player_spells:
+                spell.draw(screen, camera)
 
-        screen.fill(BLACK)
+            for proj in enemy_projectiles:
+                proj.draw(screen, camera)
+            PROFILER.count("blits", len(item_drops) + len(xp_orbs) + len(player_spells) + len(enemy_projectiles))
 
         if current_map:
-            current_map.tiled_map.draw(screen, camera)
-            for npc in current_map.quest_npcs:
-                if is_on_screen(type("E", (), {"x": npc["x"], "y": npc["y"], "width": PLAYER_SIZE, "height": PLAYER_SIZE})(), camera, margin=150):
-                    nx, ny = camera.apply_pos(npc["x"], npc["y"])
-                    screen.blit(npc["img"], (nx, ny))
-                    indicator_font = get_korean_font(18)
-                    if quest_final_complete:
-                        text = "축하합니다 용사님!"
-                        color = YELLOW
-                    elif quest_active:
-                        text = f"{quest_kill_count}/{quest_kill_target}"
-                        color = CYAN
-                    else:
-                        text = "!"
-                        color = ORANGE
-                    txt = indicator_font.render(text, True, color)
-                    txt_rect = txt.get_rect(midbottom=(nx + PLAYER_SIZE // 2, ny - 8))
-                    screen.blit(txt, txt_rect)
-            for eff in current_map.area_effects:
-                eff.draw(screen, camera)
+            with PROFILER.section("hud"):
+                draw_ui(screen, player, current_map, target_position is not None, sim_interp.sim_pos(player))
+                draw_quest_status(screen)
 
-        if target_position:
-            draw_target_marker(screen, camera, *target_position)
+        with PROFILER.section("menus"):
+            if show_inventory:
+                draw_inventory(screen, player)
 
-        player.draw(screen, camera)
-
-        if current_map:
-            for enemy in current_map.enemies:
-                if is_on_screen(enemy, camera, margin=120):
-                    enemy.draw(screen, camera)
-            for chain in current_map.lightning_chains:
-                chain.draw(screen, camera)
-            for dmg_text in current_map.damage_texts:
-                dmg_text.draw(screen, camera)
-            for eff in current_map.area_effects[:]:
-                eff.update(current_map)
-                if not eff.active:
-                    current_map.area_effects.remove(eff)
-
-        for drop in item_drops:
-            drop.draw(screen, camera)
-
-        for orb in xp_orbs:
-            orb.draw(screen, camera)
-
-        for spell in player_spells:
-            spell.draw(screen, camera)
-
-        for proj in enemy_projectiles:
-            proj.draw(screen, camera)
-
-        if current_map:
-            draw_ui(screen, player, current_map, target_position is not None)
-            draw_quest_status(screen)
+            if show_setting:
+                volume_slider_rect = draw_setting(screen, volume)
+            else:
+                volume_slider_rect = None
+
+            if show_skill_menu:
+                draw_skill_menu(screen, player, target_position is not None, selected_spell_slot)
+            if show_weapon_menu:
+                available_weapons = collect_available_weapons()
+                if not available_weapons:
+                    available_weapons = ["맨손"]
+                draw_weapon_menu(screen, player, available_weapons, selected_weapon_index)
+
+            if show_swap_menu:
+                draw_swap_menu(
+                    screen,
+                    player,
+                    swap_phase,
+                    swap_selected_slot,
+                    swap_selected_index,
+                    swap_unequipped_spells
+                )
 
-        if show_inventory:
-            draw_inventory(screen, player)
+        if PROFILER.enabled:
+            PROFILER.gauge("enemies", len(current_map.enemies) if current_map else 0)
+            PROFILER.gauge("spells", len(player_spells) + len(enemy_projectiles))
+            PROFILER.gauge("particles", PARTICLES.count)
+            PROFILER.gauge("area_effects", len(current_map.area_effects) if current_map else 0)
+            PROFILER.draw(screen)
 
-        if show_setting:
-            volume_slider_rect = draw_setting(screen, volume)
-        else:
-            volume_slider_rect = None
-
-        if show_skill_menu:
-            draw_skill_menu(screen, player, target_position is not None, selected_spell_slot)
-        if show_weapon_menu:
-            available_weapons = collect_available_weapons()
-            if not available_weapons:
-                available_weapons = ["맨손"]
-            draw_weapon_menu(screen, player, available_weapons, selected_weapon_index)
-
-        if show_swap_menu:
-            draw_swap_menu(
-                screen,
-                player,
-                swap_phase,
-                swap_selected_slot,
-                swap_selected_index,
-                swap_unequipped_spells
-            )
+        sim_interp.restore()
+        with PROFILER.section("flip"):
+            pygame.display.flip()
+        PROFILER.end_frame()
+        if first_game_frame:
+            startup_mark("첫 게임 프레임")
+            first_game_frame = False
 
-        pygame.display.flip()
+        if bench is not None and not bench.end_frame(current_map):
+            running = False
 
-    pygame.quit()
+    if recorder is not None:
+        atexit.unregister(recorder.save)
+        recorder.save()
+    if bench is None:
+        pygame.quit()
 
 if __name__ == "__main__":
-    load_slime_frames()
-    main()
+    ensure_repo_assets()
+    startup_mark("모듈 로드 완료")
+    if "--compile-maps" in sys.argv:
+        for tmx_path in ("house.tmx", "map.tmx"):
+            if os.path.exists(tmx_path):
+                TiledMap(tmx_path, use_cache=False).compile_cache()
+        sys.exit(0)
+    if "--migrate-sounds" in sys.argv:
+        SPELL_LIBRARY.migrate_legacy()
+        SOUND_WRITER.flush(30.0)
+        sys.exit(0)
+    ENEMY_BACKEND = argv_value("--enemy-backend", ENEMY_BACKEND)
+    if ENEMY_BACKEND not in ENEMY_BACKENDS:
+        print(f"[WARN] 알 수 없는 --enemy-backend: {ENEMY_BACKEND} ({', '.join(ENEMY_BACKENDS)})")
+        sys.exit(2)
+    if "--profile" in sys.argv:
+        PROFILER.set_overlay(True)
+    if "--trace" in sys.argv:
+        PROFILER.start_trace(argv_value("--trace", TRACE_PATH))
+    replay_path = argv_value("--replay", None)
+    # 벤치마크/리플레이는 스플래시와 메뉴를 안 거치니 그 그림들은 빼고 건다
+    preload_startup_assets(with_menu=not (BENCHMARK_MODE or replay_path))
+    if BENCHMARK_MODE:
+        run_benchmark(replay_path)
+        sys.exit(0)
+    if replay_path:
+        main(replay=InputReplay(replay_path))
+    elif "--record" in sys.argv:
+        main(recorder=InputRecorder(argv_value("--record", "session.replay.gz")))
+    else:
+        main()